@@ -1,58 +1,240 @@
-from utils import analyze_sentiment
+from utils import score_reviews_async, review_hash, SentimentAggregate
 from utils import get_random_user_agent
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
-from bs4 import BeautifulSoup
+from browser_pool import BrowserPool, DEFAULT_POOL_SIZE, playwright_session, launch_browser
+from concurrency import gather_bounded, crawl_listing_pages, with_query_param, maybe_await, OrderedEmitter
+from concurrency import DEFAULT_MAX_CONCURRENCY, DEFAULT_PER_HOST_LIMIT, DEFAULT_LISTING_CONCURRENCY
+from http_fetcher import HttpFetcher, is_captcha_page
+from page_cache import get_page_cache, PageCacheMiss
+from checkpoint import open_checkpoint, DEFAULT_COMMIT_EVERY
+from sharding import run_sharded
+from incremental import ReviewWatermark, merge_new_reviews, sentiment_fields
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from parsers import get_parser
+from page_profile import PageMetrics, get_page_profile
+from metrics import span, incr, RunScope
+from rate_limiter import get_rate_limiter, retry_with_backoff, Throttled, THROTTLE_STATUSES
 import nest_asyncio
 import asyncio
-import random
+import logging
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
 nest_asyncio.apply()
 
+logger = logging.getLogger(__name__)
 
-# Asynchronous function to fetch reviews for a single product using Playwright
-async def fetch_amazon_reviews(playwright, product_name, product_link):
+# A listing page is ready once its results (or a CAPTCHA form) are on the page
+LISTING_READY_SELECTOR = 'div.s-main-slot, form[action*="validateCaptcha"]'
+# Browser loads that are retried: CAPTCHA / throttled responses and navigation timeouts
+BROWSER_RETRY_ON = (Throttled, PlaywrightTimeoutError)
+# Review pages of a product, keyed by its ASIN
+AMAZON_REVIEWS_URL = 'https://www.amazon.com/product-reviews/{asin}/?reviewerType=all_reviews&pageNumber={page}'
+# Sort order of the review pages read by incremental runs (newest first)
+NEWEST_FIRST_SORT = 'recent'
+# Formats of the date in "Reviewed in the United States on April 16, 2019" (other marketplaces put the day first)
+REVIEW_DATE_FORMATS = ('%B %d, %Y', '%b %d, %Y', '%d %B %Y')
+# Star rating of a review ("4.0 out of 5 stars"); reviews from other countries use the cmps- hook
+REVIEW_STARS_SELECTOR = 'i[data-hook="review-star-rating"], i[data-hook="cmps-review-star-rating"]'
+# Marker of the review list on a review page (its absence sends the page through the browser)
+REVIEW_LIST_MARKER = 'cm_cr-review_list'
+# Review pages read per product; 0 reads only the reviews shown on the product page
+DEFAULT_AMAZON_REVIEW_PAGES = 0
+# Checkpoint shared by the worker processes of a sharded run
+AMAZON_CHECKPOINT_PATH = "amazon_product_data_reviews.sqlite"
+
+
+# Function to convert "Reviewed in the United States on April 16, 2019" into "2019-04-16" (None if unknown)
+def parse_amazon_review_date(date_text):
+    if not date_text or ' on ' not in date_text:
+        return None
+    date_part = date_text.rsplit(' on ', 1)[1].strip()
+    for date_format in REVIEW_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_part, date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+# Function to read the number of stars out of "4.0 out of 5 stars" (None if unknown)
+def parse_amazon_review_stars(stars_text):
+    try:
+        return int(float(stars_text.split()[0]))
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+# Function to read the (review id, text, date, stars) of the reviews on a product or review page; reviews
+# without an id are keyed by a hash of their text. `details=False` leaves the date and stars out (None).
+def parse_amazon_review_records(html, parser=None, limit=0, details=True):
+    parser = parser or get_parser()
+    root = parser.parse(html, only=('div', {'data-hook': 'review'}))
+
+    # Locate and parse the reviews section from the page
+    records = []
+    for review in parser.select(root, 'div[data-hook="review"]', limit=limit):
+        review_body = parser.select_one(review, 'span[data-hook="review-body"]')
+        if review_body is not None:
+            text = parser.text(review_body, strip=True)
+            review_id = (parser.attr(review, 'id') or '').replace('customer_review-', '') or review_hash(text)
+            if not details:
+                records.append((review_id, text, None, None))
+                continue
+            review_date = parser.select_one(review, 'span[data-hook="review-date"]')
+            review_date = parse_amazon_review_date(parser.text(review_date)) if review_date is not None else None
+            stars = parser.select_one(review, REVIEW_STARS_SELECTOR)
+            stars = parse_amazon_review_stars(parser.text(stars, strip=True)) if stars is not None else None
+            records.append((review_id, text, review_date, stars))
+    return records
+
+
+# Function to read up to `limit` review texts out of a product page
+def parse_amazon_reviews(html, parser=None, limit=30):
+    return [record[1] for record in parse_amazon_review_records(html, parser, limit=limit, details=False)]
+
+
+# Function to get a page from the page cache, the HTTP fetcher (when given) or a page borrowed from the browser
+# pool. A CAPTCHA or throttled browser load is retried on a fresh page after a backoff instead of returned.
+async def fetch_amazon_page(pool, url, description, cache=None, fetcher=None, required_marker=None):
+    if fetcher is not None:
+        # The fetcher looks in its page cache first
+        html = await fetcher.fetch_html(url, required_marker=required_marker)
+    else:
+        html = cache.get(url) if cache is not None else None
+    if html is not None:
+        return html
+    if cache is not None and cache.replay:
+        raise PageCacheMiss(f"{url} is not in the page cache")
+
+    async def load_page():
+        async with pool.page() as page:
+            response = await pool.goto(page, url)
+            with span('extract', site='amazon'):
+                content = await page.content()
+        if is_captcha_page(content):
+            incr('captchas', site='amazon')
+            get_rate_limiter().record(url, captcha=True)
+            raise Throttled(f"CAPTCHA on {url}")
+        if response is not None and response.status in THROTTLE_STATUSES:
+            raise Throttled(f"HTTP {response.status}")
+        return content
+
+    html = await retry_with_backoff(load_page, retry_on=BROWSER_RETRY_ON, site='amazon', description=description)
+    if cache is not None:
+        cache.put(url, html)
+    return html
+
+
+# Asynchronous function to fetch reviews for a single product using a page borrowed from the browser pool
+# (or the page cache, when it holds a fresh copy of the product page)
+async def fetch_amazon_reviews(pool, product_name, product_link, cache=None):
     if product_link == 'No Link':
-        print(f"Skipping product without a valid link: {product_name}")
+        logger.warning("Skipping product without a valid link: %s", product_name)
         return []
 
-    browser = await playwright.chromium.launch(headless=True)
-    page = await browser.new_page(user_agent=get_random_user_agent())
-    print(f"Fetching reviews for: {product_name}")
+    logger.debug("Fetching reviews for: %s", product_name)
+    content = await fetch_amazon_page(pool, product_link, f"Product page of {product_name}", cache=cache)
+    with span('parse', site='amazon'):
+        reviews = parse_amazon_reviews(content, limit=30)  # Limit to 30 reviews
+    return reviews if reviews else ['No Reviews']
+
+
+# Asynchronous function to read the (review id, text, date, stars) of the reviews on one review page of a product
+async def fetch_amazon_review_page(pool, asin, page_number, cache=None, fetcher=None, newest_first=False):
+    url = AMAZON_REVIEWS_URL.format(asin=asin, page=page_number)
+    if newest_first:
+        url = with_query_param(url, 'sortBy', NEWEST_FIRST_SORT)
+    html = await fetch_amazon_page(pool, url, f"Review page {page_number} of {asin}", cache=cache, fetcher=fetcher,
+                                   required_marker=REVIEW_LIST_MARKER)
+    with span('parse', site='amazon'):
+        return parse_amazon_review_records(html)
+
+
+# Asynchronous function to fetch the first `num_review_pages` review pages of a product (keyed by ASIN) at once,
+# scoring each page as soon as it arrives. A page that fails is logged and left out; the product only fails when
+# every page did. Once all pages are in, reviews seen on an earlier page are dropped by review id. Returns
+# (reviews in page order, SentimentAggregate of the reviews, watermark of the reviews), or None when the pages
+# held no reviews.
+async def fetch_and_score_amazon_review_pages(pool, asin, num_review_pages, cache=None, fetcher=None):
+    async def fetch_and_score_page(page_number):
+        records = await fetch_amazon_review_page(pool, asin, page_number, cache=cache, fetcher=fetcher)
+        if not records:
+            return records, []
+        # Score this page while the others are still loading
+        with span('score', site='amazon'):
+            return records, await score_reviews_async([text for _, text, _, _ in records])
 
-    await page.goto(product_link)
-    content = await page.content()
-    soup = BeautifulSoup(content, 'html.parser')
+    pages = await asyncio.gather(*(fetch_and_score_page(page_number)
+                                   for page_number in range(1, num_review_pages + 1)), return_exceptions=True)
+    failures = [page for page in pages if isinstance(page, BaseException)]
+    for page_number, page in enumerate(pages, 1):
+        if isinstance(page, BaseException):
+            logger.warning("Review page %s of %s failed, keeping the other pages: %s", page_number, asin,
+                           page or type(page).__name__)
+    if failures and len(failures) == len(pages):
+        raise failures[0]
 
-    # Locate and parse the reviews section from the product page
+    seen = {}
     reviews = []
-    for review in soup.find_all('div', {'data-hook': 'review'}, limit=30):  # Limit to 30 reviews
-        review_text = review.find('span', {'data-hook': 'review-body'}).get_text(strip=True)
-        reviews.append(review_text)
+    scores = []
+    stars = []
+    for page in pages:
+        if isinstance(page, BaseException):
+            continue
+        for (review_id, text, review_date, review_stars), score in zip(*page):
+            if review_id in seen:
+                continue
+            seen[review_id] = review_date
+            reviews.append(text)
+            scores.append(score)
+            stars.append(review_stars)
 
-    await browser.close()
-    return reviews if reviews else ['No Reviews']
+    if not reviews:
+        return None
+    return reviews, SentimentAggregate().add_many(scores, stars), ReviewWatermark.of_reviews(seen.items())
+
+
+# Asynchronous function to read the reviews of a product posted since `watermark`: review pages are read newest
+# first, one at a time, until the first review the watermark has seen (or `num_review_pages` pages).
+# Returns the (review id, text, date, stars) of the new reviews, newest first.
+async def fetch_new_amazon_reviews(pool, asin, num_review_pages, watermark, cache=None, fetcher=None):
+    new_records = {}
+    for page_number in range(1, num_review_pages + 1):
+        records = await fetch_amazon_review_page(pool, asin, page_number, cache=cache, fetcher=fetcher,
+                                                 newest_first=True)
+        if not records:
+            break
+        for record in records:
+            review_id, _, review_date, _ = record
+            if watermark.is_seen(review_id, review_date):
+                return list(new_records.values())
+            # A review that moved to the next page while we read is kept once
+            new_records.setdefault(review_id, record)
+    return list(new_records.values())
 
-# Function to parse the HTML and extract product details
-def parse_product_details(html):
-    soup = BeautifulSoup(html, 'html.parser')
+# Function to parse the HTML and extract product details; only the search result subtrees are built
+def parse_product_details(html, parser=None):
+    parser = parser or get_parser()
+    root = parser.parse(html, only=('div', {'data-component-type': 's-search-result'}))
     products = []
 
-    for product in soup.find_all('div', {'data-component-type': 's-search-result'}):
+    for product in parser.select(root, 'div[data-component-type="s-search-result"]'):
         # Product Name
-        product_name = product.h2.text.strip() if product.h2 else "No Product Name"
-        data_asin = product.get('data-asin')
+        title = parser.select_one(product, 'h2')
+        product_name = parser.text(title).strip() if title is not None else "No Product Name"
+        data_asin = parser.attr(product, 'data-asin')
 
         # Price (whole and fractional)
-        price_whole = product.find('span', {'class': 'a-price-whole'})
-        price_fraction = product.find('span', {'class': 'a-price-fraction'})
-        price = f"${price_whole.text.strip()}{price_fraction.text.strip()}" if price_whole and price_fraction else "No Price"
+        price_whole = parser.select_one(product, 'span.a-price-whole')
+        price_fraction = parser.select_one(product, 'span.a-price-fraction')
+        price = f"${parser.text(price_whole).strip()}{parser.text(price_fraction).strip()}" if price_whole is not None and price_fraction is not None else "No Price"
 
         # Rating
-        rating = product.find('span', {'class': 'a-icon-alt'})
-        rating = rating.text.strip() if rating else "No Rating"
+        rating = parser.select_one(product, 'span.a-icon-alt')
+        rating = parser.text(rating).strip() if rating is not None else "No Rating"
 
         # Product Link
-        product_link = product.find('a', {'class': 'a-link-normal s-no-outline'}, href=True)
-        product_link = 'https://www.amazon.com' + product_link['href'] if product_link else 'No Link'
+        product_link = parser.select_one(product, 'a[class="a-link-normal s-no-outline"][href]')
+        product_link = 'https://www.amazon.com' + parser.attr(product_link, 'href') if product_link is not None else 'No Link'
 
         # Append parsed product details
         products.append({
@@ -65,87 +247,264 @@ def parse_product_details(html):
 
     return products if products else None  # Return None if no products found
 
-# Asynchronous function to scrape product links and their reviews using Playwright
-async def scrape_amazon_reviews(url, total_pages=1):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=False)
-        page = await browser.new_page(user_agent=get_random_user_agent())
+# Function to build the URLs of `total_pages` search result pages from the `page=` query parameter,
+# starting at the page `url` points to
+def amazon_listing_urls(url, total_pages):
+    first_page = parse_qs(urlsplit(url).query).get('page', ['1'])[0]
+    first_page = int(first_page) if first_page.isdigit() else 1
+    return [url] + [with_query_param(url, 'page', first_page + offset) for offset in range(1, total_pages)]
 
-        all_products = []
-        current_page = 1
-        try:
-            await page.goto(url)
-            while current_page <= total_pages:
-                print(f"Scraping page: {current_page}")
+# Asynchronous function to scrape the product list of a search. Listing pages are fetched concurrently (up to
+# `listing_concurrency`), using plain HTTP and Playwright only when the HTTP response is a CAPTCHA or needs JavaScript.
+async def scrape_amazon_listing(url, total_pages=1, use_http=True, page_profile=None, page_cache=None,
+                                listing_concurrency=DEFAULT_LISTING_CONCURRENCY):
+    page_profile = page_profile or get_page_profile()
+    page_cache = page_cache or get_page_cache()
+    async with playwright_session() as playwright, HttpFetcher(enabled=use_http, cache=page_cache) as fetcher:
+        browser = None
+        owns_browser = False
+        launch_lock = asyncio.Lock()
+        listing_metrics = PageMetrics()
+
+        # Launch a visible browser once the HTTP fast path has failed (never the headless warm one); pages share it
+        async def get_browser():
+            nonlocal browser, owns_browser
+            async with launch_lock:
+                if browser is None:
+                    browser, owns_browser = await launch_browser(playwright, headless=False, site='amazon')
+            return browser
 
+        async def load_listing_page(page_number, page_url):
+            page = await page_profile.new_page(await get_browser(), listing_metrics, user_agent=get_random_user_agent())
+            try:
+                await page_profile.goto(page, page_url, listing_metrics)
                 # Wait for the product listings to load
-                try:
-                    await page.wait_for_selector('div.s-main-slot', timeout=15000)
-                except PlaywrightTimeoutError:
-                    print("Timeout while waiting for product listings to load.")
-                    break
+                with span('wait', site='amazon'):
+                    await page.wait_for_selector(LISTING_READY_SELECTOR, timeout=15000)
+                with span('extract', site='amazon'):
+                    listing_html = await page.content()
+            finally:
+                await page.close()
+            if is_captcha_page(listing_html):
+                incr('captchas', site='amazon')
+                get_rate_limiter().record(page_url, captcha=True)
+                raise Throttled(f"CAPTCHA on listing page {page_number}")
+            return listing_html
 
-                # Check for CAPTCHA
-                if "Enter the characters you see below" in await page.content():
-                    print("Encountered CAPTCHA. Exiting.")
-                    break
+        async def fetch_listing_page(page_number, page_url):
+            logger.info("Scraping page: %s", page_number)
+            html = await fetcher.fetch_html(page_url, required_marker='s-main-slot')
+            if html is None and page_cache is not None and page_cache.replay:
+                logger.info("Page %s is not in the page cache, stopping the replay here.", page_number)
+                return []
+            if html is None:
+                # CAPTCHAs and timeouts are retried with backoff (the host is slowed down meanwhile)
+                html = await retry_with_backoff(lambda: load_listing_page(page_number, page_url),
+                                                retry_on=BROWSER_RETRY_ON, site='amazon',
+                                                description=f"Listing page {page_number}")
+                if page_cache is not None:
+                    page_cache.put(page_url, html)
 
-                html = await page.content()
+            with span('parse', site='amazon'):
                 product_details = parse_product_details(html)
+            if not product_details:
+                logger.info("No products found on page %s", page_number)
+            return product_details or []
+
+        # All listing pages are fetched at once; the first empty page ends the listing
+        try:
+            all_products = await crawl_listing_pages(amazon_listing_urls(url, total_pages), fetch_listing_page,
+                                                     key_of=lambda product: product.get('ASIN'),
+                                                     max_concurrency=listing_concurrency)
+        finally:
+            if browser is not None:
+                if owns_browser:
+                    await browser.close()
+                logger.info("Listing pages (%s profile): %s", page_profile.name, listing_metrics.summary())
+        logger.info("Found %s products on %s listing page(s).", len(all_products), total_pages)
+    return all_products
+
 
-                if product_details:
-                    all_products.extend(product_details)
+# Asynchronous function to fetch and score the reviews of a product list.
+# With `on_product`, every finished product is passed to it as soon as it completes (in completion order, or in
+# listing order with `ordered`) and nothing is returned, so memory stays bounded by the products in flight (and,
+# with `ordered`, those finished behind a slower one).
+# With `review_pages`, reviews come from that many review pages per product (by ASIN) instead of the product page.
+# `commit_every` is the number of products per checkpoint commit (1 when several processes share the checkpoint).
+# With `incremental` (and `review_pages`), products already in the checkpoint are not skipped: their review pages
+# are read newest first down to the newest review stored for them, and only the new reviews are scored and added
+# to the stored aggregate. Incremental runs use AMAZON_CHECKPOINT_PATH unless `checkpoint_path` is given.
+async def scrape_amazon_product_reviews(products, pool_size=DEFAULT_POOL_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                                        per_host_limit=DEFAULT_PER_HOST_LIMIT, use_http=True, checkpoint_path=None,
+                                        progress=None, on_product=None, page_profile=None, page_cache=None,
+                                        review_pages=DEFAULT_AMAZON_REVIEW_PAGES, commit_every=DEFAULT_COMMIT_EVERY,
+                                        incremental=False, ordered=False):
+    page_profile = page_profile or get_page_profile()
+    page_cache = page_cache or get_page_cache()
+    incremental = incremental and bool(review_pages)
+    if incremental:
+        checkpoint_path = checkpoint_path or AMAZON_CHECKPOINT_PATH
+    async with RunScope('amazon'), playwright_session() as playwright, \
+            HttpFetcher(enabled=use_http, cache=page_cache) as fetcher:
+        # Products already scored by an earlier run are restored from the checkpoint instead of re-fetched
+        checkpoint = open_checkpoint(checkpoint_path, commit_every=commit_every) if checkpoint_path else None
+        replay = page_cache is not None and page_cache.replay
+
+        # Optional progress callback, called as progress(products_done, products_total)
+        products_done = [0]
+
+        def report_progress():
+            products_done[0] += 1
+            if progress is not None:
+                progress(products_done[0], len(products))
+
+        # Now fetch the reviews of all products concurrently; the pool size also caps open pages
+        async with BrowserPool(playwright, size=pool_size, profile=page_profile) as pool:
+            async def update_product_reviews(product, stored, watermark):
+                asin = product['ASIN']
+                try:
+                    records = await fetch_new_amazon_reviews(pool, asin, review_pages, watermark,
+                                                             cache=page_cache, fetcher=fetcher)
+                except Exception as e:
+                    logger.warning("Failed to fetch new reviews for %s: %s", product['Product Name'], e)
+                    return dict(product, **stored)
+                # Only the reviews posted since the last run are scored
+                new_aggregate = SentimentAggregate()
+                reviews = [text for _, text, _, _ in records]
+                if reviews:
+                    with span('score', site='amazon'):
+                        new_aggregate.add_many(await score_reviews_async(reviews), [stars for *_, stars in records])
+                    incr('reviews', len(reviews), site='amazon')
+                logger.debug("%s new reviews for %s", len(reviews), product['Product Name'])
+                result = merge_new_reviews(stored, product, watermark, {'Reviews': reviews},
+                                           [review_id for review_id, _, _, _ in records],
+                                           [review_date for _, _, review_date, _ in records], new_aggregate)
+                with span('persist', site='amazon'):
+                    checkpoint.save(asin, result)
+                return result
+
+            emitter = OrderedEmitter(on_product) if on_product is not None and ordered else None
+
+            async def fetch_product_reviews(entry):
+                index, product = entry
+                asin = product.get('ASIN')
+                # Replay mode re-parses and re-scores every product from the cached pages instead of resuming
+                stored = checkpoint.get(asin) if checkpoint is not None and asin and checkpoint.is_processed(asin) \
+                    and not replay else None
+                # Products stored without a watermark (by an older version) are fetched in full once more
+                watermark = ReviewWatermark.from_record(stored) if incremental else None
+                if watermark is not None:
+                    result = await update_product_reviews(product, stored, watermark)
+                elif stored is not None and not incremental:
+                    logger.info("Skipping product %s as reviews are already fetched.", product['Product Name'])
+                    result = dict(product, **stored)
                 else:
-                    print(f"No products found on page {current_page}")
-                    break  # Exit the loop if no products are found
-
-                if current_page < total_pages:
-                    # Try to find the 'Next' button using various selectors
-                    next_page_button = await page.query_selector("//a[contains(@aria-label, 'Next')]")
-                    if not next_page_button:
-                        next_page_button = await page.query_selector("li.a-last a")
-                    if not next_page_button:
-                        next_page_button = await page.query_selector("a.s-pagination-next")
-
-                    if next_page_button:
-                        next_page_url = await next_page_button.get_attribute('href')
-                        if next_page_url:
-                            next_page_url = 'https://www.amazon.com' + next_page_url
-                            print(f"Navigating to next page: {next_page_url}")
-                            await asyncio.sleep(random.uniform(2, 5))  # Random delay
-                            await page.goto(next_page_url)
-                            current_page += 1
-                        else:
-                            print("No 'href' found for 'Next' button, ending pagination.")
-                            break
+                    scored = None
+                    try:
+                        # Review pages are scored while they arrive; without an ASIN or any review on them, the
+                        # reviews on the product page are used instead
+                        if review_pages and asin:
+                            scored = await fetch_and_score_amazon_review_pages(pool, asin, review_pages,
+                                                                               cache=page_cache, fetcher=fetcher)
+                        if scored is None:
+                            reviews = await fetch_amazon_reviews(pool, product['Product Name'],
+                                                                 product['Product Link'], cache=page_cache)
+                        fetched = True
+                    except Exception as e:
+                        logger.warning("Failed to fetch reviews for %s: %s", product['Product Name'], e)
+                        reviews = []
+                        fetched = False
+
+                    watermark = None
+                    if scored is not None:
+                        reviews, aggregate, watermark = scored
                     else:
-                        print("No 'Next' button found, ending pagination.")
-                        break  # No more pages, exit the loop
-                else:
-                    print("Desired number of pages scraped.")
-                    break
+                        # Perform sentiment analysis
+                        with span('score', site='amazon'):
+                            aggregate = SentimentAggregate().add_many(await score_reviews_async(reviews))
+                    result = dict(product)
+                    result.update(sentiment_fields(aggregate))
+                    result['Reviews'] = reviews
+                    if watermark is not None:
+                        # Where the next incremental run stops reading
+                        result.update(watermark.fields())
+                    if fetched and reviews != ['No Reviews']:
+                        incr('reviews', len(reviews), site='amazon')
+                    if checkpoint is not None and asin and fetched:
+                        with span('persist', site='amazon'):
+                            checkpoint.save(asin, result)
 
-        except Exception as e:
-            print(f"An error occurred: {e}")
-        finally:
-            await browser.close()
+                incr('products', site='amazon')
+                report_progress()
+                # When streaming, hand the finished product over instead of keeping it until the end
+                if emitter is not None:
+                    await emitter.emit(index, result)
+                    return None
+                if on_product is not None:
+                    await maybe_await(on_product, result)
+                    return None
+                return result
+
+            try:
+                all_reviews = await gather_bounded(list(enumerate(products)), fetch_product_reviews,
+                                                   max_concurrency=max_concurrency, per_host_limit=per_host_limit,
+                                                   url_of=lambda entry: entry[1]['Product Link'])
+            finally:
+                if checkpoint is not None:
+                    checkpoint.close()
+                if page_cache is not None:
+                    logger.info("Page cache: %s", page_cache.stats())
+                logger.info("Rate limits: %s", get_rate_limiter().stats())
 
-        # Now process the products and get reviews, as before
-        all_reviews = []
-        for product in all_products:
-            reviews = await fetch_amazon_reviews(playwright, product['Product Name'], product['Product Link'])
+        return all_reviews if on_product is None else None
 
-            # Perform sentiment analysis
-            sentiment, score = analyze_sentiment(reviews)
-            product['Summary Sentiment'] = sentiment
-            product['Sentiment Score'] = score
-            product['Reviews'] = reviews
-            all_reviews.append(product)
 
-        return all_reviews
+# Asynchronous function to scrape product links and their reviews (see scrape_amazon_listing and
+# scrape_amazon_product_reviews). With `shards` > 1 the products are split by ASIN across that many worker
+# processes that share a checkpoint (`checkpoint_path`, AMAZON_CHECKPOINT_PATH by default); products are then
+# returned, or passed to `on_product`, in listing order. `incremental` and `ordered` are passed on to the review
+# stage.
+async def scrape_amazon_reviews(url, total_pages=1, pool_size=DEFAULT_POOL_SIZE,
+                                max_concurrency=DEFAULT_MAX_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                                use_http=True, checkpoint_path=None, progress=None, on_product=None, page_profile=None,
+                                page_cache=None, review_pages=DEFAULT_AMAZON_REVIEW_PAGES,
+                                listing_concurrency=DEFAULT_LISTING_CONCURRENCY, shards=1, incremental=False,
+                                ordered=False):
+    page_profile = page_profile or get_page_profile()
+    page_cache = page_cache or get_page_cache()
+    # One run summary for both stages
+    with RunScope('amazon'):
+        all_products = await scrape_amazon_listing(url, total_pages, use_http=use_http, page_profile=page_profile,
+                                                   page_cache=page_cache, listing_concurrency=listing_concurrency)
+        if shards > 1:
+            checkpoint_path = checkpoint_path or AMAZON_CHECKPOINT_PATH
+            # Create the shared checkpoint once, before the workers open it
+            open_checkpoint(checkpoint_path).close()
+            options = dict(pool_size=pool_size, max_concurrency=max_concurrency, per_host_limit=per_host_limit,
+                           use_http=use_http, checkpoint_path=checkpoint_path,
+                           review_pages=review_pages, incremental=incremental)
+            return await run_sharded('amazon', all_products, shards, options, page_profile=page_profile,
+                                     page_cache=page_cache, progress=progress, on_product=on_product)
+        return await scrape_amazon_product_reviews(all_products, pool_size=pool_size, max_concurrency=max_concurrency,
+                                                   per_host_limit=per_host_limit, use_http=use_http,
+                                                   checkpoint_path=checkpoint_path, progress=progress,
+                                                   on_product=on_product, page_profile=page_profile,
+                                                   page_cache=page_cache, review_pages=review_pages,
+                                                   incremental=incremental, ordered=ordered)
 
 # Function to run asyncio in a synchronous environment and scrape Amazon reviews
-def scrape_amazon_products_reviews(base_url, total_pages=1):
+def scrape_amazon_products_reviews(base_url, total_pages=1, pool_size=DEFAULT_POOL_SIZE,
+                                   max_concurrency=DEFAULT_MAX_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                                   use_http=True, checkpoint_path=None, page_profile=None, page_cache=None,
+                                   review_pages=DEFAULT_AMAZON_REVIEW_PAGES, shards=1):
     loop = asyncio.get_event_loop()
-    reviews = loop.run_until_complete(scrape_amazon_reviews(base_url, total_pages))
+    reviews = loop.run_until_complete(scrape_amazon_reviews(base_url, total_pages, pool_size=pool_size,
+                                                            max_concurrency=max_concurrency,
+                                                            per_host_limit=per_host_limit,
+                                                            use_http=use_http,
+                                                            checkpoint_path=checkpoint_path,
+                                                            page_profile=page_profile,
+                                                            page_cache=page_cache,
+                                                            review_pages=review_pages,
+                                                            shards=shards))
     return reviews
\ No newline at end of file
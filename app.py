@@ -1,52 +1,192 @@
-import asyncio
-from flask import Flask, render_template, request, send_file
-import pandas as pd
-import nest_asyncio
-from iherb import scrape_iherb_product_reviews_main
-from amazon import scrape_amazon_products_reviews
+# Start-up timing begins before anything else is imported (see startup.StartupReport)
+import time
+APP_STARTED = time.perf_counter()
 
-# Apply nested asyncio loop patch
-nest_asyncio.apply()
+from flask import Flask, Response, render_template, request, send_file, jsonify, url_for, g
+from jobs import JobManager, JobQueueFull, DONE, FAILED, END_OF_STREAM
+from export import RowWriter, EXPORT_COLUMNS, EXPORT_FORMATS
+from metrics import REGISTRY, observe
+from startup import get_startup_report, WARM_START_ENABLED
+import multiprocessing
+import logging
+import atexit
+import json
+import os
+
+# Log level for the scrapers and the app (DEBUG, INFO, WARNING, ...); messages below it are never formatted
+logging.basicConfig(level=os.environ.get('REVIEWPAL_LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
 
 # Initialize Flask app
 app = Flask(__name__)
 
+# Background scrape jobs, run on their own long-lived event loop
+job_manager = JobManager()
+atexit.register(job_manager.shutdown)
+
+# Import time, warm-up phases and first request/job latency of this process
+startup_report = get_startup_report(APP_STARTED)
+
+
+# Function to read the URL and number of pages from a form or JSON request
+def read_scrape_request():
+    data = request.get_json(silent=True) or request.form
+    url = data['url']
+    pages = int(data.get('reviewCount', data.get('pages', 1)))  # Default is 1 page, or you can specify how many in the form
+    return url, pages
+
+
+# Function to read the result file format (csv, ndjson or parquet) from the query string or the request body
+def read_export_format():
+    data = request.get_json(silent=True) or request.form
+    return request.args.get('format') or data.get('format') or 'csv'
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+# Time every request by endpoint (streamed responses are timed up to their first byte)
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        seconds = time.perf_counter() - started
+        observe('request', seconds, endpoint=request.endpoint or 'unknown', status=response.status_code)
+        startup_report.record_request(request.endpoint or 'unknown', response.status_code, seconds)
+    return response
+
 
 # HTML Form to input the number of pages to scrape
 @app.route('/')
 def index():
     return render_template('index.html')
 
-# Handling the scraping request and how many pages to scrape
+# Handling the scraping request and how many pages to scrape; waits for the background job and sends the result
+# file (CSV unless another `format` is asked for)
 @app.route('/scrape', methods=['POST'])
 def scrape():
-    url = request.form['url']
-    pages = int(request.form.get('reviewCount', 1))  # Default is 1 page, or you can specify how many in the form
+    try:
+        url, pages = read_scrape_request()
+    except (KeyError, ValueError):
+        return "Expected 'url' and an integer 'pages' (or 'reviewCount').", 400
+
+    try:
+        job, _ = job_manager.submit(url, pages, export_format=read_export_format())
+    except ValueError as e:
+        return str(e), 400
+    except JobQueueFull as e:
+        return str(e), 429
+
+    job_manager.wait(job)
+    if job.status != DONE:
+        return f"Scraping failed: {job.error}", 500
+    return send_file(job.result_path, as_attachment=True, mimetype=job.mimetype, download_name=job.download_name)
+
+# Stream the results as CSV or NDJSON rows while the scrape is running (?format=csv|ndjson).
+# Rows arrive in the order products finish; the first one is sent as soon as the first product is done.
+@app.route('/scrape/stream', methods=['POST'])
+def scrape_stream():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(error=f"Unknown format '{export_format}', expected one of {EXPORT_FORMATS}."), 400
+    try:
+        url, pages = read_scrape_request()
+        job, subscriber = job_manager.submit(url, pages, stream=True)
+    except (KeyError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    except JobQueueFull as e:
+        return jsonify(error=str(e)), 429
+
+    writer = RowWriter(EXPORT_COLUMNS[job.site], export_format)
+
+    def generate():
+        try:
+            yield writer.header()
+            while True:
+                product = subscriber.get()
+                if product is END_OF_STREAM:
+                    break
+                yield writer.row(product)
+            if job.status == FAILED and export_format == 'ndjson':
+                yield json.dumps({'error': job.error}) + '\n'
+        finally:
+            job_manager.unsubscribe(job, subscriber)
+
+    download_name = os.path.splitext(job.download_name)[0] + '.' + export_format
+    return Response(generate(), mimetype=writer.mimetype, headers={
+        'Content-Disposition': f'attachment; filename={download_name}',
+        'X-Job-Id': job.id,
+    })
+
+# Queue a scrape and return its job id right away; `format` picks the result file format (csv, ndjson, parquet)
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    try:
+        url, pages = read_scrape_request()
+    except (KeyError, ValueError):
+        return jsonify(error="Expected 'url' and an integer 'pages' (or 'reviewCount')."), 400
+
+    try:
+        job, coalesced = job_manager.submit(url, pages, export_format=read_export_format())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except JobQueueFull as e:
+        return jsonify(error=str(e)), 429
+
+    response = jsonify(dict(job.to_dict(), coalesced=coalesced))
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response
+
+# Progress of a job
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job id."), 404
+    return jsonify(job.to_dict())
+
+# Download the result file of a finished job
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job id."), 404
+    if job.status == FAILED:
+        return jsonify(job.to_dict()), 500
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 409
+    return send_file(job.result_path, as_attachment=True, mimetype=job.mimetype, download_name=job.download_name)
+
+# Prometheus scrape target: stage timing histograms and page/product/review/CAPTCHA/retry counters
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.prometheus(), mimetype='text/plain; version=0.0.4')
+
 
-    if 'amazon.com' in url:
-        reviews = scrape_amazon_products_reviews(url, total_pages=pages)
+# The same metrics as a JSON summary
+@app.route('/metrics/summary', methods=['GET'])
+def metrics_summary():
+    return jsonify(REGISTRY.summary())
 
-        # Save the results to a CSV file
-        df = pd.DataFrame(reviews)
 
-        # Reorder columns to move Product Link after Product Name
-        df = df[['Product Name', 'Product Link', 'Price', 'Rating', 'ASIN','Summary Sentiment', 'Sentiment Score', 'Reviews']]
+# Start-up report: app import time, warm-up phases, and latency of the first request and the first scrape job
+@app.route('/startup', methods=['GET'])
+def startup_status():
+    return jsonify(startup_report.to_dict())
 
-        output_file = 'amazon_products_with_sentiment.csv'
-        df.to_csv(output_file, index=False)
-        return send_file(output_file, as_attachment=True, mimetype='text/csv')
-    elif 'iherb.com' in url:
-        # XPath for iHerb product listings
-        xpath_query = '//*[@id="FilteredProducts"]/div[1]/div[2]/div[2]'
-        num_review_pages = 3  # Number of review pages to scrape per product
-        num_pages = pages  # Number of pages to scrape
 
-        df = asyncio.run(scrape_iherb_product_reviews_main(url, xpath_query, num_pages=num_pages, num_review_pages=num_review_pages))
-        df.to_csv('iherb_products_with_sentiment1.csv', index=False)
-        return send_file('iherb_products_with_sentiment1.csv', as_attachment=True, mimetype='text/csv')
+startup_report.mark_app_ready()
+# Warm up the scrapers, the sentiment workers and a browser in the background as soon as the app is imported
+# (under `python app.py`, only in the reloader's child process that serves requests). Worker processes spawned by
+# the app (shards, sentiment scoring) re-import it as `__mp_main__` before multiprocessing.parent_process() is set,
+# but already under their own process name, and never warm up.
+if (WARM_START_ENABLED and multiprocessing.current_process().name == 'MainProcess'
+        and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true')):
+    job_manager.warm_up()
 
-    else:
-        return "Invalid URL, please provide a valid Amazon or iHerb URL."
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,91 @@
+# Regression check and benchmark of utils.clean_text against the original re.sub-chain implementation.
+# Builds a deterministic corpus full of the markup clean_text deals with, fails if any output differs
+# byte-for-byte from the original, then reports reviews/sec for both.
+#
+#   python benchmarks/bench_clean_text.py [--reviews 50000]
+import argparse
+import html
+import os
+import random
+import re
+import string
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import clean_text, clean_texts  # noqa: E402
+
+# Fragments that exercise every step of the normalizer, including overlapping and nested cases
+FRAGMENTS = [
+    "great", "taste", "would buy again", "not", "worth it", " ", "  ", "\t", "\n", "\r\n", " ", " ", "\x1c",
+    "<br>", "<br/>", "<b>", "</b>", "<a href='x'>", "<", ">", "<<", ">>", "[[", "]]", "[[VIDEOID:abc]]", "[", "]",
+    "\\/", "\\", "/", "http://example.com/x", "https://a.b/c?d=e", "www.iherb.com", "http", "www", "ww", "htt",
+    "\\u2019", "\\u201c", "\\u201d", "\\u2013", "\\u200d", "\\u20", "\\u", "u2019", "’", "“",
+    "!!", "!!!", "??", "...", "..", ",,", "--", "**", "''", '""', "!?", "?!", "&amp;", "&lt;", "&gt;", "&quot;",
+    "&#39;", "&#x27;", "&nbsp;", "&", "&amp;amp;", "&amp;&amp;", ";;", "café", "\U0001F600", "5/5",
+]
+
+
+# Function to build the deterministic regression corpus
+def build_corpus(num_reviews, seed=7):
+    rng = random.Random(seed)
+    corpus = [rng.choice(FRAGMENTS) for _ in range(200)] + [""]
+    for _ in range(num_reviews):
+        corpus.append(''.join(rng.choice(FRAGMENTS) + (' ' if rng.random() < 0.5 else '')
+                              for _ in range(rng.randint(1, 60))))
+    return corpus
+
+
+# The clean_text implementation this module replaced, kept as the reference output
+def legacy_clean_text(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = text.strip()
+    text = re.sub(r'<.*?>', '', text)
+    text = re.sub(r'\[\[.*?\]\]', '', text)
+    text = text.replace('\\/', '/')
+    text = re.sub(r'http\S+|www\S+', '', text)
+    text = re.sub(r'\\u2019', "'", text)
+    text = re.sub(r'\\u201c', '"', text)
+    text = re.sub(r'\\u201d', '"', text)
+    text = re.sub(r"\\u2013", "-", text)
+    text = re.sub(r'\\u200d', '', text)
+    pattern = rf'([{re.escape(string.punctuation)}])\1+'
+    text = re.sub(pattern, r'\1', text)
+    text = html.unescape(text)
+    return text
+
+
+def timed(function, corpus):
+    start = time.perf_counter()
+    function(corpus)
+    return len(corpus) / (time.perf_counter() - start)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Check and benchmark utils.clean_text')
+    arg_parser.add_argument('--reviews', type=int, default=50000)
+    args = arg_parser.parse_args()
+
+    corpus = build_corpus(args.reviews)
+    expected = [legacy_clean_text(review) for review in corpus]
+    actual = clean_texts(corpus)
+    mismatches = [(review, want, got) for review, want, got in zip(corpus, expected, actual) if want != got]
+    if mismatches:
+        for review, want, got in mismatches[:10]:
+            print(f"MISMATCH for {review!r}:\n  expected {want!r}\n  got      {got!r}")
+        sys.exit(f"{len(mismatches)} of {len(corpus)} reviews differ from the original clean_text")
+    print(f"{len(corpus)} reviews: output identical to the original clean_text")
+
+    legacy_rate = timed(lambda reviews: [legacy_clean_text(review) for review in reviews], corpus)
+    rate = timed(lambda reviews: [clean_text(review) for review in reviews], corpus)
+    batch_rate = timed(clean_texts, corpus)
+    print(f"{'implementation':<22} {'reviews/sec':>12}")
+    print(f"{'original':<22} {legacy_rate:>12.0f}")
+    print(f"{'clean_text':<22} {rate:>12.0f}")
+    print(f"{'clean_texts (batch)':<22} {batch_rate:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
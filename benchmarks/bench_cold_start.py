@@ -0,0 +1,93 @@
+# Cold-start benchmark of the app: what a freshly started instance pays before it can serve its first scrape.
+# Every measurement runs in a new interpreter, so nothing is cached between runs (except by the OS).
+#   - import: `import app` as it is now (heavy dependencies imported on first use)
+#   - eager import: `import app` plus everything it used to import up front (scrapers, pandas, Playwright, pyarrow)
+#   - warm-up: the phases of the boot-time warm-up (scraper imports, sentiment workers, Playwright driver, browser)
+#   - first request: latency of the first request served, before and after the warm-up
+#
+#   python benchmarks/bench_cold_start.py [--runs 5] [--no-browser]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+{extra}
+print(json.dumps(dict(result, import_s=imported)))
+"""
+EAGER_IMPORTS = """
+import amazon, iherb, export
+export._load_pyarrow()
+import json
+result = {'eager_import_s': time.perf_counter() - started}
+"""
+FIRST_REQUEST = """
+import json
+{wait}
+response = app.app.test_client().get('/metrics/summary')
+result = app.startup_report.to_dict()
+"""
+
+
+# Function to run one measurement in a fresh interpreter and return its JSON result
+def run(script, warm_start, warm_browser=True):
+    env = dict(os.environ, REVIEWPAL_WARM_START='1' if warm_start else '0',
+               REVIEWPAL_WARM_BROWSER='1' if warm_browser else '0', REVIEWPAL_LOG_LEVEL='ERROR', PYTHONPATH=ROOT)
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True,
+                            stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median_ms(results, key):
+    return round(1000 * statistics.median(result[key] for result in results), 1)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark app import time, boot warm-up and first request latency')
+    arg_parser.add_argument('--runs', type=int, default=5)
+    arg_parser.add_argument('--no-browser', action='store_true', help='Leave the Playwright driver and browser out')
+    args = arg_parser.parse_args()
+    warm_browser = not args.no_browser
+
+    lazy = [run(IMPORT_SCRIPT.format(extra=FIRST_REQUEST.format(wait='')), warm_start=False)
+            for _ in range(args.runs)]
+    eager = [run(IMPORT_SCRIPT.format(extra=EAGER_IMPORTS), warm_start=False) for _ in range(args.runs)]
+    warm = [run(IMPORT_SCRIPT.format(extra=FIRST_REQUEST.format(wait='app.startup_report.warmed_up.wait(120)')),
+                warm_start=True, warm_browser=warm_browser) for _ in range(args.runs)]
+
+    phases = sorted({phase for result in warm for phase in result['warm_up']['phases_s']})
+    report = {
+        'import_app_ms': median_ms(lazy, 'import_s'),
+        'eager_import_app_ms': median_ms(eager, 'eager_import_s'),
+        'first_request_cold_ms': statistics.median(result['first_request']['latency_ms'] for result in lazy),
+        'first_request_warm_ms': statistics.median(result['first_request']['latency_ms'] for result in warm),
+        'warm_up_ms': round(1000 * statistics.median(
+            result['warm_up']['finished_after_s'] - result['warm_up']['started_after_s'] for result in warm), 1),
+        'warm_up_phases_ms': {phase: round(1000 * statistics.median(
+            result['warm_up']['phases_s'].get(phase, 0.0) for result in warm), 1) for phase in phases},
+        'warm_up_errors': {phase: error for result in warm for phase, error in result['warm_up']['errors'].items()},
+    }
+
+    print(f"{'measurement':<28} {'median ms':>10}")
+    print(f"{'import app (lazy)':<28} {report['import_app_ms']:>10}")
+    print(f"{'import app (eager)':<28} {report['eager_import_app_ms']:>10}")
+    print(f"{'first request (cold)':<28} {report['first_request_cold_ms']:>10}")
+    print(f"{'first request (warm)':<28} {report['first_request_warm_ms']:>10}")
+    print(f"{'warm-up (background)':<28} {report['warm_up_ms']:>10}")
+    for phase, ms in report['warm_up_phases_ms'].items():
+        print(f"{'  ' + phase:<28} {ms:>10}")
+    for phase, error in report['warm_up_errors'].items():
+        print(f"warm-up phase '{phase}' failed: {error}")
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
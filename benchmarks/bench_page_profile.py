@@ -0,0 +1,55 @@
+# Before/after comparison of the page profiles: loads the same live pages with the full profile (everything,
+# large viewport, wait for "load") and the lean one (no images/fonts/media/ads/trackers, DOMContentLoaded),
+# and reports bytes transferred and load time per page.
+#
+#   python benchmarks/bench_page_profile.py URL [URL ...] [--repeat 3] [--profile full --profile lean]
+import argparse
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+async def measure(profile_name, urls, repeat):
+    from playwright.async_api import async_playwright
+    from browser_pool import BrowserPool
+    from page_profile import get_page_profile
+
+    async with async_playwright() as playwright:
+        pool = BrowserPool(playwright, size=1, profile=get_page_profile(profile_name))
+        try:
+            for _ in range(repeat):
+                for url in urls:
+                    async with pool.page() as page:
+                        await pool.goto(page, url)
+            return pool.metrics.summary()
+        finally:
+            await pool.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compare bytes and load time per page across page profiles')
+    arg_parser.add_argument('urls', nargs='+')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--profile', action='append', help='Profile(s) to run; default: full, then lean')
+    args = arg_parser.parse_args()
+
+    profiles = args.profile or ['full', 'lean']
+    results = {name: asyncio.get_event_loop().run_until_complete(measure(name, args.urls, args.repeat))
+               for name in profiles}
+
+    print(f"{'profile':<8} {'pages':>6} {'requests':>9} {'blocked':>8} {'KB/page':>9} {'load ms':>9}")
+    for name, summary in results.items():
+        print(f"{name:<8} {summary['pages']:>6} {summary['requests']:>9} {summary['blocked_requests']:>8} "
+              f"{summary['bytes_per_page'] // 1024:>9} {summary['avg_load_ms']:>9}")
+
+    if 'full' in results and 'lean' in results and results['full']['bytes_per_page']:
+        full, lean = results['full'], results['lean']
+        print(f"lean vs full: {100 * (1 - lean['bytes_per_page'] / full['bytes_per_page']):.0f}% fewer bytes, "
+              f"{100 * (1 - lean['avg_load_ms'] / full['avg_load_ms']):.0f}% less load time" if full['avg_load_ms'] else '')
+
+
+if __name__ == '__main__':
+    main()
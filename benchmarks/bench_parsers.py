@@ -0,0 +1,102 @@
+# Benchmark of the HTML parser backends against the saved fixture pages.
+# Every (backend, page) pair runs in a fresh process so the peak memory numbers do not leak into each other.
+#
+#   python benchmarks/bench_parsers.py [--repeat 20] [--backend lxml]
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT, 'benchmarks', 'fixtures')
+sys.path.insert(0, ROOT)
+
+# Fixture page -> (module, parse function)
+FIXTURES = {
+    'amazon_search.html': ('amazon', 'parse_product_details'),
+    'iherb_grid.html': ('iherb', 'parse_iherb_product_grid'),
+}
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Function to get the peak resident set size of this process in KB
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+# Measure one backend on one page (runs inside the child process)
+def measure(backend, fixture, repeat):
+    import importlib
+    from parsers import get_parser
+
+    module_name, function_name = FIXTURES[fixture]
+    parse = getattr(importlib.import_module(module_name), function_name)
+    parser = get_parser(backend)
+    with open(os.path.join(FIXTURES_DIR, fixture), encoding='utf-8') as f:
+        html = f.read()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        rss_before = peak_rss_kb()
+        tracemalloc.start()
+        products = parse(html, parser=parser)
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_after = peak_rss_kb()
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parse(html, parser=parser)
+            timings.append(time.perf_counter() - start)
+
+    return {
+        'backend': backend,
+        'page': fixture,
+        'page_kb': len(html.encode('utf-8')) // 1024,
+        'products': len(products or []),
+        'mean_ms': round(1000 * sum(timings) / len(timings), 2),
+        'min_ms': round(1000 * min(timings), 2),
+        'python_peak_kb': python_peak // 1024,
+        'rss_peak_delta_kb': rss_after - rss_before if rss_before is not None else None,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark the HTML parser backends on the fixture pages')
+    arg_parser.add_argument('--repeat', type=int, default=20)
+    arg_parser.add_argument('--backend', action='append', help='Backend(s) to run; default: all installed')
+    arg_parser.add_argument('--child', nargs=2, metavar=('BACKEND', 'FIXTURE'), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], args.child[1], args.repeat)))
+        return
+
+    from parsers import PARSER_BACKENDS, parser_available
+    backends = args.backend or [backend for backend in PARSER_BACKENDS if parser_available(backend)]
+
+    print(f"{'backend':<12} {'page':<20} {'KB':>6} {'products':>8} {'mean ms':>9} {'min ms':>8} {'py peak KB':>11} {'rss peak KB':>12}")
+    for fixture in FIXTURES:
+        for backend in backends:
+            output = subprocess.run([sys.executable, __file__, '--repeat', str(args.repeat), '--child', backend, fixture],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['backend']:<12} {result['page']:<20} {result['page_kb']:>6} {result['products']:>8} "
+                  f"{result['mean_ms']:>9} {result['min_ms']:>8} {result['python_peak_kb']:>11} "
+                  f"{str(result['rss_peak_delta_kb']):>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# Throughput benchmark of the batched sentiment scoring in utils, in reviews/sec for 1 vs N worker processes.
+# Uses a deterministic synthetic corpus and an in-memory cache, so nothing is read from or written to disk.
+#
+#   python benchmarks/bench_sentiment.py [--reviews 20000] [--products 200] [--workers 4]
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import utils  # noqa: E402
+
+WORDS = (
+    "this tea is great love it amazing flavor bad taste terrible awful would not buy again works well "
+    "arrived broken smells fine okay but pricey highly recommend my kids hate it five stars worst ever "
+    "really helps with sleep no difference at all capsules are huge easy to swallow"
+).split()
+DECORATIONS = ["!!!", "...", " <br>", " https://example.com/x", " &amp;", " \\u2019s", " [[VIDEOID:abc]]", ""]
+
+
+# Function to build a deterministic corpus of products with reviews
+def build_corpus(num_reviews, num_products, seed=13):
+    rng = random.Random(seed)
+    reviews = [
+        ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 80))) + rng.choice(DECORATIONS)
+        for _ in range(num_reviews)
+    ]
+    per_product = max(1, num_reviews // num_products)
+    return [reviews[start:start + per_product] for start in range(0, num_reviews, per_product)]
+
+
+# Function to score the corpus once with a fresh in-memory cache and return reviews/sec
+def run(corpus, workers, cache=None):
+    utils._sentiment_cache = cache or utils.SentimentCache(None)
+    # Start the pool outside the timed region so worker start-up is not counted
+    executor = utils.get_sentiment_executor(workers)
+    if executor is not None:
+        list(executor.map(utils.score_review_texts, [["warm up"]] * workers))
+
+    total = sum(len(reviews) for reviews in corpus)
+    start = time.perf_counter()
+    utils.analyze_sentiment_batch(corpus, workers=workers)
+    elapsed = time.perf_counter() - start
+    return total / elapsed, elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark batched VADER sentiment scoring')
+    arg_parser.add_argument('--reviews', type=int, default=20000)
+    arg_parser.add_argument('--products', type=int, default=200)
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = arg_parser.parse_args()
+
+    corpus = build_corpus(args.reviews, args.products)
+    print(f"{'mode':<22} {'reviews/sec':>12} {'seconds':>9}")
+    for workers in sorted({1, args.workers}):
+        rate, elapsed = run(corpus, workers)
+        print(f"{f'{workers} worker(s)':<22} {rate:>12.0f} {elapsed:>9.2f}")
+
+    # Second pass over the same reviews: every score comes from the cache
+    cache = utils.SentimentCache(None)
+    run(corpus, 1, cache)
+    rate, elapsed = run(corpus, 1, cache)
+    print(f"{'cached re-score':<22} {rate:>12.0f} {elapsed:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
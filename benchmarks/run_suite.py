@@ -0,0 +1,258 @@
+# Offline benchmark suite. The fixture pages are served by a local HTTP stand-in and every stage of a scrape
+# is measured on its own, each in a fresh process: throughput, p50/p95 latency per call and peak RSS.
+# Results are compared with a saved baseline so regressions show up as diffs.
+#
+#   python benchmarks/run_suite.py                      # run and compare with benchmarks/baselines/baseline.json
+#   python benchmarks/run_suite.py --save-baseline      # run and (over)write the baseline
+#   python benchmarks/run_suite.py --case clean_text --iterations 50 --check
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, 'benchmarks')
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+# Stand-in URLs of each fixture page (see standin_server.ROUTES)
+AMAZON_SEARCH_PATH = '/s?k=herbal+tea'
+AMAZON_PRODUCT_PATH = '/Herbal-Tea-Organic/dp/B0STANDIN1/ref=sr_1_1'
+IHERB_GRID_PATH = '/c/herbal-tea?sr=2'
+IHERB_PRODUCT_PATH = '/iherb.com/pr/herbal-tea-organic/12345'
+
+# Default relative change that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Function to get the peak resident set size of this process in MB
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# Function to get a percentile (nearest rank) of a list of numbers
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+# Function to fetch a fixture page through the stand-in
+def fetch_fixture(base_url, path):
+    with urllib.request.urlopen(base_url + path) as response:
+        return response.read().decode('utf-8')
+
+
+# Function to build a page cache in memory holding one page, so the fetch functions run without a browser
+def cached_page(url, html):
+    from page_cache import PageCache
+    cache = PageCache(':memory:')
+    cache.put(url, html)
+    return cache
+
+
+# Every case returns (call, items per call, item unit); call() is what gets timed
+
+def case_parse_product_details(base_url):
+    from amazon import parse_product_details
+    html = fetch_fixture(base_url, AMAZON_SEARCH_PATH)
+    return (lambda: parse_product_details(html)), len(parse_product_details(html)), 'products'
+
+
+def case_parse_iherb_product_grid(base_url):
+    from iherb import parse_iherb_product_grid
+    html = fetch_fixture(base_url, IHERB_GRID_PATH)
+    return (lambda: parse_iherb_product_grid(html)), len(parse_iherb_product_grid(html)), 'products'
+
+
+def case_fetch_amazon_reviews(base_url):
+    from amazon import fetch_amazon_reviews
+    url = base_url + AMAZON_PRODUCT_PATH
+    cache = cached_page(url, fetch_fixture(base_url, AMAZON_PRODUCT_PATH))
+    loop = asyncio.get_event_loop()
+
+    def call():
+        return loop.run_until_complete(fetch_amazon_reviews(None, 'Herbal Tea', url, cache=cache))
+    return call, len(call()), 'reviews'
+
+
+def case_fetch_iherb_reviews(base_url):
+    from iherb import fetch_iherb_reviews
+    href = base_url + IHERB_PRODUCT_PATH
+    review_path = IHERB_PRODUCT_PATH.replace('iherb.com/pr', 'iherb.com/r') + '?sort=6&isshowtranslated=true&p=1'
+    cache = cached_page(base_url + review_path, fetch_fixture(base_url, review_path))
+    loop = asyncio.get_event_loop()
+
+    def call():
+        return loop.run_until_complete(fetch_iherb_reviews(None, 'Herbal Tea', '12345', href, cache=cache))
+    return call, len(call()[0]), 'reviews'
+
+
+def case_clean_text(base_url):
+    from bench_sentiment import build_corpus
+    from utils import clean_texts
+    reviews = [review for product in build_corpus(1000, 1) for review in product]
+    return (lambda: clean_texts(reviews)), len(reviews), 'reviews'
+
+
+def case_analyze_sentiment(base_url):
+    from bench_sentiment import build_corpus
+    import utils
+    reviews = build_corpus(100, 1)[0]
+
+    def call():
+        # A fresh in-memory cache each call, so every review is really scored
+        utils._sentiment_cache = utils.SentimentCache(None)
+        return utils.analyze_sentiment(reviews)
+    return call, len(reviews), 'reviews'
+
+
+def case_http_fetch(base_url):
+    from http_fetcher import HttpFetcher
+    loop = asyncio.get_event_loop()
+    fetcher = HttpFetcher()
+    loop.run_until_complete(fetcher.start())
+    url = base_url + AMAZON_SEARCH_PATH
+    return (lambda: loop.run_until_complete(fetcher.fetch_html(url, required_marker='s-main-slot'))), 1, 'pages'
+
+
+CASES = {
+    'parse_product_details': case_parse_product_details,
+    'parse_iherb_product_grid': case_parse_iherb_product_grid,
+    'fetch_amazon_reviews': case_fetch_amazon_reviews,
+    'fetch_iherb_reviews': case_fetch_iherb_reviews,
+    'clean_text': case_clean_text,
+    'analyze_sentiment': case_analyze_sentiment,
+    'http_fetch': case_http_fetch,
+}
+
+
+# Measure one case (runs inside the child process)
+def measure(case, base_url, iterations, warmup=2):
+    with contextlib.redirect_stdout(io.StringIO()):
+        call, items, unit = CASES[case](base_url)
+        for _ in range(warmup):
+            call()
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - start)
+
+    return {
+        'case': case,
+        'iterations': iterations,
+        'items_per_call': items,
+        'unit': unit,
+        'throughput': round(items * len(timings) / sum(timings), 1),
+        'p50_ms': round(1000 * percentile(timings, 0.50), 3),
+        'p95_ms': round(1000 * percentile(timings, 0.95), 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+# Function to compare a result with its baseline; returns {metric: relative change} and the regressed metrics
+def compare(result, baseline, threshold):
+    changes = {}
+    regressions = []
+    # (metric, True when higher is better)
+    for metric, higher_is_better in (('throughput', True), ('p50_ms', False), ('p95_ms', False), ('peak_rss_mb', False)):
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        changes[metric] = change
+        if (-change if higher_is_better else change) > threshold:
+            regressions.append(metric)
+    return changes, regressions
+
+
+def format_change(changes, metric):
+    return f"{100 * changes[metric]:+.0f}%" if metric in changes else ''
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Offline benchmark suite over the recorded fixture pages')
+    arg_parser.add_argument('--case', action='append', choices=sorted(CASES), help='Case(s) to run; default: all')
+    arg_parser.add_argument('--iterations', type=int, default=30)
+    arg_parser.add_argument('--baseline', default='baseline', help='Baseline name in benchmarks/baselines/')
+    arg_parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    arg_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Relative change that counts as a regression (default 0.10)')
+    arg_parser.add_argument('--check', action='store_true', help='Exit with status 1 when a case regressed')
+    arg_parser.add_argument('--child', nargs=2, metavar=('CASE', 'BASE_URL'), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], args.child[1], args.iterations)))
+        return
+
+    from standin_server import start_standin_server
+    server, base_url = start_standin_server()
+
+    baseline_path = os.path.join(BASELINE_DIR, f'{args.baseline}.json')
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)['cases']
+
+    results = {}
+    regressed = []
+    print(f"{'case':<26} {'throughput':>20} {'p50 ms':>9} {'p95 ms':>9} {'rss MB':>7}   "
+          f"{'Δ thrpt':>8} {'Δ p95':>6} {'Δ rss':>6}")
+    try:
+        for case in args.case or list(CASES):
+            output = subprocess.run([sys.executable, __file__, '--iterations', str(args.iterations),
+                                     '--child', case, base_url],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results[case] = result
+            changes, regressions = compare(result, baseline.get(case, {}), args.threshold)
+            if regressions:
+                regressed.append((case, regressions))
+            throughput = f"{result['throughput']} {result['unit']}/s"
+            print(f"{case:<26} {throughput:>20} {result['p50_ms']:>9} {result['p95_ms']:>9} "
+                  f"{str(result['peak_rss_mb']):>7}   {format_change(changes, 'throughput'):>8} "
+                  f"{format_change(changes, 'p95_ms'):>6} {format_change(changes, 'peak_rss_mb'):>6}"
+                  f"{'   REGRESSION: ' + ', '.join(regressions) if regressions else ''}")
+    finally:
+        server.shutdown()
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        cases = dict(baseline, **results)
+        with open(baseline_path, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cases': cases,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline saved to {os.path.relpath(baseline_path, ROOT)}")
+    elif not baseline:
+        print(f"No baseline at {os.path.relpath(baseline_path, ROOT)} yet; run with --save-baseline to record one.")
+
+    if regressed:
+        print(f"{len(regressed)} case(s) regressed by more than {100 * args.threshold:.0f}%")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
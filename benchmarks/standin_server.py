@@ -0,0 +1,73 @@
+# Local HTTP stand-in for Amazon and iHerb that serves the recorded fixture pages, so fetch code can be
+# measured without touching the real sites. URLs are matched on the same path shapes the scrapers use.
+#
+#   python benchmarks/standin_server.py [--port 8765]
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+import threading
+import os
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# (path fragment, fixture page); the first match wins
+ROUTES = (
+    ('/dp/', 'amazon_product.html'),
+    ('/r/', 'iherb_reviews.html'),
+    ('/c/', 'iherb_grid.html'),
+    ('/s', 'amazon_search.html'),
+)
+
+
+# Function to load every fixture page once
+def load_fixtures():
+    pages = {}
+    for _, fixture in ROUTES:
+        with open(os.path.join(FIXTURES_DIR, fixture), 'rb') as f:
+            pages[fixture] = f.read()
+    return pages
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    pages = {}
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        fixture = next((fixture for fragment, fixture in ROUTES if fragment in path), None)
+        if fixture is None:
+            self.send_error(404)
+            return
+        body = self.pages[fixture]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start the stand-in on a background thread; returns the server and its base URL
+def start_standin_server(port=0):
+    StandInHandler.pages = load_fixtures()
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='standin-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Serve the fixture pages as a local Amazon/iHerb stand-in')
+    arg_parser.add_argument('--port', type=int, default=8765)
+    args = arg_parser.parse_args()
+
+    server, base_url = start_standin_server(args.port)
+    print(f"Serving fixtures on {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+from contextlib import asynccontextmanager
+from utils import get_random_user_agent
+from page_profile import PageMetrics, get_page_profile
+from metrics import span
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+# Default number of long-lived browsers kept by the pool
+DEFAULT_POOL_SIZE = 4
+# Number of pages served by a context before it is thrown away and rebuilt
+DEFAULT_PAGES_PER_CONTEXT = 25
+
+
+# Playwright instance and browser started once at boot (see startup.warm_up) and the loop they run on
+_warm_browser = None
+
+
+# Function to make a started Playwright instance and browser available to every scrape on their event loop
+def set_warm_browser(playwright, browser):
+    global _warm_browser
+    _warm_browser = (asyncio.get_event_loop(), playwright, browser)
+
+
+# Function to get the warm (playwright, browser) for the running event loop, or None. With `playwright`, only
+# a browser of that Playwright instance is returned.
+def get_warm_browser(playwright=None):
+    if _warm_browser is None:
+        return None
+    loop, warm_playwright, browser = _warm_browser
+    if loop is not asyncio.get_event_loop() or not browser.is_connected():
+        return None
+    if playwright is not None and playwright is not warm_playwright:
+        return None
+    return warm_playwright, browser
+
+
+# Function to close the warm browser and stop its Playwright instance (on the loop they were started on)
+async def stop_warm_browser():
+    global _warm_browser
+    if _warm_browser is None:
+        return
+    _, playwright, browser = _warm_browser
+    _warm_browser = None
+    try:
+        await browser.close()
+    finally:
+        await playwright.stop()
+
+
+# Playwright for one scrape: the warm instance when one runs on this loop (it is left running), otherwise a
+# fresh one that is stopped when the block exits
+@asynccontextmanager
+async def playwright_session():
+    warm = get_warm_browser()
+    if warm is not None:
+        yield warm[0]
+        return
+    from playwright.async_api import async_playwright
+    async with async_playwright() as playwright:
+        yield playwright
+
+
+# Function to get a browser for a scrape: the warm one when it belongs to `playwright` and a headless browser is
+# asked for (the warm one is headless), otherwise a newly launched one. Returns (browser, owned); only owned
+# browsers are closed by the caller.
+async def launch_browser(playwright, headless=True, **labels):
+    warm = get_warm_browser(playwright) if headless else None
+    if warm is not None:
+        return warm[1], False
+    with span('launch', **labels):
+        return await playwright.chromium.launch(headless=headless), True
+
+
+# A single pool entry: one browser with (at most) one live context
+class _PoolSlot:
+    def __init__(self, index):
+        self.index = index
+        self.browser = None
+        self.owns_browser = True
+        self.context = None
+        self.pages_served = 0
+
+
+# Pool of long-lived Chromium browsers and contexts shared by the scrapers.
+# Each borrowed page leases a slot exclusively, so the pool size also bounds
+# how many pages are open at once. Every context gets the page profile's request filter and viewport.
+# When the warm browser started at boot belongs to the pool's Playwright, the slots open their contexts in it
+# instead of launching browsers of their own.
+class BrowserPool:
+    def __init__(self, playwright, size=DEFAULT_POOL_SIZE, pages_per_context=DEFAULT_PAGES_PER_CONTEXT,
+                 headless=True, context_options=None, profile=None):
+        if size < 1:
+            raise ValueError("Browser pool size must be at least 1")
+        self.playwright = playwright
+        self.size = size
+        self.pages_per_context = pages_per_context
+        self.headless = headless
+        self.context_options = context_options or {}
+        self.profile = profile if profile is not None else get_page_profile()
+        self.metrics = PageMetrics()
+        self._slots = [_PoolSlot(i) for i in range(size)]
+        self._idle = asyncio.Queue()
+        for slot in self._slots:
+            self._idle.put_nowait(slot)
+        self._closed = False
+
+        # Counters exposed through stats()
+        self.launches = 0
+        self.contexts_created = 0
+        self.context_recycles = 0
+        self.crashes = 0
+        self.hits = 0
+        self.misses = 0
+        self.pages_served = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # Make sure the slot has a connected browser and a live context
+    async def _prepare_slot(self, slot):
+        if slot.browser is None or not slot.browser.is_connected():
+            if slot.browser is not None:
+                logger.warning("Browser in pool slot %s disconnected, relaunching.", slot.index)
+                slot.context = None
+            slot.browser, slot.owns_browser = await launch_browser(self.playwright, headless=self.headless)
+            if slot.owns_browser:
+                self.launches += 1
+
+        if slot.context is None:
+            options = self.profile.context_options(**self.context_options)
+            options.setdefault('user_agent', get_random_user_agent())
+            slot.context = await slot.browser.new_context(**options)
+            await self.profile.apply(slot.context, self.metrics)
+            slot.pages_served = 0
+            self.contexts_created += 1
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    # Close the context of a slot so the next lease starts with a fresh one
+    async def _recycle_context(self, slot):
+        context, slot.context = slot.context, None
+        slot.pages_served = 0
+        self.context_recycles += 1
+        if context is not None:
+            try:
+                await context.close()
+            except Exception as e:
+                logger.warning("Failed to close recycled context in pool slot %s: %s", slot.index, e)
+
+    # Borrow a page from the pool; the page is closed when the block exits
+    @asynccontextmanager
+    async def page(self):
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+
+        slot = await self._idle.get()
+        crashed = []
+        page = None
+        try:
+            try:
+                await self._prepare_slot(slot)
+                page = await slot.context.new_page()
+            except Exception:
+                # The context could not open a page; the slot starts over with a fresh one
+                crashed.append(True)
+                raise
+            page.on('crash', lambda _: crashed.append(True))
+            self.metrics.track(page)
+            # An exception from the caller's block (a parse error, throttling, a cache miss, ...) returns the
+            # slot as usual; only the page's 'crash' event or a failed close counts as a crash
+            yield page
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    crashed.append(True)
+                slot.pages_served += 1
+                self.pages_served += 1
+
+            if crashed:
+                self.crashes += 1
+            if slot.context is not None and (crashed or slot.pages_served >= self.pages_per_context):
+                await self._recycle_context(slot)
+            self._idle.put_nowait(slot)
+
+    # Navigate a borrowed page with the pool's profile, recording its load time
+    async def goto(self, page, url, **options):
+        return await self.profile.goto(page, url, self.metrics, **options)
+
+    def stats(self):
+        return {
+            'pool_size': self.size,
+            'launches': self.launches,
+            'contexts_created': self.contexts_created,
+            'context_recycles': self.context_recycles,
+            'crashes': self.crashes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'pages_served': self.pages_served,
+            'profile': self.profile.name,
+            'page_metrics': self.metrics.summary(),
+        }
+
+    async def close(self):
+        self._closed = True
+        for slot in self._slots:
+            if slot.context is not None:
+                try:
+                    await slot.context.close()
+                except Exception:
+                    pass
+                slot.context = None
+            if slot.browser is not None and slot.owns_browser:
+                try:
+                    await slot.browser.close()
+                except Exception:
+                    pass
+            slot.browser = None
+        logger.info("Browser pool closed: %s", self.stats())
@@ -0,0 +1,136 @@
+from export import iter_parquet_records
+import pandas as pd
+import logging
+import sqlite3
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+# Default number of saved products buffered before they are committed
+DEFAULT_COMMIT_EVERY = 10
+# Seconds to wait for another process's write to finish (sharded runs share one checkpoint)
+BUSY_TIMEOUT = 30
+
+
+# numpy scalars coming from pandas records are not JSON serializable on their own
+def _json_default(value):
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+# Append-only product checkpoint backed by SQLite in WAL mode.
+# Every product is written once (keyed by Product ID / ASIN), commits are batched, and the set of processed
+# keys is kept in memory so "already processed?" is an O(1) lookup.
+# Several processes may write to one store as long as they save disjoint keys (see sharding.run_sharded).
+class CheckpointStore:
+    def __init__(self, path, commit_every=DEFAULT_COMMIT_EVERY):
+        self.path = path
+        self.commit_every = commit_every
+        self._pending = 0
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " key TEXT PRIMARY KEY,"
+            " seq INTEGER NOT NULL,"
+            " processed INTEGER NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS products_seq ON products (seq)")
+        self._db.commit()
+        self._keys = {}
+        for key, processed in self._db.execute("SELECT key, processed FROM products"):
+            self._keys[key] = bool(processed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return str(key) in self._keys
+
+    def is_processed(self, key):
+        return self._keys.get(str(key), False)
+
+    def processed_keys(self):
+        return {key for key, processed in self._keys.items() if processed}
+
+    # Save one product; a product keeps the position of its first save
+    def save(self, key, record, processed=True):
+        key = str(key)
+        data = json.dumps(record, default=_json_default)
+        if key in self._keys:
+            self._db.execute("UPDATE products SET processed = ?, data = ? WHERE key = ?", (int(processed), data, key))
+        else:
+            # The position is taken inside the write transaction, so processes sharing the store never collide
+            self._db.execute("INSERT INTO products (key, seq, processed, data) "
+                             "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM products), ?, ?)",
+                             (key, int(processed), data))
+        self._keys[key] = bool(processed)
+
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+
+    # Function to seed the store from records of an older checkpoint format (e.g. a CSV from a previous run)
+    def import_records(self, records, key_field, is_processed):
+        for record in records:
+            if record.get(key_field) is not None and record[key_field] not in self:
+                self.save(record[key_field], record, processed=is_processed(record))
+        self.flush()
+
+    def get(self, key):
+        row = self._db.execute("SELECT data FROM products WHERE key = ?", (str(key),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # All saved products in the order they were first saved, read in batches
+    def iter_records(self, batch_size=500):
+        cursor = self._db.execute("SELECT data FROM products ORDER BY seq")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for (data,) in rows:
+                yield json.loads(data)
+
+    def records(self):
+        return list(self.iter_records())
+
+    def flush(self):
+        if self._pending:
+            self._db.commit()
+            self._pending = 0
+
+    # Fold the WAL back into the main database file
+    def compact(self):
+        self.flush()
+        self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        if self._db is not None:
+            self.compact()
+            self._db.close()
+            self._db = None
+
+
+# Function to read the products of an export file of an earlier run (CSV, or Parquet by its extension)
+def read_legacy_records(path):
+    if path.endswith('.parquet'):
+        return iter_parquet_records(path)
+    return pd.read_csv(path).to_dict('records')
+
+
+# Function to open a checkpoint store, importing the export of an earlier run (`legacy_path`) the first time
+def open_checkpoint(path, legacy_path=None, key_field=None, is_processed=None, commit_every=DEFAULT_COMMIT_EVERY):
+    is_new = not os.path.exists(path)
+    store = CheckpointStore(path, commit_every=commit_every)
+    if is_new and legacy_path and os.path.exists(legacy_path):
+        logger.info("Importing existing product data from %s into %s...", legacy_path, path)
+        store.import_records(read_legacy_records(legacy_path), key_field, is_processed)
+    return store
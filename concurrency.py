@@ -0,0 +1,158 @@
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+import inspect
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default number of products fetched at the same time
+DEFAULT_MAX_CONCURRENCY = 4
+# Default number of simultaneous requests against one host
+DEFAULT_PER_HOST_LIMIT = 4
+# Default number of listing pages fetched at the same time
+DEFAULT_LISTING_CONCURRENCY = 8
+
+
+# Function to get the host part of a URL (used as the per-host limit key)
+def get_host(url):
+    if not url or not isinstance(url, str):
+        return None
+    return urlparse(url).netloc.lower() or None
+
+
+# Function to set one query parameter of a URL (e.g. the page number of a search listing)
+def with_query_param(url, name, value):
+    parts = urlparse(url)
+    query = [(key, val) for key, val in parse_qsl(parts.query, keep_blank_values=True) if key != name]
+    query.append((name, str(value)))
+    return urlunparse(parts._replace(query=urlencode(query)))
+
+
+# Function to call a callback that may be a plain function or a coroutine function
+async def maybe_await(callback, *args):
+    result = callback(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+# Passes records to `callback` in index order although they finish in any order: a record waits until every
+# record before it was passed on or skipped (emitted as None). Only records finished behind a slower earlier one
+# are held back.
+class OrderedEmitter:
+    def __init__(self, callback, start=0):
+        self.callback = callback
+        self.next_index = start
+        self.pending = {}
+        self._releasing = False
+
+    async def emit(self, index, record):
+        self.pending[index] = record
+        # One caller releases at a time, so the callback never runs twice at once and order is kept across awaits
+        if self._releasing:
+            return
+        self._releasing = True
+        try:
+            while self.next_index in self.pending:
+                record = self.pending.pop(self.next_index)
+                self.next_index += 1
+                if record is not None:
+                    await maybe_await(self.callback, record)
+        finally:
+            self._releasing = False
+
+
+# Run `worker(item)` for every item with at most `max_concurrency` tasks in flight overall and at most
+# `per_host_limit` in flight per host. Results are returned in the order of `items`. Workers are expected to
+# handle the failures of their own item; an exception that escapes one cancels the others and is re-raised.
+async def gather_bounded(items, worker, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                         per_host_limit=DEFAULT_PER_HOST_LIMIT, url_of=None):
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    if per_host_limit is not None and per_host_limit < 1:
+        raise ValueError("per_host_limit must be at least 1")
+
+    overall = asyncio.Semaphore(max_concurrency)
+    host_limits = {}
+
+    def host_semaphore(item):
+        if per_host_limit is None or url_of is None:
+            return None
+        host = get_host(url_of(item))
+        if host is None:
+            return None
+        if host not in host_limits:
+            host_limits[host] = asyncio.Semaphore(per_host_limit)
+        return host_limits[host]
+
+    async def run(item):
+        host_limit = host_semaphore(item)
+        if host_limit is not None:
+            async with host_limit:
+                async with overall:
+                    return await worker(item)
+        async with overall:
+            return await worker(item)
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+# Fetch listing pages whose URLs are known in advance, at most `max_concurrency` at once.
+# `fetch_page(page_number, url)` returns the products of a page: an empty list marks a page past the end (pages
+# after it are cancelled or skipped), None skips just that page. Once every page is in, products are deduplicated by
+# `key_of(product)` in page order (products without a key are all kept), so a product is credited to the first page
+# it is on however the pages arrive. A failing page is logged and skipped.
+async def crawl_listing_pages(page_urls, fetch_page, key_of, max_concurrency=DEFAULT_LISTING_CONCURRENCY):
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Index of the first empty page; nothing from it onwards is fetched or kept
+    end = [len(page_urls)]
+    tasks = []
+
+    async def run(index, url):
+        async with semaphore:
+            if index >= end[0]:
+                return index, None
+            try:
+                products = await fetch_page(index + 1, url)
+            except Exception:
+                logger.exception("Failed to fetch listing page %s", index + 1)
+                return index, None
+        if products is not None and not products and index < end[0]:
+            end[0] = index
+            for task in tasks[index + 1:]:
+                task.cancel()
+        return index, products
+
+    tasks.extend(asyncio.ensure_future(run(index, url)) for index, url in enumerate(page_urls))
+    products_by_page = {}
+    for next_page in asyncio.as_completed(tasks):
+        try:
+            index, products = await next_page
+        except asyncio.CancelledError:
+            continue
+        if products:
+            products_by_page[index] = products
+
+    seen = set()
+    all_products = []
+    for index in sorted(products_by_page):
+        if index >= end[0]:
+            break
+        for product in products_by_page[index]:
+            key = key_of(product)
+            if key:
+                if key in seen:
+                    continue
+                seen.add(key)
+            all_products.append(product)
+    return all_products
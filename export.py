@@ -0,0 +1,297 @@
+from datetime import date
+import importlib.util
+import json
+import math
+import ast
+import csv
+import io
+import re
+import os
+
+# pyarrow is optional and only imported once a Parquet file is read or written (see _load_pyarrow)
+HAVE_PYARROW = importlib.util.find_spec('pyarrow') is not None
+pa = pq = None
+
+# Column order of the Amazon export (Product Link right after Product Name)
+AMAZON_COLUMNS = ['Product Name', 'Product Link', 'Price', 'Rating', 'ASIN', 'Summary Sentiment', 'Sentiment Score', 'Reviews']
+# Column order of the iHerb export
+IHERB_COLUMNS = ['Product Name', 'Product Price', 'Product Rating', 'Label', 'Product ID', 'Product Link',
+                 'Summary Sentiment', 'Sentiment Score', 'Reviews', 'Review Dates', 'Review Stars']
+EXPORT_COLUMNS = {
+    'amazon': AMAZON_COLUMNS,
+    'iherb': IHERB_COLUMNS,
+}
+
+# Row formats, which can be streamed while a scrape runs
+EXPORT_FORMATS = ('csv', 'ndjson')
+# Formats a result file can be written in; Parquet needs pyarrow (`pip install pyarrow`)
+FILE_FORMATS = EXPORT_FORMATS + ('parquet',)
+# Format of the files the scrapers write themselves (e.g. the iHerb reviews export)
+DEFAULT_FILE_FORMAT = os.environ.get('REVIEWPAL_EXPORT_FORMAT', 'csv')
+FILE_EXTENSIONS = {
+    'csv': '.csv',
+    'ndjson': '.ndjson',
+    'parquet': '.parquet',
+}
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Products per Parquet row group; a writer holds at most this many products in memory
+PARQUET_BATCH_SIZE = 1000
+PARQUET_COMPRESSION = 'zstd'
+
+# Numbers in scraped prices ("$1,234.99") and ratings ("4.5 out of 5 stars", "4.6/5")
+PRICE_PATTERN = re.compile(r'\d[\d,]*(?:\.\d+)?')
+RATING_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+# Function to format one cell the way DataFrame.to_csv does (lists as their repr, missing values empty)
+def _csv_value(value):
+    if _is_missing(value):
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _json_value(value):
+    if _is_missing(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _load_pyarrow():
+    global pa, pq
+    if pq is None:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+
+
+# Function to check that results can be written in `export_format`; raises ValueError otherwise
+def check_file_format(export_format):
+    if export_format not in FILE_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}', expected one of {FILE_FORMATS}")
+    if export_format == 'parquet' and not HAVE_PYARROW:
+        raise ValueError("The parquet format needs pyarrow, install it with `pip install pyarrow`")
+
+
+# Function to give a file name the extension of `export_format`
+def with_format_extension(file_name, export_format):
+    return os.path.splitext(file_name)[0] + FILE_EXTENSIONS[export_format]
+
+
+# Turns product dicts into CSV or NDJSON lines one at a time, so results can be written or streamed as they finish
+class RowWriter:
+    def __init__(self, columns, export_format='csv'):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{export_format}', expected one of {EXPORT_FORMATS}")
+        self.columns = columns
+        self.format = export_format
+        self.mimetype = MIMETYPES[export_format]
+
+    def _csv_line(self, values):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerow(values)
+        return buffer.getvalue()
+
+    def header(self):
+        return self._csv_line(self.columns) if self.format == 'csv' else ''
+
+    def row(self, product):
+        if self.format == 'csv':
+            return self._csv_line([_csv_value(product.get(column)) for column in self.columns])
+        return json.dumps({column: _json_value(product.get(column)) for column in self.columns}, default=str) + '\n'
+
+
+# Text result file: the rows of a RowWriter appended to a file
+class TextExportFile:
+    def __init__(self, path, columns, export_format='csv'):
+        self.path = path
+        self._writer = RowWriter(columns, export_format)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._file.write(self._writer.header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, product):
+        self._file.write(self._writer.row(product))
+
+    def close(self):
+        self._file.close()
+
+
+# Function to read a number out of a scraped price; None for "No Price" and missing values
+def parse_price(value):
+    if _is_missing(value):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = PRICE_PATTERN.search(str(value))
+    return float(match.group().replace(',', '')) if match else None
+
+
+# Function to read a number out of a scraped rating; None for "No Rating" and missing values
+def parse_rating(value):
+    if _is_missing(value):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = RATING_PATTERN.search(str(value))
+    return float(match.group()) if match else None
+
+
+# Function to get a list column value as a list. Products imported from an older CSV checkpoint hold the
+# repr of the list instead.
+def _as_list(value):
+    if isinstance(value, str):
+        try:
+            value = ast.literal_eval(value) if value.startswith('[') else None
+        except (ValueError, SyntaxError):
+            return None
+    if _is_missing(value) or not isinstance(value, (list, tuple)):
+        return None
+    return list(value)
+
+
+def _as_date(value):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_int(value):
+    if _is_missing(value):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_float(value):
+    if _is_missing(value):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_string(value):
+    return None if _is_missing(value) else str(value)
+
+
+def _review_dates(value):
+    values = _as_list(value)
+    return None if values is None else [_as_date(item) for item in values]
+
+
+def _review_stars(value):
+    values = _as_list(value)
+    return None if values is None else [_as_int(item) for item in values]
+
+
+# Function to get the Arrow type and value converter of an export column (plain strings for the rest)
+def _column_spec(column):
+    specs = {
+        'Price': (pa.float64(), parse_price),
+        'Product Price': (pa.float64(), parse_price),
+        'Rating': (pa.float64(), parse_rating),
+        'Product Rating': (pa.float64(), parse_rating),
+        'Label': (pa.int8(), _as_int),
+        'Sentiment Score': (pa.float64(), _as_float),
+        # A handful of distinct labels: stored once per row group, rows hold 1-byte indices
+        'Summary Sentiment': (pa.dictionary(pa.int8(), pa.string()), _as_string),
+        'Reviews': (pa.list_(pa.string()), _as_list),
+        'Review Dates': (pa.list_(pa.date32()), _review_dates),
+        'Review Stars': (pa.list_(pa.int8()), _review_stars),
+    }
+    return specs.get(column, (pa.string(), _as_string))
+
+
+# Function to get the Arrow schema of an export: numeric price and rating, dictionary-encoded sentiment labels
+# and real list columns for the reviews, their dates and their stars
+def arrow_schema(columns):
+    _load_pyarrow()
+    return pa.schema([pa.field(column, _column_spec(column)[0]) for column in columns])
+
+
+# Writes products to a Parquet file as they finish. Values are buffered column by column and written as one
+# row group every `batch_size` products, so memory stays bounded whatever the number of products.
+class ParquetExportFile:
+    def __init__(self, path, columns, batch_size=PARQUET_BATCH_SIZE, compression=PARQUET_COMPRESSION):
+        check_file_format('parquet')
+        _load_pyarrow()
+        self.path = path
+        self.columns = columns
+        self.batch_size = batch_size
+        self.schema = arrow_schema(columns)
+        self._converters = [_column_spec(column)[1] for column in columns]
+        self._buffer = [[] for _ in columns]
+        self._rows = 0
+        self._writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, product):
+        for values, column, convert in zip(self._buffer, self.columns, self._converters):
+            values.append(convert(product.get(column)))
+        self._rows += 1
+        if self._rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        arrays = [pa.array(values, type=field.type) for values, field in zip(self._buffer, self.schema)]
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self._buffer = [[] for _ in self.columns]
+        self._rows = 0
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+            self._writer = None
+
+
+# Function to open a result file that products are written to one at a time (`write(product)`, `close()`)
+def open_export_file(path, columns, export_format='csv'):
+    check_file_format(export_format)
+    if export_format == 'parquet':
+        return ParquetExportFile(path, columns)
+    return TextExportFile(path, columns, export_format)
+
+
+# Function to read (some of) the columns of a Parquet export as an Arrow table; only the requested columns
+# are read from disk and the file is memory-mapped. `.to_pandas()` gives a DataFrame with real lists.
+def read_parquet_export(path, columns=None):
+    check_file_format('parquet')
+    _load_pyarrow()
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+# Function to iterate over the products of a Parquet export one row group batch at a time
+def iter_parquet_records(path, columns=None, batch_size=PARQUET_BATCH_SIZE):
+    check_file_format('parquet')
+    _load_pyarrow()
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield from batch.to_pylist()
@@ -0,0 +1,166 @@
+from utils import get_random_user_agent
+from page_cache import site_of
+from metrics import span, incr
+from rate_limiter import get_rate_limiter, retry_with_backoff, Throttled, TransientFetchError
+import logging
+import asyncio
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Markers of bot-check / CAPTCHA pages; seeing one means the page has to go through the browser
+CAPTCHA_MARKERS = (
+    "Enter the characters you see below",
+    "/errors/validateCaptcha",
+    "px-captcha",
+)
+# Markers of pages that only render their content with JavaScript
+JS_ONLY_MARKERS = (
+    "Please enable JavaScript",
+    "You need to enable JavaScript",
+)
+
+DEFAULT_HTTP_TIMEOUT = 20  # seconds
+DEFAULT_HTTP_CONNECTIONS = 20
+DEFAULT_HTTP_CONNECTIONS_PER_HOST = 4
+# Retries of throttled (429/503), failed (5xx) or dropped requests before falling back to the browser
+DEFAULT_HTTP_RETRIES = 2
+
+try:
+    import brotli  # noqa: F401  (aiohttp decodes "br" only when brotli is installed)
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+
+# Function to check whether a page is a bot-check / CAPTCHA page
+def is_captcha_page(html):
+    return any(marker in html for marker in CAPTCHA_MARKERS)
+
+
+# Function to decide whether an HTML response needs a real browser to be usable
+def needs_browser(status, html, required_marker=None):
+    if status != 200 or not html:
+        return True
+    if is_captcha_page(html):
+        return True
+    if required_marker is not None and required_marker not in html:
+        return True
+    return any(marker in html for marker in JS_ONLY_MARKERS) and len(html) < 20000
+
+
+# Plain-HTTP page fetcher backed by one pooled aiohttp session (keep-alive, compression, UA rotation).
+# fetch_html() returns None whenever the caller should fall back to Playwright.
+# With a page cache, fresh cached pages are returned without a request and good responses are stored.
+# Requests are paced by the shared per-host rate limiter, and transient failures are retried with backoff.
+class HttpFetcher:
+    def __init__(self, enabled=True, timeout=DEFAULT_HTTP_TIMEOUT, connections=DEFAULT_HTTP_CONNECTIONS,
+                 connections_per_host=DEFAULT_HTTP_CONNECTIONS_PER_HOST, cache=None, limiter=None,
+                 retries=DEFAULT_HTTP_RETRIES):
+        self.enabled = enabled
+        self.cache = cache
+        self.limiter = limiter if limiter is not None else get_rate_limiter()
+        self.retries = retries
+        self.timeout = timeout
+        self.connections = connections
+        self.connections_per_host = connections_per_host
+        self.session = None
+
+        # Counters exposed through stats()
+        self.requests = 0
+        self.served = 0
+        self.fallbacks = 0
+        self.errors = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        if not self.enabled or self.session is not None:
+            return
+        connector = aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.connections_per_host,
+                                         keepalive_timeout=30, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Encoding': ACCEPT_ENCODING,
+                'Accept-Language': 'en-US,en;q=0.9',
+            },
+        )
+
+    # Fetch a page over plain HTTP; returns the HTML, or None if the browser has to be used instead
+    async def fetch_html(self, url, required_marker=None):
+        if self.cache is not None:
+            html = self.cache.get(url)
+            if html is not None:
+                return html
+            if self.cache.replay:
+                return None
+        if not self.enabled:
+            return None
+        if self.session is None:
+            await self.start()
+
+        site = site_of(url)
+        try:
+            status, html = await retry_with_backoff(
+                lambda: self._request(url, site), retries=self.retries,
+                retry_on=(Throttled, TransientFetchError, aiohttp.ClientError, asyncio.TimeoutError),
+                site=site, description=f"HTTP fetch of {url}")
+        except Exception as e:
+            logger.warning("HTTP fetch failed for %s: %s", url, e)
+            self.errors += 1
+            self.fallbacks += 1
+            incr('retries', site=site, reason='http_error')
+            return None
+
+        if needs_browser(status, html, required_marker):
+            logger.info("HTTP response for %s needs a browser (status %s), falling back to Playwright.", url, status)
+            self.fallbacks += 1
+            if html and is_captcha_page(html):
+                incr('captchas', site=site)
+            incr('retries', site=site, reason='needs_browser')
+            return None
+
+        self.served += 1
+        incr('pages', site=site, source='http')
+        if self.cache is not None:
+            self.cache.put(url, html)
+        return html
+
+    # One paced request; raises Throttled / TransientFetchError for responses worth retrying
+    async def _request(self, url, site):
+        await self.limiter.acquire(url)
+        self.requests += 1
+        with span('goto', site=site, source='http'):
+            async with self.session.get(url, headers={'User-Agent': get_random_user_agent()}) as response:
+                status = response.status
+                html = await response.text(errors='replace')
+        # A CAPTCHA slows the host down but is not retried over HTTP; the browser gets the page instead
+        captcha = bool(html) and is_captcha_page(html)
+        if self.limiter.record(url, status, captcha=captcha) and not captcha:
+            raise Throttled(f"HTTP {status}")
+        if status >= 500:
+            raise TransientFetchError(f"HTTP {status}")
+        return status, html
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'served': self.served,
+            'fallbacks': self.fallbacks,
+            'errors': self.errors,
+        }
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.enabled:
+            logger.info("HTTP fetcher closed: %s", self.stats())
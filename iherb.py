@@ -1,275 +1,649 @@
+from contextlib import AsyncExitStack
 from datetime import datetime
 
-from utils import analyze_sentiment
+from utils import score_reviews_async, review_hash, SentimentAggregate
 from utils import get_random_user_agent
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
+from browser_pool import BrowserPool, DEFAULT_POOL_SIZE, playwright_session, launch_browser
+from concurrency import gather_bounded, crawl_listing_pages, maybe_await, OrderedEmitter
+from concurrency import DEFAULT_MAX_CONCURRENCY, DEFAULT_PER_HOST_LIMIT, DEFAULT_LISTING_CONCURRENCY
+from http_fetcher import HttpFetcher
+from page_cache import get_page_cache, PageCacheMiss
+from checkpoint import open_checkpoint, DEFAULT_COMMIT_EVERY
+from sharding import run_sharded
+from incremental import ReviewWatermark, merge_new_reviews, sentiment_fields
+from export import open_export_file, with_format_extension, check_file_format, IHERB_COLUMNS, DEFAULT_FILE_FORMAT
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from parsers import get_parser
+from page_profile import PageMetrics, get_page_profile
+from metrics import span, incr, RunScope
+from rate_limiter import get_rate_limiter, retry_with_backoff, Throttled, THROTTLE_STATUSES
 import pandas as pd
 import nest_asyncio
-import traceback
-import os
+import asyncio
 import math  # Import math for floor and ceil functions
+import logging
 import gc
 
 nest_asyncio.apply()
 
+logger = logging.getLogger(__name__)
+
+# Review stage checkpoint (resume state) and the export written at the end of the stage (with the extension
+# of the export format, e.g. iherb_product_data_reviews.parquet)
+IHERB_CHECKPOINT_PATH = "iherb_product_data_reviews.sqlite"
+IHERB_REVIEWS_CSV = "iherb_product_data_reviews.csv"
+# Product list written by the listing stage
+IHERB_PRODUCTS_CSV = "iherb_product_data.csv"
+
 # Function to save data when an error occurs or periodically
 def save_data_to_file(data, file_name="scraped_data.csv"):
     df = pd.DataFrame(data)
-    df.to_csv(file_name, index=False)
-    print(f"Data saved to {file_name}")
+    with span('persist', site='iherb'):
+        df.to_csv(file_name, index=False)
+    logger.info("Data saved to %s", file_name)
+
 
+# Class list of one product cell in the iHerb grid
+PRODUCT_CELL_CLASS = 'product-cell-container col-xs-12 col-sm-12 col-md-8 col-lg-6'
 
-# Function to scrape with Playwright and BeautifulSoup
-async def scrape_iherb_product_details(url, xpath_query, num_pages):
+
+# Function to parse the iHerb product grid HTML and extract product details; only the product cells are built
+def parse_iherb_product_grid(html, parser=None):
+    parser = parser or get_parser()
     product_list = []
-    # Start Playwright
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=False)  # You can set headless=False to see the browser in action
+    root = parser.parse(html, only=('div', {'class': PRODUCT_CELL_CLASS}))
+    product_divs = parser.select(root, f'div[class="{PRODUCT_CELL_CLASS}"]')
+    logger.debug("product: %s", len(product_divs))
+    for product in product_divs:
+        id_element = parser.select_one(product, 'div[class="product ga-product"]')
+        product_id = parser.attr(id_element, 'id') if id_element is not None else None
+        product_id = product_id.replace('pid_', '') if product_id != None else None # Remove 'pid_' from ID
+
+        product_link = parser.select_one(product, 'a[class="absolute-link product-link"]')
+        product_name = parser.attr(product_link, 'title') if product_link is not None else None
+        product_href = parser.attr(product_link, 'href') if product_link is not None else None
+
+        rating_element = parser.select_one(product, 'a[class="stars scroll-to"]')
+        product_rating = parser.attr(rating_element, 'title') if rating_element is not None else None
+        product_rating = product_rating.split(' - ')[0] if product_rating is not None else None
+
+        # Update starts here: Process the rating as per your instructions
+        if product_rating:
+            try:
+                # Extract the numeric rating value (e.g., 4.6 from "4.6/5")
+                numeric_rating = float(product_rating.split('/')[0])
+
+                # Check the decimal part and round accordingly
+                decimal_part = numeric_rating - int(numeric_rating)
+                if decimal_part > 0.5:
+                    numeric_rating = math.ceil(numeric_rating)
+                else:
+                    numeric_rating = math.floor(numeric_rating)
+            except ValueError:
+                # If conversion fails, set numeric_rating to None
+                numeric_rating = None
+        else:
+            numeric_rating = None
+
+        product_price = parser.select_one(product, 'span.price bdi')
+        product_price = parser.text(product_price, strip=True) if product_price is not None else None
+
+        product_list.append({
+            'Product Name': product_name,
+            'Product Price': product_price,
+            'Product Rating': product_rating,
+            'Label': numeric_rating,
+            "Product ID": product_id,
+            "Product Link": product_href,
+        })
+    return product_list
 
-        try:
-            for page_number in range(num_pages):
-                page_url = f"{url}&p={page_number + 1}"
-                page = await browser.new_page(user_agent=get_random_user_agent())
 
+# Function to scrape the product grid, using plain HTTP first and Playwright only for CAPTCHA / JS-only pages.
+# All `num_pages` grid pages are fetched concurrently (up to `max_concurrency`); the first empty page ends the listing.
+async def scrape_iherb_product_details(url, xpath_query, num_pages, use_http=True, page_profile=None, page_cache=None,
+                                       max_concurrency=DEFAULT_LISTING_CONCURRENCY):
+    page_profile = page_profile or get_page_profile()
+    page_cache = page_cache or get_page_cache()
+    listing_metrics = PageMetrics()
+    product_list = []
+    # Start Playwright
+    async with RunScope('iherb'), playwright_session() as playwright, \
+            HttpFetcher(enabled=use_http, cache=page_cache) as fetcher:
+        browser = None
+        owns_browser = False
+        launch_lock = asyncio.Lock()
+
+        # Launch a visible browser once the HTTP fast path has failed (never the headless warm one); pages share it
+        async def get_browser():
+            nonlocal browser, owns_browser
+            async with launch_lock:
+                if browser is None:
+                    browser, owns_browser = await launch_browser(playwright, headless=False, site='iherb')  # You can set headless=False to see the browser in action
+            return browser
+
+        async def fetch_grid_page(page_number, page_url):
+            html = await fetcher.fetch_html(page_url, required_marker='product-cell-container')
+            if html is not None:
+                with span('parse', site='iherb'):
+                    return parse_iherb_product_grid(html)
+            if page_cache is not None and page_cache.replay:
+                logger.info("Page %s is not in the page cache, skipping it in replay mode.", page_number)
+                return None
+
+            page = await page_profile.new_page(await get_browser(), listing_metrics, user_agent=get_random_user_agent())
+            try:
                 # Navigate to the URL
-                await page.goto(page_url)
+                await page_profile.goto(page, page_url, listing_metrics)
 
                 # Wait for content to load (if necessary, you can use more sophisticated waiting strategies)
-                await page.wait_for_selector('body')
+                with span('wait', site='iherb'):
+                    await page.wait_for_selector('body')
 
                 # Extract content via XPath
                 element = page.locator(xpath_query)
-                print("Element:", await element.count())
-
-                if await element.count() > 0:
-                    # Extract the HTML content of the first matching element
+                element_count = await element.count()
+                logger.debug("Element: %s", element_count)
+                if element_count == 0:
+                    # No grid (a CAPTCHA or an unexpected layout): skip the page rather than end the listing
+                    return None
+
+                # Extract the HTML content of the first matching element
+                with span('extract', site='iherb'):
                     element_html = await element.first.inner_html()
-
-                    # Parse the HTML with BeautifulSoup
-                    soup = BeautifulSoup(element_html, 'html.parser')
-                    product_divs = soup.find_all('div', class_='product-cell-container col-xs-12 col-sm-12 col-md-8 col-lg-6')
-                    print("product:", product_divs.__len__())
-                    for product in product_divs:
-                        id_element = product.find('div', class_='product ga-product')
-                        product_id = id_element['id'] if id_element else None
-                        product_id = product_id.replace('pid_', '') if product_id != None else None # Remove 'pid_' from ID
-
-                        product_link = product.find('a', class_='absolute-link product-link')
-                        product_name = product_link['title'] if product_link else None
-                        product_href = product_link['href'] if product_link else None
-
-                        rating_element = product.find('a', class_='stars scroll-to')
-                        product_rating = rating_element['title'] if rating_element else None
-                        product_rating = product_rating.split(' - ')[0] if product_rating is not None else None
-
-                        # Update starts here: Process the rating as per your instructions
-                        if product_rating:
-                            try:
-                                # Extract the numeric rating value (e.g., 4.6 from "4.6/5")
-                                numeric_rating = float(product_rating.split('/')[0])
-
-                                # Check the decimal part and round accordingly
-                                decimal_part = numeric_rating - int(numeric_rating)
-                                if decimal_part > 0.5:
-                                    numeric_rating = math.ceil(numeric_rating)
-                                else:
-                                    numeric_rating = math.floor(numeric_rating)
-                            except ValueError:
-                                # If conversion fails, set numeric_rating to None
-                                numeric_rating = None
-                        else:
-                            numeric_rating = None
-
-                        product_price = product.find('span', class_='price')
-                        product_price = product_price.find('bdi').get_text(strip=True) if product_price and product_price.find('bdi') else None
-
-                        product_list.append({
-                            'Product Name': product_name,
-                            'Product Price': product_price,
-                            'Product Rating': product_rating,
-                            'Label': numeric_rating,
-                            "Product ID": product_id,
-                            "Product Link": product_href,
-                        })
+            finally:
                 await page.close()
-        except Exception as e:
-            print(f"Error occurred while scraping product details: {str(e)}")
-            traceback.print_exc()
-
-            # Save collected data when an error occurs
-            save_data_to_file(product_list, "partial_product_data.csv")
+            if page_cache is not None:
+                page_cache.put(page_url, element_html)
+            with span('parse', site='iherb'):
+                return parse_iherb_product_grid(element_html)
 
+        page_urls = [f"{url}&p={page_number + 1}" for page_number in range(num_pages)]
+        try:
+            product_list = await crawl_listing_pages(page_urls, fetch_grid_page,
+                                                     key_of=lambda product: product['Product ID'],
+                                                     max_concurrency=max_concurrency)
+        except Exception:
+            logger.exception("Error occurred while scraping product details")
         finally:
             # Close the browser
-            await page.close()
-            await browser.close()
+            if browser is not None:
+                if owns_browser:
+                    await browser.close()
+                logger.info("Listing pages (%s profile): %s", page_profile.name, listing_metrics.summary())
 
-    save_data_to_file(product_list, "iherb_product_data.csv")
+    save_data_to_file(product_list, IHERB_PRODUCTS_CSV)
     return product_list
 
-async def fetch_iherb_reviews(playwright, product_name, product_id, product_href, num_review_pages=1):
-    if product_href is None or product_id is None:
-        print(f"Skipping product without a valid link: {product_name}")
-        return []
-
-    browser = await playwright.chromium.launch(headless=True)
-    context = await browser.new_context(viewport={'width': 3840, 'height': 2160})
-    page = await context.new_page()
-    await page.set_extra_http_headers({
-    'User-Agent': f'{get_random_user_agent()}'
+# Selectors used by both review extraction modes
+REVIEW_BLOCK_SELECTOR = 'div#reviews div.MuiBox-root.css-1v71s4n'
+READ_MORE_SELECTOR = 'span.MuiTypography-root.MuiTypography-body2.css-ptz5k'
+REVIEW_DATE_SELECTOR = 'span.MuiTypography-root.MuiTypography-body2.css-1fktd33, span[data-testid="review-posted-date"]'
+REVIEW_STARS_SELECTOR = 'ul[data-testid="review-rating"] li svg path[fill="#FAC627"]'
+REVIEW_TEXT_SELECTOR = 'span.__react-ellipsis-js-content, div.review-full-text'
+CAPTCHA_SELECTOR = 'div#px-captcha-wrapper'
+# How long to wait for expanded reviews to render their full text (ms)
+REVIEW_EXPAND_TIMEOUT = 5000
+# How long a review page may take to render its reviews (ms) before it counts as having none
+REVIEWS_WAIT_TIMEOUT = 10000
+
+# Removes the CAPTCHA overlay, marks every truncated review and clicks all "Read more" buttons at once
+EXPAND_REVIEWS_JS = """
+([blockSelector, readMoreSelector, captchaSelector]) => {
+    const captcha = document.querySelector(captchaSelector);
+    if (captcha) {
+        captcha.remove();
+    }
+    let expanded = 0;
+    for (const block of document.querySelectorAll(blockSelector)) {
+        const button = block.querySelector(readMoreSelector);
+        if (button) {
+            block.setAttribute('data-reviewpal-expanding', '1');
+            button.click();
+            expanded += 1;
+        }
+    }
+    return {captcha: !!captcha, expanded: expanded};
+}
+"""
+
+# True once every review that was expanded shows its full text (or lost its "Read more" button)
+EXPANDED_REVIEWS_READY_JS = """
+([readMoreSelector]) => Array.from(document.querySelectorAll('[data-reviewpal-expanding]')).every(
+    (block) => block.querySelector('div.review-full-text') || !block.querySelector(readMoreSelector)
+)
+"""
+
+# Pulls date, filled star count and text for every review block on the page in a single call
+EXTRACT_REVIEWS_JS = """
+([blockSelector, dateSelector, starsSelector, textSelector]) => Array.from(
+    document.querySelectorAll(blockSelector)
+).map((block) => {
+    const date = block.querySelector(dateSelector);
+    const text = block.querySelector(textSelector);
+    return {
+        date: date ? date.textContent : null,
+        stars: block.querySelectorAll(starsSelector).length,
+        text: text ? text.textContent : null,
+    };
 })
+"""
 
-    reviews = []
-    dates = []
-    stars_list = []
-    for page_number in range(num_review_pages):
-        print(f"Fetching reviews for: {product_name}({page_number + 1}/{num_review_pages} pages)...)")
-        url = product_href.replace('iherb.com/pr', 'iherb.com/r')+f'?sort=6&isshowtranslated=true&p={page_number+1}'
-        await page.goto(url)
-        try:
-            await page.wait_for_selector('#reviews', timeout=2000)
-        except Exception:
-            print(f"No reviews found for {product_name} on page {page_number + 1}.")
-            return  ["No Reviews"], None, None
-        # Locate the review container
-        review_blocks = page.locator('div#reviews div.MuiBox-root.css-1v71s4n')
-
-        # Get the number of reviews on the page
-        review_count = await review_blocks.count()
-        if review_count == 0:
-            return  ["No Reviews"], None, None
-
-        # Loop through each review block
-        for i in range(review_count):
-            review = review_blocks.nth(i)
-
-            # Check if the "Read more" button exists in this specific review block
-            read_more_button = review.locator('span.MuiTypography-root.MuiTypography-body2.css-ptz5k')
-            if await read_more_button.count() > 0:
-                # Check if the CAPTCHA is present
-                captcha_present = await page.locator('#px-captcha-wrapper').count()
-                if captcha_present > 0:
-                    print(f"CAPTCHA detected on {product_name}.")
-                    captcha_div = 'div#px-captcha-wrapper'
-                    await page.evaluate(f'document.querySelector("{captcha_div}").remove();')
-
-
-                # Attempt to click the "Read more" button with force
-                try:
-                    await read_more_button.click(force=True)
-                except Exception as e:
-                    print(f"Failed to click 'Read more' for {product_name}: {str(e)}")
-                    continue  # Skip this review if the click fails
-
-                # Optionally, wait for the full review text to load
-                await page.wait_for_timeout(1000)  # Adjust timeout based on loading speed
-
-            date_element = review.locator(
-                'span.MuiTypography-root.MuiTypography-body2.css-1fktd33, span[data-testid="review-posted-date"]')
-
-            # Ensure we await both `count()` and `text_content()`
-            if await date_element.count() > 0:
-                date_text = await date_element.text_content()
-            else:
-                date_text = None
-
-            if date_text is not None:
-                date_part = date_text.replace("Posted on ", "").strip()
-                parsed_date = datetime.strptime(date_part, "%b %d, %Y")
-                formatted_date = parsed_date.strftime("%Y-%m-%d")
-            else:
-                formatted_date = None
-
-            stars = review.locator('ul[data-testid="review-rating"] li svg path[fill="#FAC627"]')
-            # Count the number of filled stars
 
-            num_stars = await stars.count() if await stars.count() > 0 else 0
+# Function to convert "Posted on Mar 5, 2024" into "2024-03-05"
+def format_review_date(date_text):
+    if date_text is None:
+        return None
+    date_part = date_text.replace("Posted on ", "").strip()
+    parsed_date = datetime.strptime(date_part, "%b %d, %Y")
+    return parsed_date.strftime("%Y-%m-%d")
 
-            # Append the review date and star rating
-            dates.append(formatted_date)
-            stars_list.append(num_stars)
-            # Now extract the full review text (whether expanded or not)
-            review_text_element = review.locator('span.__react-ellipsis-js-content, div.review-full-text')
-            review_text = await review_text_element.text_content() if await review_text_element.count() > 0 else "No Review Text"
 
-            reviews.append(review_text.strip())
-    await page.close()
-    await context.close()
-    await browser.close()
-    return reviews, dates, stars_list
+# Bulk extraction: expand all truncated reviews together, wait for them to render, then read the whole page
+# in one page.evaluate round trip
+async def extract_iherb_reviews_bulk(page, product_name):
+    expand_result = await page.evaluate(EXPAND_REVIEWS_JS, [REVIEW_BLOCK_SELECTOR, READ_MORE_SELECTOR, CAPTCHA_SELECTOR])
+    if expand_result['captcha']:
+        incr('captchas', site='iherb')
+        get_rate_limiter().record(page.url, captcha=True)
+        logger.warning("CAPTCHA detected on %s.", product_name)
 
+    if expand_result['expanded'] > 0:
+        try:
+            with span('wait', site='iherb'):
+                await page.wait_for_function(EXPANDED_REVIEWS_READY_JS, arg=[READ_MORE_SELECTOR],
+                                             timeout=REVIEW_EXPAND_TIMEOUT)
+        except Exception:
+            logger.warning("Timed out waiting for expanded reviews of %s, using the text available.", product_name)
+
+    return await page.evaluate(EXTRACT_REVIEWS_JS, [REVIEW_BLOCK_SELECTOR, REVIEW_DATE_SELECTOR,
+                                                    REVIEW_STARS_SELECTOR, REVIEW_TEXT_SELECTOR])
+
+
+# Per-locator extraction: expand and read each review block separately
+async def extract_iherb_reviews_per_locator(page, product_name):
+    review_blocks = page.locator(REVIEW_BLOCK_SELECTOR)
+    records = []
+
+    # Loop through each review block
+    for i in range(await review_blocks.count()):
+        review = review_blocks.nth(i)
+
+        # Check if the "Read more" button exists in this specific review block
+        read_more_button = review.locator(READ_MORE_SELECTOR)
+        if await read_more_button.count() > 0:
+            # Check if the CAPTCHA is present
+            captcha_present = await page.locator(CAPTCHA_SELECTOR).count()
+            if captcha_present > 0:
+                incr('captchas', site='iherb')
+                get_rate_limiter().record(page.url, captcha=True)
+                logger.warning("CAPTCHA detected on %s.", product_name)
+                await page.evaluate(f'document.querySelector("{CAPTCHA_SELECTOR}").remove();')
+
+            # Attempt to click the "Read more" button with force
+            try:
+                await read_more_button.click(force=True)
+            except Exception as e:
+                logger.warning("Failed to click 'Read more' for %s: %s", product_name, e)
+                continue  # Skip this review if the click fails
+
+            # Wait for the full review text to render instead of sleeping a fixed time
+            try:
+                review_handle = await review.element_handle()
+                with span('wait', site='iherb'):
+                    await page.wait_for_function(
+                        "([block, readMoreSelector]) => block.querySelector('div.review-full-text')"
+                        " || !block.querySelector(readMoreSelector)",
+                        arg=[review_handle, READ_MORE_SELECTOR], timeout=REVIEW_EXPAND_TIMEOUT)
+            except Exception:
+                logger.warning("Timed out waiting for the expanded review of %s.", product_name)
+
+        date_element = review.locator(REVIEW_DATE_SELECTOR)
+        date_text = await date_element.text_content() if await date_element.count() > 0 else None
+
+        # Count the number of filled stars
+        num_stars = await review.locator(REVIEW_STARS_SELECTOR).count()
+
+        # Now extract the full review text (whether expanded or not)
+        review_text_element = review.locator(REVIEW_TEXT_SELECTOR)
+        review_text = await review_text_element.text_content() if await review_text_element.count() > 0 else None
+
+        records.append({'date': date_text, 'stars': num_stars, 'text': review_text})
+    return records
+
+
+# Function to read the reviews out of a saved review page (same records as EXTRACT_REVIEWS_JS)
+def parse_iherb_review_page(html, parser=None):
+    parser = parser or get_parser()
+    root = parser.parse(html, only=('div', {'id': 'reviews'}))
+    records = []
+    for block in parser.select(root, REVIEW_BLOCK_SELECTOR):
+        date = parser.select_one(block, REVIEW_DATE_SELECTOR)
+        text = parser.select_one(block, REVIEW_TEXT_SELECTOR)
+        records.append({
+            'date': parser.text(date) if date is not None else None,
+            'stars': len(parser.select(block, REVIEW_STARS_SELECTOR)),
+            'text': parser.text(text) if text is not None else None,
+        })
+    return records
+
+
+# Function to load one review page into `page`; returns False when the page rendered without reviews and raises
+# Throttled when the site answered with a throttling status, or with a CAPTCHA in place of the reviews
+async def load_iherb_review_page(pool, page, url):
+    response = await pool.goto(page, url)
+    if response is not None and response.status in THROTTLE_STATUSES:
+        raise Throttled(f"HTTP {response.status}")
+    try:
+        with span('wait', site='iherb'):
+            await page.wait_for_selector('#reviews', timeout=REVIEWS_WAIT_TIMEOUT)
+    except PlaywrightTimeoutError:
+        if await page.locator(CAPTCHA_SELECTOR).count() > 0:
+            incr('captchas', site='iherb')
+            get_rate_limiter().record(url, captcha=True)
+            raise Throttled(f"CAPTCHA on {url}")
+        return False
+    return True
+
+
+# Review pages found in the page cache are parsed directly; a browser page is only borrowed for the others.
+# Pages are read newest first (sort=6); with a `watermark` (incremental mode) reading stops at the first review
+# it has seen, and only the newer reviews are returned (empty lists when there are none).
+# With `aggregate` (a SentimentAggregate), every page is scored as soon as it was extracted, while the next one
+# loads, and added to it.
+async def fetch_iherb_reviews(pool, product_name, product_id, product_href, num_review_pages=1, bulk_extract=True,
+                              cache=None, watermark=None, aggregate=None):
+    if product_href is None or product_id is None:
+        logger.warning("Skipping product without a valid link: %s", product_name)
+        return []
 
-async def scrape_iherb_product_reviews(product_list, num_review_pages):
-    if os.path.exists("iherb_product_data_reviews.csv"):
-        print("Product Data file found. Loading existing product data...")
-        product_list_existing = pd.read_csv("iherb_product_data_reviews.csv").to_dict('records')
+    reviews = []
+    dates = []
+    stars_list = []
+    scoring = []
+
+    async def score_page(texts, stars):
+        with span('score', site='iherb'):
+            return SentimentAggregate().add_many(await score_reviews_async(texts), stars)
+
+    try:
+        async with AsyncExitStack() as stack:
+            page = None
+            for page_number in range(num_review_pages):
+                logger.debug("Fetching reviews for: %s(%s/%s pages)...)", product_name, page_number + 1, num_review_pages)
+                url = product_href.replace('iherb.com/pr', 'iherb.com/r')+f'?sort=6&isshowtranslated=true&p={page_number+1}'
+                html = cache.get(url) if cache is not None else None
+                if html is not None:
+                    with span('parse', site='iherb'):
+                        records = parse_iherb_review_page(html)
+                else:
+                    if cache is not None and cache.replay:
+                        raise PageCacheMiss(f"{url} is not in the page cache")
+                    if page is None:
+                        page = await stack.enter_async_context(pool.page())
+                        await page.set_extra_http_headers({
+                            'User-Agent': f'{get_random_user_agent()}'
+                        })
 
-        # Create a set of processed product IDs
-        processed_product_ids = set()
-        for product in product_list_existing:
-            # if 'Reviews' in product and not pd.isna(product['Reviews']):
-            #     processed_product_ids.add(product['Product ID'])
-            if 'Review Dates' in product and not pd.isna(product['Review Dates']):
-                processed_product_ids.add(product['Product ID'])
-    else:
-        product_list_existing = []
-        processed_product_ids = set()
+                    # Throttled and timed-out loads are retried with backoff; a product that still fails is left
+                    # unprocessed for the next run instead of being stored as "No Reviews"
+                    has_reviews = await retry_with_backoff(
+                        lambda: load_iherb_review_page(pool, page, url), retry_on=(Throttled, PlaywrightTimeoutError),
+                        site='iherb', description=f"Review page {page_number + 1} of {product_name}")
+                    if not has_reviews:
+                        logger.info("No reviews found for %s on page %s.", product_name, page_number + 1)
+                        records = []
+                    else:
+                        with span('extract', site='iherb'):
+                            if bulk_extract:
+                                records = await extract_iherb_reviews_bulk(page, product_name)
+                            else:
+                                records = await extract_iherb_reviews_per_locator(page, product_name)
+                        # The page is saved after the reviews were expanded, so the cached copy has their full text
+                        if records and cache is not None:
+                            cache.put(url, await page.content())
+                if not records:
+                    # Past the last review page; without any review at all the product has none (or none new)
+                    if reviews or watermark is not None:
+                        break
+                    return  ["No Reviews"], None, None
+
+                page_start = len(reviews)
+                reached_seen = False
+                for record in records:
+                    review_date = format_review_date(record['date'])
+                    review_text = record['text'] if record['text'] is not None else "No Review Text"
+                    review_text = review_text.strip()
+                    if watermark is not None and watermark.is_seen(review_hash(review_text), review_date):
+                        logger.debug("Reached the reviews of %s stored by an earlier run.", product_name)
+                        reached_seen = True
+                        break
+                    # Append the review date and star rating
+                    dates.append(review_date)
+                    stars_list.append(record['stars'])
+                    reviews.append(review_text)
+                if aggregate is not None and len(reviews) > page_start:
+                    scoring.append(asyncio.ensure_future(score_page(reviews[page_start:], stars_list[page_start:])))
+                if reached_seen:
+                    break
+
+        for page_aggregate in await asyncio.gather(*scoring):
+            aggregate.merge(page_aggregate)
+    finally:
+        for task in scoring:
+            task.cancel()
+    return reviews, dates, stars_list
 
-    product_data_map = {product['Product ID']: product for product in product_list_existing}
 
-    async with async_playwright() as playwright:
-        try:
-            for idx, product in enumerate(product_list):
-                product_name = product['Product Name']
-                product_id = product['Product ID']
-                product_href = product['Product Link']
-                if product_id in processed_product_ids:
-                    print(f"Skipping product {product_name} as reviews are already fetched.")
-                    continue
-
-                print(f"Index: ({idx+1}) Product: {product_name}")
-
-                reviews, dates, stars_list = await fetch_iherb_reviews(playwright, product_name, product_id, product_href, num_review_pages=num_review_pages)
-                sentiment, score = analyze_sentiment(reviews)
-                product.update({
-                    "Summary Sentiment": sentiment,
-                    "Sentiment Score": score,
+# Function to get the path of the reviews export in `export_format`
+def iherb_reviews_path(export_format=DEFAULT_FILE_FORMAT):
+    return with_format_extension(IHERB_REVIEWS_CSV, export_format)
+
+
+# Function to write products (e.g. every checkpointed product) to a file one row at a time
+def export_products(products, file_name, export_format=DEFAULT_FILE_FORMAT):
+    with span('persist', site='iherb'), open_export_file(file_name, IHERB_COLUMNS, export_format) as export_file:
+        for product in products:
+            export_file.write(product)
+    logger.info("Data saved to %s", file_name)
+
+
+# Function to open the review stage checkpoint: a product counts as processed once its review dates were stored
+# (a list, or its repr in a CSV export)
+def open_iherb_checkpoint(commit_every=DEFAULT_COMMIT_EVERY, export_format=DEFAULT_FILE_FORMAT):
+    return open_checkpoint(IHERB_CHECKPOINT_PATH, legacy_path=iherb_reviews_path(export_format),
+                           key_field='Product ID',
+                           is_processed=lambda product: isinstance(product.get('Review Dates'), (list, str)),
+                           commit_every=commit_every)
+
+
+# With `on_product`, every product is passed to it as soon as it is available (already processed products
+# first, then the rest in completion order; with `ordered`, all of them in listing order) and nothing is kept in
+# memory or returned.
+# `commit_every` is the number of products per checkpoint commit (1 when several processes share the checkpoint),
+# and `export_file=False` leaves writing the reviews export (in `export_format`) to the caller.
+# With `incremental`, processed products are not skipped: their review pages are read newest first down to the
+# newest review stored for them, and only the new reviews are scored and added to the stored aggregate.
+async def scrape_iherb_product_reviews(product_list, num_review_pages, pool_size=DEFAULT_POOL_SIZE,
+                                       max_concurrency=DEFAULT_MAX_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                                       bulk_extract=True, progress=None, on_product=None, page_profile=None,
+                                       page_cache=None, commit_every=DEFAULT_COMMIT_EVERY, export_file=True,
+                                       export_format=DEFAULT_FILE_FORMAT, incremental=False, ordered=False):
+    streaming = on_product is not None
+    emitter = OrderedEmitter(on_product) if streaming and ordered else None
+
+    # Function to hand a product (None for one that failed) to the consumer
+    async def emit(idx, record):
+        if emitter is not None:
+            await emitter.emit(idx, record)
+        elif record is not None:
+            await maybe_await(on_product, record)
+
+    page_cache = page_cache or get_page_cache()
+    # Replay mode re-parses and re-scores every product from the cached pages instead of resuming
+    resume = page_cache is None or not page_cache.replay
+    # Resume from the checkpoint
+    checkpoint = open_iherb_checkpoint(commit_every=commit_every, export_format=export_format)
+    if len(checkpoint):
+        logger.info("Checkpoint found. Loading existing product data...")
+    product_data_map = {} if streaming else {str(product['Product ID']): product for product in checkpoint.records()}
+
+    # Keep the output in the original order even though products finish out of order
+    ordered_ids = list(product_data_map)
+    ordered_ids += [pid for pid in dict.fromkeys(str(product['Product ID']) for product in product_list)
+                    if pid not in product_data_map]
+
+    def ordered_products():
+        return [product_data_map[pid] for pid in ordered_ids if pid in product_data_map]
+
+    pending = []
+    for idx, product in enumerate(product_list):
+        if resume and not incremental and checkpoint.is_processed(product['Product ID']):
+            logger.info("Skipping product %s as reviews are already fetched.", product['Product Name'])
+            if streaming:
+                await emit(idx, checkpoint.get(product['Product ID']))
+            continue
+        pending.append((idx, product))
+
+    # Optional progress callback, called as progress(products_done, products_total)
+    products_done = [len(product_list) - len(pending)]
+
+    def report_progress():
+        products_done[0] += 1
+        if progress is not None:
+            progress(products_done[0], len(product_list))
+
+    async with RunScope('iherb'), playwright_session() as playwright, \
+            BrowserPool(playwright, size=pool_size, profile=page_profile) as pool:
+        async def fetch_product_reviews(entry):
+            idx, product = entry
+            product_name = product['Product Name']
+            product_id = product['Product ID']
+            product_href = product['Product Link']
+            logger.debug("Index: (%s) Product: %s", idx + 1, product_name)
+            # Products stored without a watermark (by an older version) are fetched in full once more
+            stored = checkpoint.get(product_id) if resume and checkpoint.is_processed(product_id) else None
+            watermark = ReviewWatermark.from_record(stored)
+
+            # Pages are scored into the aggregate as they arrive; with a watermark only the new reviews are
+            aggregate = SentimentAggregate()
+            try:
+                reviews, dates, stars_list = await fetch_iherb_reviews(pool, product_name, product_id, product_href,
+                                                                       num_review_pages=num_review_pages,
+                                                                       bulk_extract=bulk_extract,
+                                                                       cache=page_cache, watermark=watermark,
+                                                                       aggregate=aggregate)
+            except Exception:
+                # One failing product must not stop the others; it stays unprocessed for the next resume, and a
+                # product re-crawled incrementally keeps what was stored for it
+                logger.exception("Error occurred while fetching reviews for %s", product_name)
+                report_progress()
+                if streaming:
+                    await emit(idx, dict(product, **stored) if stored is not None else None)
+                return None
+
+            if watermark is not None:
+                logger.debug("%s new reviews for %s", len(reviews), product_name)
+                result = merge_new_reviews(stored, product, watermark,
+                                           {"Reviews": reviews, "Review Dates": dates, "Review Stars": stars_list},
+                                           [review_hash(review) for review in reviews], dates, aggregate)
+            else:
+                if dates is None:
+                    # Products without reviews are scored on the "No Reviews" placeholder, as they always were
+                    with span('score', site='iherb'):
+                        aggregate.add_many(await score_reviews_async(reviews))
+                result = dict(product)
+                result.update(sentiment_fields(aggregate))
+                result.update({
                     "Reviews": reviews,
                     "Review Dates": dates,
                     "Review Stars": stars_list
                 })
-                # Update the product data map
-                product_data_map[product_id] = product
-
-                df_updated = pd.DataFrame(list(product_data_map.values()))
-                df_updated.to_csv('iherb_product_data_reviews.csv', index=False)
-                print(f"Data saved to 'iherb_product_data_reviews.csv' after processing {product_name}")
-                del stars_list
-                del dates
-                del sentiment
-                del score
-                del reviews
-                gc.collect()
-
-        except Exception as e:
-            print(f"Error occurred while fetching reviews: {str(e)}")
-            traceback.print_exc()
-            save_data_to_file(product_list, "partial_product_reviews.csv")
-
-    return list(product_data_map.values())
-
-
-async def scrape_iherb_product_reviews_main(url, xpath_query, num_pages, num_review_pages):
-    # Stage 1: Scrape product details
-    if os.path.exists("iherb_product_data.csv"):
-        print("Product Data file found. Loading existing product data...")
-        product_list = pd.read_csv("iherb_product_data.csv").to_dict('records')
-    else:
-        product_list = await scrape_iherb_product_details(url, xpath_query, num_pages)
+                if dates is not None:
+                    result.update(ReviewWatermark.of_reviews(zip(map(review_hash, reviews), dates)).fields())
+            # Append the product to the checkpoint, then either keep it or hand it straight to the consumer
+            with span('persist', site='iherb'):
+                checkpoint.save(product_id, result, processed=watermark is not None or dates is not None)
+            logger.debug("Checkpointed %s", product_name)
+            incr('products', site='iherb')
+            if dates is not None:
+                incr('reviews', len(reviews), site='iherb')
+            del stars_list
+            del dates
+            del reviews
+            gc.collect()
+            report_progress()
+            if streaming:
+                await emit(idx, result)
+            else:
+                product_data_map[str(product_id)] = result
+            return None
 
-    # Stage 2: Scrape product reviews
-    product_list_with_reviews = await scrape_iherb_product_reviews(product_list, num_review_pages)
+        try:
+            await gather_bounded(pending, fetch_product_reviews,
+                                 max_concurrency=max_concurrency, per_host_limit=per_host_limit,
+                                 url_of=lambda entry: entry[1]['Product Link'])
+        except Exception:
+            # A failure outside a product's own fetch (checkpoint, consumer, scoring) ends the run; what is known
+            # so far is kept in the partial file and the checkpoint
+            logger.exception("Error occurred while fetching reviews")
+            save_data_to_file(product_list, "partial_product_reviews.csv")
+            raise
+        finally:
+            checkpoint.flush()
+            # Write the export once at the end instead of after every product
+            if export_file:
+                export_products(checkpoint.iter_records() if streaming else ordered_products(),
+                                iherb_reviews_path(export_format), export_format)
+            checkpoint.close()
+            if page_cache is not None:
+                logger.info("Page cache: %s", page_cache.stats())
+            logger.info("Rate limits: %s", get_rate_limiter().stats())
+
+    return None if streaming else ordered_products()
+
+
+async def scrape_iherb_product_reviews_main(url, xpath_query, num_pages, num_review_pages, pool_size=DEFAULT_POOL_SIZE,
+                                            max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                                            per_host_limit=DEFAULT_PER_HOST_LIMIT, use_http=True, progress=None,
+                                            on_product=None, page_profile=None, page_cache=None, shards=1,
+                                            export_format=DEFAULT_FILE_FORMAT, incremental=False, ordered=False):
+    check_file_format(export_format)
+    page_profile = page_profile or get_page_profile()
+    page_cache = page_cache or get_page_cache()
+    # One run summary for both stages
+    with RunScope('iherb'):
+        # Stage 1: Scrape product details (grid pages still fresh in the page cache are not fetched again)
+        product_list = await scrape_iherb_product_details(url, xpath_query, num_pages, use_http=use_http,
+                                                          page_profile=page_profile, page_cache=page_cache)
+
+        # Stage 2: Scrape product reviews, split by Product ID across `shards` worker processes when asked to
+        if shards > 1:
+            # Create the shared checkpoint (and import a legacy CSV) once, before the workers open it
+            open_iherb_checkpoint(export_format=export_format).close()
+            options = dict(num_review_pages=num_review_pages, pool_size=pool_size, max_concurrency=max_concurrency,
+                           per_host_limit=per_host_limit, export_file=False, export_format=export_format,
+                           incremental=incremental)
+            product_list_with_reviews = await run_sharded('iherb', product_list, shards, options,
+                                                          page_profile=page_profile, page_cache=page_cache,
+                                                          progress=progress, on_product=on_product)
+            # One export for all shards, from the shared checkpoint
+            with open_iherb_checkpoint(export_format=export_format) as checkpoint:
+                export_products(checkpoint.iter_records(), iherb_reviews_path(export_format), export_format)
+        else:
+            product_list_with_reviews = await scrape_iherb_product_reviews(product_list, num_review_pages,
+                                                                           pool_size=pool_size,
+                                                                           max_concurrency=max_concurrency,
+                                                                           per_host_limit=per_host_limit,
+                                                                           progress=progress,
+                                                                           on_product=on_product,
+                                                                           page_profile=page_profile,
+                                                                           page_cache=page_cache,
+                                                                           export_format=export_format,
+                                                                           incremental=incremental,
+                                                                           ordered=ordered)
+    if on_product is not None:
+        return None
 
     df = pd.DataFrame(product_list_with_reviews)
     return df
\ No newline at end of file
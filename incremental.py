@@ -0,0 +1,84 @@
+from utils import SentimentAggregate
+
+# Fields a checkpointed product keeps about the reviews it was scored on; they are not part of the exports
+NEWEST_REVIEW_DATE = 'Newest Review Date'
+NEWEST_REVIEW_KEYS = 'Newest Review Keys'
+REVIEW_COUNT = 'Review Count'
+# Running sentiment of all the reviews a product was scored on (SentimentAggregate.to_dict())
+SENTIMENT_AGGREGATE = 'Sentiment Aggregate'
+
+
+# The newest reviews a product was scored on: their date ("YYYY-MM-DD"), the keys (review id or text hash) of
+# the reviews posted on that date (all of them, or the ones not kept would be counted again on the next run), and how
+# many reviews the stored average covers.
+# Review pages are read newest first; everything from the first review the watermark has seen on is older.
+class ReviewWatermark:
+    def __init__(self, newest_date=None, newest_keys=(), count=0):
+        self.newest_date = newest_date
+        self.newest_keys = frozenset(newest_keys)
+        self.count = count
+
+    # Function to read the watermark of a checkpointed product; None for products stored without one
+    @classmethod
+    def from_record(cls, record):
+        if not record or record.get(REVIEW_COUNT) is None:
+            return None
+        return cls(record.get(NEWEST_REVIEW_DATE), record.get(NEWEST_REVIEW_KEYS) or (), int(record[REVIEW_COUNT]))
+
+    # Function to build the watermark of freshly scored reviews, given as (key, date) pairs newest first
+    @classmethod
+    def of_reviews(cls, reviews):
+        return cls(count=0).advance(reviews)
+
+    def is_seen(self, key, date):
+        if key in self.newest_keys:
+            return True
+        return date is not None and self.newest_date is not None and date < self.newest_date
+
+    # Function to get the watermark after the (key, date) pairs of new reviews were added to the aggregate
+    def advance(self, reviews):
+        reviews = list(reviews)
+        dates = [date for _, date in reviews if date is not None]
+        newest_date = max(dates + ([self.newest_date] if self.newest_date is not None else []), default=None)
+        keys = [key for key, date in reviews if date == newest_date]
+        if newest_date is not None and newest_date == self.newest_date:
+            keys += self.newest_keys
+        return ReviewWatermark(newest_date, keys, self.count + len(reviews))
+
+    def fields(self):
+        return {
+            NEWEST_REVIEW_DATE: self.newest_date,
+            NEWEST_REVIEW_KEYS: sorted(self.newest_keys),
+            REVIEW_COUNT: self.count,
+        }
+
+
+# Function to get the summary fields of a product from the running sentiment of its reviews
+def sentiment_fields(aggregate):
+    sentiment, score = aggregate.summary()
+    return {
+        'Summary Sentiment': sentiment,
+        'Sentiment Score': score,
+        SENTIMENT_AGGREGATE: aggregate.to_dict(),
+    }
+
+
+# Function to get the running sentiment of a checkpointed product. Products stored without one get it back from
+# their average score and review count (without a label distribution).
+def stored_aggregate(record, watermark):
+    if record.get(SENTIMENT_AGGREGATE):
+        return SentimentAggregate.from_dict(record[SENTIMENT_AGGREGATE])
+    return SentimentAggregate(count=watermark.count, total=(record.get('Sentiment Score') or 0) * watermark.count)
+
+
+# Function to fold reviews fetched since `watermark` into a checkpointed product: the new reviews (newest first)
+# go in front of the stored ones in every list field, and only they were scored (`new_aggregate`), which is merged
+# into the stored running sentiment. `keys` and `dates` identify the new reviews for the next watermark.
+def merge_new_reviews(stored, product, watermark, list_fields, keys, dates, new_aggregate):
+    result = dict(stored, **product)
+    if keys:
+        result.update(sentiment_fields(stored_aggregate(stored, watermark).merge(new_aggregate)))
+        for field, values in list_fields.items():
+            result[field] = list(values) + list(stored.get(field) or [])
+    result.update(watermark.advance(zip(keys, dates)).fields())
+    return result
@@ -0,0 +1,309 @@
+from export import open_export_file, check_file_format, with_format_extension, EXPORT_COLUMNS, MIMETYPES
+from metrics import RunRecorder, span
+from startup import get_startup_report, warm_up
+import threading
+import logging
+import sys
+import queue
+import tempfile
+import asyncio
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+# XPath for iHerb product listings
+IHERB_XPATH = '//*[@id="FilteredProducts"]/div[1]/div[2]/div[2]'
+# Number of review pages to scrape per iHerb product
+IHERB_REVIEW_PAGES = 3
+# Number of review pages to scrape per Amazon product
+AMAZON_REVIEW_PAGES = 3
+# Worker processes the review stage of a scrape is sharded across (1 keeps it in the job loop)
+SCRAPE_SHARDS = int(os.environ.get('REVIEWPAL_SHARDS', 1))
+# Set REVIEWPAL_INCREMENTAL=1 to re-read only the reviews posted since a product was last scraped
+INCREMENTAL_RECRAWL = os.environ.get('REVIEWPAL_INCREMENTAL', '0') not in ('', '0')
+# File names offered to the client when downloading a result
+DOWNLOAD_NAMES = {
+    'amazon': 'amazon_products_with_sentiment.csv',
+    'iherb': 'iherb_products_with_sentiment1.csv',
+}
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_QUEUED = 20
+DEFAULT_MAX_FINISHED = 100
+# Products buffered per streaming client before the scrape waits for it to catch up
+STREAM_BUFFER_SIZE = 32
+# Marks the end of a job's product stream
+END_OF_STREAM = object()
+# Jobs of one site that may run at once; iHerb runs share the on-disk product list and checkpoint
+SITE_CONCURRENCY = {'iherb': 1}
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+# Raised when the job queue is already at its maximum depth
+class JobQueueFull(Exception):
+    pass
+
+
+# Function to tell which scraper handles a URL
+def detect_site(url):
+    if 'amazon.com' in url:
+        return 'amazon'
+    if 'iherb.com' in url:
+        return 'iherb'
+    return None
+
+
+# Asynchronous function to run one scrape, passing every finished product to `on_product` (in listing order with
+# `ordered`, otherwise as products finish).
+# The scrapers (pandas, Playwright, parsers) are imported on first use so that importing the app stays fast.
+async def run_scrape(url, pages, on_product, progress=None, ordered=False):
+    site = detect_site(url)
+    if site == 'amazon':
+        from amazon import scrape_amazon_reviews
+        await scrape_amazon_reviews(url, total_pages=pages, review_pages=AMAZON_REVIEW_PAGES, shards=SCRAPE_SHARDS,
+                                    incremental=INCREMENTAL_RECRAWL, progress=progress, on_product=on_product,
+                                    ordered=ordered)
+    elif site == 'iherb':
+        from iherb import scrape_iherb_product_reviews_main
+        await scrape_iherb_product_reviews_main(url, IHERB_XPATH, num_pages=pages, num_review_pages=IHERB_REVIEW_PAGES,
+                                                shards=SCRAPE_SHARDS, incremental=INCREMENTAL_RECRAWL,
+                                                progress=progress, on_product=on_product, ordered=ordered)
+    else:
+        raise ValueError("Invalid URL, please provide a valid Amazon or iHerb URL.")
+
+
+class Job:
+    def __init__(self, url, pages, site, export_format='csv', stream=False):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.pages = pages
+        self.site = site
+        self.export_format = export_format
+        # Streamed jobs pass products on as they finish; the others keep the listing order
+        self.stream = stream
+        self.status = QUEUED
+        self.products_done = 0
+        self.products_total = None
+        self.result_path = None
+        self.error = None
+        # Stage timings and counters of the run, once it finished (metrics.MetricsRegistry.summary)
+        self.summary = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = threading.Event()
+        self.subscribers = []
+
+    @property
+    def key(self):
+        return self.url, self.pages, self.export_format
+
+    @property
+    def download_name(self):
+        return with_format_extension(DOWNLOAD_NAMES[self.site], self.export_format)
+
+    @property
+    def mimetype(self):
+        return MIMETYPES[self.export_format]
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'url': self.url,
+            'pages': self.pages,
+            'format': self.export_format,
+            'status': self.status,
+            'products_done': self.products_done,
+            'products_total': self.products_total,
+            'error': self.error,
+            'summary': self.summary,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+# Background job subsystem: scrapes run on one long-lived event loop in a daemon thread, with a bounded
+# queue, bounded worker concurrency and coalescing of identical in-flight requests.
+class JobManager:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queued=DEFAULT_MAX_QUEUED,
+                 max_finished=DEFAULT_MAX_FINISHED, result_dir=None):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.result_dir = result_dir
+        self._jobs = {}
+        self._in_flight = {}
+        self._finished_order = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._workers = None
+        self._site_limits = None
+
+    # Start the event loop thread (done lazily so importing the app does not spawn threads)
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.result_dir is None:
+                self.result_dir = tempfile.mkdtemp(prefix='reviewpal-jobs-')
+            os.makedirs(self.result_dir, exist_ok=True)
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='reviewpal-jobs', daemon=True)
+            self._thread.start()
+        ready.wait()
+
+    # Start the event loop thread and warm it up in the background (see startup.warm_up); returns the
+    # concurrent future of the warm-up
+    def warm_up(self, **options):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(warm_up(**options), self._loop)
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        # Semaphores have to be created on the loop that uses them
+        self._workers = asyncio.Semaphore(self.max_workers)
+        self._site_limits = {site: asyncio.Semaphore(limit) for site, limit in SITE_CONCURRENCY.items()}
+        ready.set()
+        self._loop.run_forever()
+
+    # Queue a scrape whose result file is written in `export_format` (export.FILE_FORMATS); an identical request
+    # that is still queued or running is returned instead of a new job.
+    # With `stream=True` the job is never coalesced and a queue receiving its products is returned as well.
+    def submit(self, url, pages, stream=False, export_format='csv'):
+        site = detect_site(url)
+        if site is None:
+            raise ValueError("Invalid URL, please provide a valid Amazon or iHerb URL.")
+        check_file_format(export_format)
+        self.start()
+
+        with self._lock:
+            existing = self._in_flight.get((url, pages, export_format))
+            if existing is not None and not stream:
+                return existing, True
+            queued = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"Too many queued jobs ({queued}), try again later.")
+
+            job = Job(url, pages, site, export_format, stream=stream)
+            self._jobs[job.id] = job
+            if not stream:
+                self._in_flight[job.key] = job
+            subscriber = None
+            if stream:
+                subscriber = queue.Queue(maxsize=STREAM_BUFFER_SIZE)
+                job.subscribers.append(subscriber)
+        asyncio.run_coroutine_threadsafe(self._run(job), self._loop)
+        return (job, subscriber) if stream else (job, False)
+
+    # Stop sending products to a streaming client (e.g. after it disconnected)
+    def unsubscribe(self, job, subscriber):
+        with self._lock:
+            if subscriber in job.subscribers:
+                job.subscribers.remove(subscriber)
+
+    # Hand an item to a streaming client without blocking the event loop; waits while its buffer is full
+    async def _publish(self, job, item):
+        for subscriber in list(job.subscribers):
+            while subscriber in job.subscribers:
+                try:
+                    subscriber.put_nowait(item)
+                    break
+                except queue.Full:
+                    await asyncio.sleep(0.05)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job, timeout=None):
+        job.finished.wait(timeout)
+        return job
+
+    async def _run(self, job):
+        site_limit = self._site_limits.get(job.site)
+        try:
+            # The site's own limit is waited for before a worker slot is taken, so a job held back by its site
+            # does not keep jobs for other sites waiting
+            if site_limit is not None:
+                async with site_limit:
+                    async with self._workers:
+                        await self._execute(job)
+            else:
+                async with self._workers:
+                    await self._execute(job)
+        finally:
+            with self._lock:
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+            await self._publish(job, END_OF_STREAM)
+            self._forget_old_jobs(job)
+            job.finished.set()
+
+    async def _execute(self, job):
+        job.status = RUNNING
+        job.started_at = time.time()
+
+        def progress(done, total):
+            job.products_done = done
+            job.products_total = total
+
+        # Rows are appended to the job's own file as products are released (in listing order unless the job is
+        # streamed), so no full result is built in memory
+        result_path = job.result_path = os.path.join(self.result_dir, with_format_extension(job.id, job.export_format))
+
+        first_product_s = None
+
+        async def on_product(product):
+            nonlocal first_product_s
+            if first_product_s is None:
+                first_product_s = time.time() - job.started_at
+            with span('persist', site=job.site):
+                result_file.write(product)
+            await self._publish(job, product)
+
+        run = RunRecorder()
+        try:
+            with run, open_export_file(result_path, EXPORT_COLUMNS[job.site], job.export_format) as result_file:
+                await run_scrape(job.url, job.pages, on_product, progress=progress, ordered=not job.stream)
+            job.status = DONE
+        except Exception as e:
+            logger.exception("Job %s failed: %s", job.id, e)
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            job.summary = run.summary()
+            get_startup_report().record_job(job.site, job.finished_at - job.started_at, first_product_s, job.status)
+
+    # Drop the oldest finished jobs (and their result files) beyond max_finished
+    def _forget_old_jobs(self, job):
+        with self._lock:
+            self._finished_order.append(job.id)
+            expired = self._finished_order[:-self.max_finished] if len(self._finished_order) > self.max_finished else []
+            self._finished_order = self._finished_order[len(expired):]
+            expired_jobs = [self._jobs.pop(job_id) for job_id in expired if job_id in self._jobs]
+        for expired_job in expired_jobs:
+            if expired_job.result_path and os.path.exists(expired_job.result_path):
+                os.remove(expired_job.result_path)
+
+    def shutdown(self):
+        if self._loop is not None and self._loop.is_running():
+            # The warm browser lives on this loop; close it (and its driver) while the loop still runs. Nothing is
+            # imported here: this also runs from atexit, and a browser was only started if browser_pool is loaded.
+            browser_pool = sys.modules.get('browser_pool')
+            if browser_pool is not None:
+                try:
+                    asyncio.run_coroutine_threadsafe(browser_pool.stop_warm_browser(), self._loop).result(timeout=5)
+                except Exception as e:
+                    logger.warning("Failed to stop the warm browser: %s", e)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
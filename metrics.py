@@ -0,0 +1,208 @@
+from contextvars import ContextVar
+import threading
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Set REVIEWPAL_METRICS=0 to turn spans and counters into no-ops
+METRICS_ENABLED = os.environ.get('REVIEWPAL_METRICS', '1') not in ('', '0')
+
+# Stages a scrape is broken into (plus the app's start-up phases, see startup.py)
+STAGES = ('launch', 'goto', 'wait', 'extract', 'parse', 'score', 'persist', 'request', 'startup')
+# Upper bounds (seconds) of the Prometheus histogram buckets for stage timings
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Counters and their help text
+COUNTERS = {
+    'pages': 'Pages loaded, by site and source (http, browser, cache)',
+    'products': 'Products scraped',
+    'reviews': 'Reviews collected',
+    'captchas': 'CAPTCHA / bot-check pages seen',
+    'retries': 'Retried fetches (including HTTP fast-path fallbacks to the browser)',
+}
+
+# Run currently being recorded in this context (asyncio tasks inherit it)
+_current_run = ContextVar('reviewpal_run', default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+# Aggregated stage timings and counters; one process-wide registry plus one per recorded run
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        # (stage, labels) -> [count, total seconds, max seconds, bucket counts]
+        self.stages = {}
+        # (name, labels) -> value
+        self.counters = {}
+
+    def observe(self, stage, seconds, labels=()):
+        with self._lock:
+            entry = self.stages.get((stage, labels))
+            if entry is None:
+                entry = self.stages[(stage, labels)] = [0, 0.0, 0.0, [0] * len(STAGE_BUCKETS)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            for index, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    entry[3][index] += 1
+
+    def incr(self, name, amount=1, labels=()):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    # JSON-friendly summary: per-stage totals and per-counter totals with their label breakdown
+    def summary(self):
+        with self._lock:
+            stages = {}
+            for (stage, _), (count, total, longest, _) in self.stages.items():
+                entry = stages.setdefault(stage, {'count': 0, 'total_s': 0.0, 'max_ms': 0.0})
+                entry['count'] += count
+                entry['total_s'] += total
+                entry['max_ms'] = max(entry['max_ms'], 1000 * longest)
+            counters = {}
+            for (name, labels), value in self.counters.items():
+                entry = counters.setdefault(name, {'total': 0, 'by_label': {}})
+                entry['total'] += value
+                if labels:
+                    label_text = ','.join(f'{key}={value}' for key, value in labels)
+                    entry['by_label'][label_text] = entry['by_label'].get(label_text, 0) + value
+
+        for entry in stages.values():
+            entry['mean_ms'] = round(1000 * entry['total_s'] / entry['count'], 2)
+            entry['total_s'] = round(entry['total_s'], 3)
+            entry['max_ms'] = round(entry['max_ms'], 2)
+        return {
+            'wall_seconds': round(time.time() - self.started_at, 3),
+            'stages': stages,
+            'counters': counters,
+        }
+
+    # Prometheus text exposition format (version 0.0.4)
+    def prometheus(self, prefix='reviewpal'):
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                                  for key, value in pairs) + '}'
+
+        with self._lock:
+            stages = sorted(self.stages.items())
+            counters = sorted(self.counters.items())
+
+        lines = [f'# HELP {prefix}_stage_seconds Time spent per scrape stage',
+                 f'# TYPE {prefix}_stage_seconds histogram']
+        for (stage, labels), (count, total, _, buckets) in stages:
+            labels = (('stage', stage),) + labels
+            for bound, bucket_count in zip(STAGE_BUCKETS, buckets):
+                lines.append(f'{prefix}_stage_seconds_bucket{format_labels(labels, [("le", bound)])} {bucket_count}')
+            lines.append(f'{prefix}_stage_seconds_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{format_labels(labels)} {total}')
+            lines.append(f'{prefix}_stage_seconds_count{format_labels(labels)} {count}')
+
+        for name, help_text in COUNTERS.items():
+            lines.append(f'# HELP {prefix}_{name}_total {help_text}')
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            for (counter, labels), value in counters:
+                if counter == name:
+                    lines.append(f'{prefix}_{name}_total{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry behind the /metrics endpoint
+REGISTRY = MetricsRegistry()
+
+
+class _Span:
+    __slots__ = ('stage', 'labels', 'started')
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if METRICS_ENABLED:
+            observe(self.stage, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+# Function to time one stage; use as `with span('goto', site='amazon'):` (also fine around awaits)
+def span(stage, **labels):
+    return _Span(stage, labels)
+
+
+# Function to record a stage timing measured elsewhere (e.g. between Flask request hooks)
+def observe(stage, seconds, **labels):
+    if not METRICS_ENABLED:
+        return
+    labels = _label_key(labels)
+    REGISTRY.observe(stage, seconds, labels)
+    run = _current_run.get()
+    if run is not None:
+        run.observe(stage, seconds, labels)
+
+
+# Function to bump a counter in the process-wide registry and in the run being recorded
+def incr(name, amount=1, **labels):
+    if not METRICS_ENABLED or not amount:
+        return
+    labels = _label_key(labels)
+    REGISTRY.incr(name, amount, labels)
+    run = _current_run.get()
+    if run is not None:
+        run.incr(name, amount, labels)
+
+
+# Records the spans and counters of one run (a scrape or a job) into its own registry, for its JSON summary.
+#   with RunRecorder() as run: ...; run.summary()
+class RunRecorder(MetricsRegistry):
+    def __enter__(self):
+        self._token = _current_run.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_run.reset(self._token)
+        return False
+
+
+# Function to get the run being recorded in this context, if any
+def current_run():
+    return _current_run.get()
+
+
+# Records a scrape as its own run unless one is already being recorded (e.g. by a job), and logs the run
+# summary at the end. Works with both `with` and `async with`, so it can share an `async with` line.
+class RunScope:
+    def __init__(self, name):
+        self.name = name
+        self.run = None
+        self._recorder = None
+
+    def __enter__(self):
+        self.run = current_run()
+        if self.run is None:
+            self._recorder = self.run = RunRecorder().__enter__()
+        return self.run
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._recorder is not None:
+            self._recorder.__exit__(exc_type, exc, tb)
+            logger.info("%s run summary: %s", self.name, json.dumps(self._recorder.summary()))
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
@@ -0,0 +1,181 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from metrics import incr
+import threading
+import hashlib
+import sqlite3
+import atexit
+import time
+import zlib
+import os
+
+# On-disk page cache; set REVIEWPAL_PAGE_CACHE to an empty string to disable it
+PAGE_CACHE_PATH = os.environ.get('REVIEWPAL_PAGE_CACHE', 'page_cache.sqlite')
+# Upper bound of the compressed HTML kept on disk; least recently used pages are evicted beyond it
+PAGE_CACHE_MAX_BYTES = int(float(os.environ.get('REVIEWPAL_PAGE_CACHE_MAX_MB', 512)) * 1024 * 1024)
+# Replay-only mode: serve every page from the cache regardless of age and never touch the network
+PAGE_CACHE_REPLAY = os.environ.get('REVIEWPAL_PAGE_CACHE_REPLAY', '') not in ('', '0')
+
+# Seconds a cached page stays fresh, per site
+DEFAULT_TTLS = {
+    'amazon': 60 * 60,
+    'iherb': 6 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+# Query parameters that only track where a click came from and never change the page
+TRACKING_PARAMS = {'ref', 'ref_', 'qid', 'crid', 'sprefix', 'sr', 'dib', 'dib_tag', '_encoding', 'content-id'}
+TRACKING_PARAM_PREFIXES = ('utm_', 'pf_rd_', 'pd_rd_')
+
+
+# Raised in replay-only mode when a page was never cached
+class PageCacheMiss(Exception):
+    pass
+
+
+# Function to normalize a URL so equivalent links share one cache entry: lower-case scheme and host,
+# no fragment, no tracking parameters or Amazon "/ref=" path segments, sorted query
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    path = '/'.join(segment for segment in parts.path.split('/') if not segment.startswith('ref='))
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key not in TRACKING_PARAMS and not key.startswith(TRACKING_PARAM_PREFIXES))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path or '/', urlencode(query), ''))
+
+
+# Function to build the cache key of a page from its normalized URL
+def page_key(url):
+    return hashlib.blake2b(normalize_url(url).encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Function to tell which site's TTL applies to a URL
+def site_of(url):
+    host = urlsplit(url).netloc.lower()
+    for site in DEFAULT_TTLS:
+        if site in host:
+            return site
+    return None
+
+
+# Content-addressed cache of fetched HTML in SQLite: zlib-compressed pages keyed by normalized URL,
+# a per-site TTL and least-recently-used eviction once the compressed size passes `max_bytes`.
+class PageCache:
+    def __init__(self, path, max_bytes=PAGE_CACHE_MAX_BYTES, ttls=None, default_ttl=DEFAULT_TTL, replay=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.default_ttl = default_ttl
+        self.replay = replay
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " html BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+        self._db.commit()
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        # Access times of cache hits not written yet; put() and close() write them in one batch
+        self._touched = {}
+
+        # Counters exposed through stats()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def ttl_for(self, url):
+        return self.ttls.get(site_of(url), self.default_ttl)
+
+    # Cached HTML of a page, or None when it is missing or stale (stale pages are still served in replay mode)
+    def get(self, url):
+        key = page_key(url)
+        with self._lock:
+            row = self._db.execute("SELECT fetched_at, html FROM pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            fetched_at, html = row
+            if not self.replay and time.time() - fetched_at > self.ttl_for(url):
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._touched[key] = time.time()
+            self.hits += 1
+        incr('pages', site=site_of(url), source='cache')
+        return zlib.decompress(html).decode('utf-8')
+
+    def put(self, url, html):
+        if self.replay or not html:
+            return
+        data = zlib.compress(html.encode('utf-8'), 6)
+        now = time.time()
+        key = page_key(url)
+        with self._lock:
+            self._write_access_times()
+            old = self._db.execute("SELECT size FROM pages WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO pages (key, url, fetched_at, accessed_at, size, html) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (key, normalize_url(url), now, now, len(data), data))
+            self.total_bytes += len(data) - (old[0] if old else 0)
+            self.stores += 1
+            self._evict()
+            self._db.commit()
+
+    # Write the access times of the hits since the last write, so eviction sees them (caller holds the lock)
+    def _write_access_times(self):
+        if self._touched:
+            self._db.executemany("UPDATE pages SET accessed_at = ? WHERE key = ?",
+                                 [(accessed_at, key) for key, accessed_at in self._touched.items()])
+            self._touched.clear()
+
+    # Drop least recently used pages until the cache fits in max_bytes again (caller holds the lock)
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM pages ORDER BY accessed_at LIMIT 50").fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM pages WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.evictions += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'bytes': self.total_bytes,
+            'replay': self.replay,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._write_access_times()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+_page_cache = None
+
+
+# Function to get the shared page cache (None when REVIEWPAL_PAGE_CACHE is empty)
+def get_page_cache():
+    global _page_cache
+    if _page_cache is None and PAGE_CACHE_PATH:
+        _page_cache = PageCache(PAGE_CACHE_PATH, replay=PAGE_CACHE_REPLAY)
+        atexit.register(_page_cache.close)
+    return _page_cache
@@ -0,0 +1,157 @@
+from concurrency import get_host
+from page_cache import site_of
+from metrics import span, incr
+from rate_limiter import get_rate_limiter
+import os
+import time
+
+# Resource types a lean page never needs to read product and review text
+LEAN_BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font')
+# Ad, tracking and telemetry hosts (subdomains included)
+LEAN_BLOCKED_DOMAINS = (
+    'doubleclick.net', 'googlesyndication.com', 'googleadservices.com', 'google-analytics.com',
+    'googletagmanager.com', 'googletagservices.com', 'amazon-adsystem.com', 'adnxs.com', 'criteo.com',
+    'criteo.net', 'facebook.net', 'scorecardresearch.com', 'quantserve.com', 'hotjar.com', 'bat.bing.com',
+    'taboola.com', 'outbrain.com', 'nr-data.net', 'fls-na.amazon.com', 'unagi.amazon.com',
+)
+# Resource types that are never blocked (the page itself)
+ALWAYS_ALLOWED_RESOURCE_TYPES = ('document',)
+
+SMALL_VIEWPORT = {'width': 1280, 'height': 800}
+LARGE_VIEWPORT = {'width': 3840, 'height': 2160}
+
+
+# Function to check whether a host is one of `domains` or a subdomain of one
+def host_matches(host, domains):
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+# Per-page request interception and navigation settings applied to every context the scrapers create.
+# A request is let through if its host is on `allow_domains` or its type is on `allow_resource_types`;
+# otherwise it is aborted when its type is on `block_resource_types` or its host is on `block_domains`.
+class PageProfile:
+    def __init__(self, name, block_resource_types=(), block_domains=(), allow_resource_types=ALWAYS_ALLOWED_RESOURCE_TYPES,
+                 allow_domains=(), viewport=SMALL_VIEWPORT, wait_until='domcontentloaded'):
+        self.name = name
+        self.block_resource_types = frozenset(block_resource_types)
+        self.block_domains = tuple(domain.lower() for domain in block_domains)
+        self.allow_resource_types = frozenset(allow_resource_types)
+        self.allow_domains = tuple(domain.lower() for domain in allow_domains)
+        self.viewport = viewport
+        self.wait_until = wait_until
+
+    @property
+    def intercepts(self):
+        return bool(self.block_resource_types or self.block_domains)
+
+    def should_block(self, resource_type, url):
+        host = get_host(url) or ''
+        if host_matches(host, self.allow_domains) or resource_type in self.allow_resource_types:
+            return False
+        return resource_type in self.block_resource_types or host_matches(host, self.block_domains)
+
+    # Options for browser.new_context / browser.new_page; explicit options win over the profile
+    def context_options(self, **options):
+        if self.viewport is not None:
+            options.setdefault('viewport', self.viewport)
+        return options
+
+    # Install the request filter on a context or page (both support route())
+    async def apply(self, target, metrics=None):
+        if not self.intercepts:
+            return
+
+        async def handle_route(route, request):
+            if self.should_block(request.resource_type, request.url):
+                if metrics is not None:
+                    metrics.blocked += 1
+                await route.abort()
+            else:
+                await route.continue_()
+
+        await target.route('**/*', handle_route)
+
+    # Function to open a standalone page (outside the browser pool) with this profile applied
+    async def new_page(self, browser, metrics=None, **options):
+        page = await browser.new_page(**self.context_options(**options))
+        await self.apply(page, metrics)
+        if metrics is not None:
+            metrics.track(page)
+        return page
+
+    # Navigate with the profile's wait condition once the host's rate limit allows it, feed the response
+    # status back into the limiter and record the load time
+    async def goto(self, page, url, metrics=None, **options):
+        options.setdefault('wait_until', self.wait_until)
+        site = site_of(url)
+        limiter = get_rate_limiter()
+        await limiter.acquire(url)
+        started = time.perf_counter()
+        with span('goto', site=site, source='browser'):
+            response = await page.goto(url, **options)
+        limiter.record(url, response.status if response is not None else None)
+        incr('pages', site=site, source='browser')
+        if metrics is not None:
+            metrics.record_load(time.perf_counter() - started)
+        return response
+
+
+# Lean profile: no images, media, fonts, ads or trackers, small viewport, return at DOMContentLoaded
+LEAN_PROFILE = PageProfile('lean', block_resource_types=LEAN_BLOCKED_RESOURCE_TYPES, block_domains=LEAN_BLOCKED_DOMAINS)
+# Full profile: what the scrapers used to load, kept as the "before" side of measurements
+FULL_PROFILE = PageProfile('full', viewport=LARGE_VIEWPORT, wait_until='load')
+
+PAGE_PROFILES = {
+    'lean': LEAN_PROFILE,
+    'full': FULL_PROFILE,
+}
+
+
+# Function to get a page profile by name (falls back to REVIEWPAL_PAGE_PROFILE, then the lean profile)
+def get_page_profile(name=None):
+    name = name or os.environ.get('REVIEWPAL_PAGE_PROFILE') or 'lean'
+    if name not in PAGE_PROFILES:
+        raise ValueError(f"Unknown page profile '{name}', expected one of {tuple(PAGE_PROFILES)}")
+    return PAGE_PROFILES[name]
+
+
+# Bytes transferred and load times of the pages opened with a profile
+class PageMetrics:
+    def __init__(self):
+        self.pages = 0
+        self.requests = 0
+        self.blocked = 0
+        self.bytes = 0
+        self.load_seconds = 0.0
+        self.loads = 0
+
+    def track(self, page):
+        self.pages += 1
+        page.on('requestfinished', self._on_request_finished)
+
+    async def _on_request_finished(self, request):
+        self.requests += 1
+        try:
+            sizes = await request.sizes()
+            self.bytes += sizes['responseHeadersSize'] + sizes['responseBodySize']
+        except AttributeError:
+            # Request.sizes() needs Playwright 1.15+; fall back to the declared body length
+            response = await request.response()
+            if response is not None:
+                self.bytes += int(response.headers.get('content-length') or 0)
+        except Exception:
+            pass
+
+    def record_load(self, seconds):
+        self.loads += 1
+        self.load_seconds += seconds
+
+    def summary(self):
+        return {
+            'pages': self.pages,
+            'requests': self.requests,
+            'blocked_requests': self.blocked,
+            'bytes': self.bytes,
+            'bytes_per_page': round(self.bytes / self.pages) if self.pages else 0,
+            'avg_load_ms': round(1000 * self.load_seconds / self.loads, 1) if self.loads else 0.0,
+        }
@@ -0,0 +1,100 @@
+from functools import lru_cache
+from bs4 import BeautifulSoup, SoupStrainer
+import soupsieve
+import os
+
+try:
+    import lxml  # noqa: F401
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    HAVE_SELECTOLAX = True
+except ImportError:
+    HAVE_SELECTOLAX = False
+
+# Backend used when none is requested explicitly; can be overridden with REVIEWPAL_PARSER
+PARSER_ENV_VAR = 'REVIEWPAL_PARSER'
+PARSER_BACKENDS = ('selectolax', 'lxml', 'html.parser')
+
+
+# Function to compile (once) and cache a CSS selector for the BeautifulSoup backends
+@lru_cache(maxsize=256)
+def compile_selector(selector):
+    return soupsieve.compile(selector)
+
+
+# BeautifulSoup backend. `only` restricts tree building to the matching subtrees through a SoupStrainer.
+class SoupParser:
+    def __init__(self, features='html.parser'):
+        self.name = features
+        self.features = features
+
+    def parse(self, html, only=None):
+        if only is not None:
+            tag_name, attrs = only
+            return BeautifulSoup(html, self.features, parse_only=SoupStrainer(tag_name, attrs=attrs or {}))
+        return BeautifulSoup(html, self.features)
+
+    def select(self, node, selector, limit=0):
+        return compile_selector(selector).select(node, limit=limit)
+
+    def select_one(self, node, selector):
+        return compile_selector(selector).select_one(node)
+
+    def attr(self, node, name, default=None):
+        value = node.get(name, default)
+        # BeautifulSoup returns multi-valued attributes (class, rel, ...) as lists
+        return ' '.join(value) if isinstance(value, list) else value
+
+    def text(self, node, strip=False):
+        return node.get_text(strip=True) if strip else node.get_text()
+
+
+# selectolax (lexbor) backend. It parses whole documents fast enough that it has no strainer mode.
+class SelectolaxParser:
+    name = 'selectolax'
+
+    def parse(self, html, only=None):
+        return LexborHTMLParser(html)
+
+    def select(self, node, selector, limit=0):
+        matches = node.css(selector)
+        return matches[:limit] if limit else matches
+
+    def select_one(self, node, selector):
+        return node.css_first(selector)
+
+    def attr(self, node, name, default=None):
+        value = node.attributes.get(name, default)
+        # Valueless attributes (e.g. <a href>) come back as None
+        return '' if value is None and name in node.attributes else value
+
+    def text(self, node, strip=False):
+        return node.text(deep=True, separator='', strip=strip)
+
+
+# Function to check whether a backend can be used in this environment
+def parser_available(name):
+    if name == 'selectolax':
+        return HAVE_SELECTOLAX
+    if name == 'lxml':
+        return HAVE_LXML
+    return name == 'html.parser'
+
+
+# Function to get a (cached) parser backend by name; falls back to the fastest installed one
+@lru_cache(maxsize=None)
+def get_parser(name=None):
+    name = name or os.environ.get(PARSER_ENV_VAR)
+    if name is None:
+        name = next(backend for backend in PARSER_BACKENDS if parser_available(backend))
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend '{name}', expected one of {PARSER_BACKENDS}")
+    if not parser_available(name):
+        raise ImportError(f"Parser backend '{name}' is not installed")
+    if name == 'selectolax':
+        return SelectolaxParser()
+    return SoupParser(name)
@@ -0,0 +1,181 @@
+from concurrency import get_host
+from page_cache import site_of
+from metrics import incr
+import threading
+import asyncio
+import logging
+import random
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Set REVIEWPAL_RATE_LIMIT=0 to send requests as fast as the concurrency limits allow
+RATE_LIMIT_ENABLED = os.environ.get('REVIEWPAL_RATE_LIMIT', '1') not in ('', '0')
+
+# Requests per second per host: the rate each site starts at and the bounds it adapts between.
+# Hosts of other sites are not rate limited.
+SITE_RATES = {
+    'amazon': {'rate': 1.0, 'min_rate': 0.1, 'max_rate': 4.0},
+    'iherb': {'rate': 2.0, 'min_rate': 0.2, 'max_rate': 6.0},
+}
+# Requests a host may receive back to back after being idle
+DEFAULT_BURST = 2
+# Additive increase (requests/s) per clean response and multiplicative decrease per throttled one
+RATE_INCREASE = 0.05
+RATE_DECREASE = 0.5
+# Statuses that mean the site wants us to slow down
+THROTTLE_STATUSES = (429, 503)
+
+# Retries of transient failures: full-jitter exponential backoff, base * 2^attempt capped at BACKOFF_MAX
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_MAX = 30.0  # seconds
+
+
+# Raised when a site answered with a CAPTCHA or a throttling status; retried after a backoff
+class Throttled(Exception):
+    pass
+
+
+# Raised for failures worth retrying as they are (5xx responses, dropped connections)
+class TransientFetchError(Exception):
+    pass
+
+
+# Token bucket of one host. Requests reserve a token and sleep until it is due, so waiting callers are served
+# in order without a lock held across the sleep.
+class HostBucket:
+    def __init__(self, host, rate, min_rate, max_rate, burst=DEFAULT_BURST):
+        self.host = host
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.last_slowdown = 0.0
+
+        # Counters exposed through RateLimiter.stats()
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    # Take one token; returns how many seconds the caller has to wait before sending its request
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        self.requests += 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        self.waited += wait
+        return wait
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+    # Halve the rate and drop the saved-up tokens. Requests that were already in flight report the same
+    # throttling, so the rate is cut at most once per request interval.
+    def slow_down(self):
+        now = time.monotonic()
+        self.throttled += 1
+        if now - self.last_slowdown < max(1.0, 1 / self.rate):
+            return False
+        self.last_slowdown = now
+        self.rate = max(self.min_rate, self.rate * RATE_DECREASE)
+        self.tokens = min(self.tokens, 0.0)
+        return True
+
+
+# Paces requests per host with an adaptive token bucket (AIMD): every clean response raises the host's rate a
+# little up to its maximum, every CAPTCHA or 429/503 halves it down to its minimum.
+class RateLimiter:
+    def __init__(self, site_rates=None, burst=DEFAULT_BURST, enabled=RATE_LIMIT_ENABLED):
+        self.site_rates = dict(SITE_RATES, **(site_rates or {}))
+        self.burst = burst
+        self.enabled = enabled
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        if not self.enabled:
+            return None
+        host = get_host(url)
+        rates = self.site_rates.get(site_of(url)) if host else None
+        if rates is None:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = HostBucket(host, burst=self.burst, **rates)
+            return bucket
+
+    # Wait until a request to the URL's host is allowed
+    async def acquire(self, url):
+        bucket = self.bucket(url)
+        if bucket is None:
+            return
+        with self._lock:
+            wait = bucket.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # Feed a response back into the host's rate; returns True when it was a throttling response
+    def record(self, url, status=None, captcha=False):
+        bucket = self.bucket(url)
+        if bucket is None:
+            return captcha or status in THROTTLE_STATUSES
+        with self._lock:
+            if captcha or status in THROTTLE_STATUSES:
+                if bucket.slow_down():
+                    logger.info("Throttled by %s (%s), slowing down to %.2f requests/s.",
+                                bucket.host, 'CAPTCHA' if captcha else f'HTTP {status}', bucket.rate)
+                return True
+            if status is not None and 200 <= status < 400:
+                bucket.speed_up()
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {host: {
+                'rate': round(bucket.rate, 2),
+                'requests': bucket.requests,
+                'throttled': bucket.throttled,
+                'waited_s': round(bucket.waited, 1),
+            } for host, bucket in self._buckets.items()}
+
+
+# Function to get the delay before retry number `attempt` (0-based), with full jitter
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# Run `operation()` (a coroutine function), retrying up to `retries` times with jittered exponential backoff
+# when it raises one of `retry_on`; the last failure is re-raised.
+async def retry_with_backoff(operation, retries=DEFAULT_RETRIES, retry_on=(Throttled, TransientFetchError),
+                             site=None, description='Request'):
+    attempt = 0
+    while True:
+        try:
+            return await operation()
+        except retry_on as e:
+            if attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            incr('retries', site=site, reason=type(e).__name__)
+            logger.info("%s failed (%s), retry %s/%s in %.1fs.", description, e or type(e).__name__,
+                        attempt + 1, retries, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+_rate_limiter = None
+
+
+# Function to get the process-wide rate limiter shared by the HTTP fetcher and every browser page
+def get_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
@@ -0,0 +1,194 @@
+from concurrency import maybe_await
+from incremental import SENTIMENT_AGGREGATE
+from utils import SentimentAggregate, SENTIMENT_WORKERS, set_sentiment_workers
+import multiprocessing
+import asyncio
+import logging
+import queue
+import zlib
+import os
+
+logger = logging.getLogger(__name__)
+
+# Field each site's products are sharded (and checkpointed) by
+SHARD_KEYS = {
+    'amazon': 'ASIN',
+    'iherb': 'Product ID',
+}
+# Times a crashed shard is restarted on its unfinished products before they are given up for this run
+DEFAULT_SHARD_RESTARTS = 1
+# Seconds between checks for crashed workers while no result arrives
+WORKER_POLL_INTERVAL = 1.0
+
+# Messages sent by the workers: (kind, shard, listing index, record)
+PRODUCT = 'product'
+SHARD_DONE = 'done'
+
+
+# Function to pick the shard of a product key; stable across processes and runs, unlike hash()
+def shard_of(key, shards):
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+# Function to get the review stage of a site (imported here because the site modules import this one)
+def _review_stage(site):
+    if site == 'amazon':
+        from amazon import scrape_amazon_product_reviews
+        return scrape_amazon_product_reviews
+    from iherb import scrape_iherb_product_reviews
+    return scrape_iherb_product_reviews
+
+
+# Entry point of a worker process: runs the review stage of one shard on its own event loop and Playwright
+# instance and sends every finished product back with its position in the listing. The shards split the
+# scoring processes between them instead of each starting one per CPU.
+def _run_shard(site, shard, shards, entries, options, profile_name, cache_spec, results, review_stage=None):
+    logging.basicConfig(level=os.environ.get('REVIEWPAL_LOG_LEVEL', 'INFO').upper(),
+                        format=f'%(asctime)s %(levelname)s shard-{shard} %(name)s: %(message)s')
+    set_sentiment_workers(SENTIMENT_WORKERS // shards)
+    from page_profile import get_page_profile
+    from page_cache import PageCache
+
+    key_field = SHARD_KEYS[site]
+    indexes = {}
+    for index, product in entries:
+        indexes.setdefault(str(product.get(key_field)), []).append(index)
+
+    def on_product(record):
+        pending = indexes.get(str(record.get(key_field)))
+        if pending:
+            results.put((PRODUCT, shard, pending.pop(0), record))
+
+    page_cache = PageCache(cache_spec[0], replay=cache_spec[1]) if cache_spec is not None else None
+    stage = review_stage or _review_stage(site)
+    # Commit every product: the other shards write to the same checkpoint
+    asyncio.run(stage([product for _, product in entries], on_product=on_product,
+                      page_profile=get_page_profile(profile_name), page_cache=page_cache, commit_every=1, **options))
+    if page_cache is not None:
+        page_cache.close()
+    results.put((SHARD_DONE, shard, None, None))
+
+
+# Run the review stage of `products` in `shards` worker processes, split by the hash of each product's key.
+# Every worker has its own event loop, Playwright instance and browser pool; they share the site's checkpoint,
+# so a worker that crashes is restarted on just its unfinished products (at most `restarts` times).
+# Products are returned (or passed to `on_product`) in listing order; products a shard could not finish are
+# left out, as in a single-process run. `options` are keyword arguments of the review stage and must be picklable.
+# `review_stage` replaces the site's own review stage; it has to be a module-level function the workers can import.
+async def run_sharded(site, products, shards, options, page_profile=None, page_cache=None, progress=None,
+                      on_product=None, restarts=DEFAULT_SHARD_RESTARTS, review_stage=None):
+    key_field = SHARD_KEYS[site]
+    entries_by_shard = [[] for _ in range(shards)]
+    for index, product in enumerate(products):
+        entries_by_shard[shard_of(product.get(key_field), shards)].append((index, product))
+
+    # Playwright and SQLite handles do not survive a fork, so workers are spawned fresh
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    profile_name = page_profile.name if page_profile is not None else None
+    cache_spec = (page_cache.path, page_cache.replay) if page_cache is not None else None
+    workers = {}
+    restarts_left = {}
+
+    def start(shard, entries):
+        worker = context.Process(target=_run_shard, name=f'reviewpal-{site}-shard-{shard}', daemon=True,
+                                 args=(site, shard, shards, entries, options, profile_name, cache_spec, results,
+                                       review_stage))
+        worker.start()
+        workers[shard] = (worker, entries)
+
+    for shard, entries in enumerate(entries_by_shard):
+        if entries:
+            restarts_left[shard] = restarts
+            start(shard, entries)
+    logger.info("Scraping %s products in %s shards: %s", len(products), len(workers),
+                [len(entries) for entries in entries_by_shard])
+
+    # Results wait here until every product before them is in (or given up), then leave in listing order
+    received = {}
+    finished = set()
+    ordered = []
+    next_index = 0
+    products_done = 0
+    # Running sentiment of the reviews of every product, merged from the products' own aggregates
+    run_sentiment = SentimentAggregate()
+
+    async def release():
+        nonlocal next_index
+        while next_index < len(products) and next_index in finished:
+            record = received.pop(next_index, None)
+            next_index += 1
+            if record is None:
+                continue
+            if on_product is not None:
+                await maybe_await(on_product, record)
+            else:
+                ordered.append(record)
+
+    async def handle(message):
+        nonlocal products_done
+        kind, shard, index, record = message
+        if kind == SHARD_DONE:
+            worker, entries = workers.pop(shard)
+            worker.join()
+            # Products the shard could not finish stay unprocessed in the checkpoint for the next run
+            finished.update(index for index, _ in entries)
+        else:
+            received[index] = record
+            finished.add(index)
+            products_done += 1
+            if record.get(SENTIMENT_AGGREGATE):
+                run_sentiment.merge(SentimentAggregate.from_dict(record[SENTIMENT_AGGREGATE]))
+            if progress is not None:
+                progress(products_done, len(products))
+        await release()
+
+    def drain():
+        messages = []
+        while True:
+            try:
+                messages.append(results.get_nowait())
+            except queue.Empty:
+                return messages
+
+    loop = asyncio.get_event_loop()
+    try:
+        while workers:
+            try:
+                message = await loop.run_in_executor(None, results.get, True, WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                message = None
+            if message is not None:
+                await handle(message)
+                continue
+
+            for shard, (worker, entries) in list(workers.items()):
+                if worker.is_alive():
+                    continue
+                # Results the worker sent just before it exited may still be queued
+                for message in drain():
+                    await handle(message)
+                if shard not in workers:
+                    continue
+                remaining = [(index, product) for index, product in entries if index not in finished]
+                del workers[shard]
+                if remaining and restarts_left[shard] > 0:
+                    restarts_left[shard] -= 1
+                    logger.warning("Shard %s exited with code %s, restarting it on its %s unfinished products.",
+                                   shard, worker.exitcode, len(remaining))
+                    start(shard, remaining)
+                else:
+                    logger.error("Shard %s exited with code %s, giving up on its %s unfinished products.",
+                                 shard, worker.exitcode, len(remaining))
+                    finished.update(index for index, _ in remaining)
+                    await release()
+    finally:
+        for worker, _ in workers.values():
+            worker.terminate()
+        results.close()
+
+    sentiment, score = run_sentiment.summary()
+    logger.info("Sentiment of the %s reviews of all shards: %s (mean %.3f, star-weighted %.3f) %s",
+                run_sentiment.count, sentiment, score, run_sentiment.star_weighted_score, run_sentiment.labels)
+
+    return None if on_product is not None else ordered
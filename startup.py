@@ -0,0 +1,172 @@
+from metrics import observe
+import importlib
+import threading
+import asyncio
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Set REVIEWPAL_WARM_START=0 to skip the warm-up at boot; the first scrape then pays for it
+WARM_START_ENABLED = os.environ.get('REVIEWPAL_WARM_START', '1') not in ('', '0')
+# Set REVIEWPAL_WARM_BROWSER=0 to warm up everything but the Playwright driver and browser
+WARM_BROWSER_ENABLED = os.environ.get('REVIEWPAL_WARM_BROWSER', '1') not in ('', '0')
+# Modules the warm-up imports ahead of the first scrape (pandas, Playwright, BeautifulSoup, parsers, ...)
+WARM_IMPORTS = ('amazon', 'iherb')
+
+
+# Start-up timings of the app: how long importing it took, the phases of the warm-up, and the latency of the
+# first request and the first scrape job. Times are seconds since `started` (the first line of the app).
+class StartupReport:
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self._lock = threading.Lock()
+        self.app_ready = None
+        self.phases = {}
+        self.errors = {}
+        self.warm_up_started = None
+        self.warm_up_finished = None
+        self.first_request = None
+        self.first_job = None
+        self.warmed_up = threading.Event()
+
+    def since_start(self):
+        return time.perf_counter() - self.started
+
+    # Function to record that the app module finished importing
+    def mark_app_ready(self):
+        self.app_ready = self.since_start()
+        observe('startup', self.app_ready, phase='import_app')
+        logger.info("App imported in %.0f ms.", 1000 * self.app_ready)
+
+    def record_phase(self, phase, seconds, error=None):
+        with self._lock:
+            self.phases[phase] = seconds
+            if error is not None:
+                self.errors[phase] = error
+        observe('startup', seconds, phase=phase)
+
+    # Function to record the first request the app served; later requests are ignored
+    def record_request(self, endpoint, status, seconds):
+        with self._lock:
+            if self.first_request is not None:
+                return
+            self.first_request = {
+                'endpoint': endpoint,
+                'status': status,
+                'latency_ms': round(1000 * seconds, 1),
+                'after_start_s': self.since_start(),
+                'warm': self.warmed_up.is_set(),
+            }
+        observe('startup', seconds, phase='first_request')
+        logger.info("First request (%s) served in %.0f ms, %.2fs after start (%s).", endpoint, 1000 * seconds,
+                    self.first_request['after_start_s'], 'warm' if self.first_request['warm'] else 'cold')
+
+    # Function to record the first scrape job that finished; `first_product_s` is how long its first product took
+    def record_job(self, site, seconds, first_product_s, status):
+        with self._lock:
+            if self.first_job is not None:
+                return
+            self.first_job = {
+                'site': site,
+                'status': status,
+                'duration_s': seconds,
+                'first_product_s': first_product_s,
+                'warm': self.warmed_up.is_set(),
+            }
+        if first_product_s is not None:
+            observe('startup', first_product_s, phase='first_product')
+        logger.info("First %s job %s in %.2fs (first product after %s).", site, status, seconds,
+                    f'{first_product_s:.2f}s' if first_product_s is not None else 'none')
+
+    def to_dict(self):
+        def rounded(value):
+            return round(value, 3) if isinstance(value, float) else value
+
+        with self._lock:
+            return {
+                'app_import_s': rounded(self.app_ready),
+                'warm_up': {
+                    'enabled': self.warm_up_started is not None,
+                    'finished': self.warmed_up.is_set(),
+                    'started_after_s': rounded(self.warm_up_started),
+                    'finished_after_s': rounded(self.warm_up_finished),
+                    'phases_s': {phase: rounded(seconds) for phase, seconds in self.phases.items()},
+                    'errors': dict(self.errors),
+                },
+                'first_request': {key: rounded(value) for key, value in self.first_request.items()}
+                if self.first_request else None,
+                'first_job': {key: rounded(value) for key, value in self.first_job.items()}
+                if self.first_job else None,
+            }
+
+
+_startup_report = None
+
+
+# Function to get the process-wide start-up report (created by the app before its other imports)
+def get_startup_report(started=None):
+    global _startup_report
+    if _startup_report is None:
+        _startup_report = StartupReport(started)
+    return _startup_report
+
+
+# Run one warm-up phase, recording its time; a failing phase is logged and skipped, the next scrape then
+# pays for it as it did without a warm-up
+async def _run_phase(report, phase, operation):
+    started = time.perf_counter()
+    try:
+        result = await operation()
+    except Exception as e:
+        error = (str(e) or type(e).__name__).splitlines()[0]
+        report.record_phase(phase, time.perf_counter() - started, error=error)
+        logger.warning("Warm-up phase '%s' failed, the first scrape will do it instead: %s", phase, error)
+        return None
+    report.record_phase(phase, time.perf_counter() - started)
+    return result
+
+
+def _import_scrapers():
+    for module in WARM_IMPORTS:
+        importlib.import_module(module)
+
+
+def _warm_up_sentiment():
+    from utils import warm_up_sentiment
+    warm_up_sentiment()
+
+
+# Asynchronous function run once on the job loop at boot: imports the scrapers, loads the VADER lexicon and starts
+# the scoring processes (before any Playwright subprocess exists, so forked workers stay small), then starts the
+# Playwright driver and a headless Chromium that every scrape on this loop reuses (see browser_pool.playwright_session).
+async def warm_up(report=None, with_browser=WARM_BROWSER_ENABLED):
+    report = report or get_startup_report()
+    report.warm_up_started = report.since_start()
+    loop = asyncio.get_event_loop()
+
+    async def in_thread(function):
+        return await loop.run_in_executor(None, function)
+
+    await _run_phase(report, 'import_scrapers', lambda: in_thread(_import_scrapers))
+    await _run_phase(report, 'sentiment', lambda: in_thread(_warm_up_sentiment))
+
+    if with_browser:
+        async def start_driver():
+            from playwright.async_api import async_playwright
+            return await async_playwright().start()
+
+        playwright = await _run_phase(report, 'playwright_driver', start_driver)
+        if playwright is not None:
+            from browser_pool import set_warm_browser
+            browser = await _run_phase(report, 'browser', lambda: playwright.chromium.launch(headless=True))
+            if browser is not None:
+                set_warm_browser(playwright, browser)
+            else:
+                await playwright.stop()
+
+    report.warm_up_finished = report.since_start()
+    report.warmed_up.set()
+    logger.info("Warm-up finished %.2fs after start: %s", report.warm_up_finished,
+                {phase: f'{1000 * seconds:.0f} ms' for phase, seconds in report.phases.items()})
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live at the repository root (there is no package to install)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the app must not start the boot-time warm-up (scrapers, sentiment pool, browser) under test
+os.environ.setdefault('REVIEWPAL_WARM_START', '0')
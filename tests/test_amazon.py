@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+import amazon
+
+
+# Review pages stand-in: page number -> (delay in seconds, records or an exception)
+def fake_review_pages(monkeypatch, pages):
+    async def fetch_amazon_review_page(pool, asin, page_number, cache=None, fetcher=None, newest_first=False):
+        delay, result = pages[page_number]
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def score_reviews_async(reviews, workers=None):
+        return [float(len(review)) / 100 for review in reviews]
+
+    monkeypatch.setattr(amazon, 'fetch_amazon_review_page', fetch_amazon_review_page)
+    monkeypatch.setattr(amazon, 'score_reviews_async', score_reviews_async)
+
+
+def fetch(pages):
+    return asyncio.run(amazon.fetch_and_score_amazon_review_pages(None, 'B0TEST', len(pages)))
+
+
+def test_duplicates_are_dropped_in_page_order_whatever_the_arrival_order(monkeypatch):
+    fake_review_pages(monkeypatch, {
+        1: (0.03, [('r1', 'first', '2024-05-03', 5), ('r2', 'moved', '2024-05-02', 4)]),
+        2: (0.0, [('r2', 'moved', '2024-05-02', 4), ('r3', 'third', '2024-05-01', 1)]),
+    })
+    reviews, aggregate, watermark = fetch({1: None, 2: None})
+    assert reviews == ['first', 'moved', 'third']
+    assert aggregate.count == 3 and aggregate.stars == 10
+    assert watermark.newest_date == '2024-05-03' and watermark.newest_keys == {'r1'} and watermark.count == 3
+
+
+def test_a_failed_page_keeps_the_pages_that_succeeded(monkeypatch):
+    fake_review_pages(monkeypatch, {
+        1: (0.0, [('r1', 'first', '2024-05-03', 5)]),
+        2: (0.0, TimeoutError('page 2 timed out')),
+        3: (0.0, [('r3', 'third', '2024-05-01', 2)]),
+    })
+    reviews, aggregate, _ = fetch({1: None, 2: None, 3: None})
+    assert reviews == ['first', 'third']
+    assert aggregate.count == 2
+
+
+def test_the_product_fails_only_when_every_page_failed(monkeypatch):
+    fake_review_pages(monkeypatch, {1: (0.0, TimeoutError('one')), 2: (0.0, TimeoutError('two'))})
+    with pytest.raises(TimeoutError):
+        fetch({1: None, 2: None})
+
+
+def test_pages_without_reviews_return_none(monkeypatch):
+    fake_review_pages(monkeypatch, {1: (0.0, []), 2: (0.0, [])})
+    assert fetch({1: None, 2: None}) is None
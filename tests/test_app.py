@@ -0,0 +1,52 @@
+import multiprocessing
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize('route', ['/scrape', '/jobs', '/scrape/stream'])
+@pytest.mark.parametrize('body', [{'pages': 1}, {'url': 'https://www.amazon.com/s?k=tea', 'pages': 'many'}])
+def test_bad_scrape_requests_are_rejected(client, route, body):
+    response = client.post(route, json=body)
+    assert response.status_code == 400
+
+
+def test_unknown_job_is_404(client):
+    assert client.get('/jobs/unknown').status_code == 404
+
+
+def test_startup_report_is_served(client):
+    report = client.get('/startup').get_json()
+    assert report['app_import_s'] is not None
+    assert report['warm_up']['enabled'] is False
+
+
+@pytest.mark.parametrize('route', ['/scrape', '/jobs', '/scrape/stream'])
+def test_unsupported_site_is_rejected(client, route):
+    response = client.post(route, json={'url': 'https://example.com/products', 'pages': 1})
+    assert response.status_code == 400
+
+
+def _warm_up_started_in_child(results):
+    import app
+    results.put(app.job_manager._thread is not None)
+
+
+# Shard and scoring workers are spawned and import the app again; only the serving process warms up
+def test_spawned_workers_do_not_warm_up(monkeypatch):
+    monkeypatch.setenv('REVIEWPAL_WARM_START', '1')
+    monkeypatch.setenv('REVIEWPAL_WARM_BROWSER', '0')
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    worker = context.Process(target=_warm_up_started_in_child, args=(results,))
+    worker.start()
+    try:
+        assert results.get(timeout=60) is False
+    finally:
+        worker.join(timeout=10)
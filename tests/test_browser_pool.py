@@ -0,0 +1,151 @@
+import asyncio
+
+import browser_pool
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.closed = False
+
+    def is_connected(self):
+        return not self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeChromium:
+    async def launch(self, headless=True):
+        return ('launched', headless)
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.chromium = FakeChromium()
+        self.stopped = False
+
+    async def stop(self):
+        self.stopped = True
+
+
+def test_warm_browser_is_reused_only_for_headless_launches_of_its_playwright():
+    async def main():
+        playwright, browser = FakePlaywright(), FakeBrowser()
+        browser_pool.set_warm_browser(playwright, browser)
+        try:
+            async with browser_pool.playwright_session() as session:
+                assert session is playwright
+            assert await browser_pool.launch_browser(playwright) == (browser, False)
+            assert await browser_pool.launch_browser(playwright, headless=False) == (('launched', False), True)
+            assert await browser_pool.launch_browser(FakePlaywright()) == (('launched', True), True)
+        finally:
+            await browser_pool.stop_warm_browser()
+        assert browser.closed and playwright.stopped
+
+    asyncio.run(main())
+
+
+def test_warm_browser_is_not_used_from_another_loop():
+    playwright = FakePlaywright()
+
+    async def start():
+        browser_pool.set_warm_browser(playwright, FakeBrowser())
+
+    async def lookup():
+        return browser_pool.get_warm_browser()
+
+    # Two explicit loops: asyncio.run may reuse one loop once nest_asyncio is applied (by the scrapers)
+    first_loop, second_loop = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        first_loop.run_until_complete(start())
+        assert second_loop.run_until_complete(lookup()) is None
+    finally:
+        browser_pool._warm_browser = None
+        first_loop.close()
+        second_loop.close()
+
+
+class FakePage:
+    def __init__(self):
+        self.handlers = {}
+        self.closed = False
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+        self.closed = False
+
+    async def route(self, pattern, handler):
+        pass
+
+    async def new_page(self):
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePoolBrowser(FakeBrowser):
+    def __init__(self):
+        super().__init__()
+        self.contexts = []
+
+    async def new_context(self, **options):
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+
+class FakePoolChromium:
+    async def launch(self, headless=True):
+        return FakePoolBrowser()
+
+
+class FakePoolPlaywright:
+    def __init__(self):
+        self.chromium = FakePoolChromium()
+
+
+def test_error_in_the_callers_block_does_not_recycle_the_context():
+    async def main():
+        pool = browser_pool.BrowserPool(FakePoolPlaywright(), size=1)
+        try:
+            async with pool.page():
+                raise ValueError('unparsable review date')
+        except ValueError:
+            pass
+        async with pool.page() as page:
+            pass
+        stats = pool.stats()
+        await pool.close()
+        return page, stats
+
+    page, stats = asyncio.run(main())
+    assert page.closed
+    assert stats['crashes'] == 0 and stats['context_recycles'] == 0
+    assert stats['contexts_created'] == 1 and stats['hits'] == 1
+
+
+def test_crashed_page_recycles_the_context():
+    async def main():
+        pool = browser_pool.BrowserPool(FakePoolPlaywright(), size=1)
+        async with pool.page() as page:
+            page.handlers['crash'](page)
+        async with pool.page():
+            pass
+        stats = pool.stats()
+        await pool.close()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats['crashes'] == 1 and stats['context_recycles'] == 1
+    assert stats['contexts_created'] == 2
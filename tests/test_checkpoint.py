@@ -0,0 +1,47 @@
+import pandas as pd
+
+from checkpoint import CheckpointStore, open_checkpoint
+
+
+def test_saved_products_survive_reopening_in_first_save_order(tmp_path):
+    path = str(tmp_path / 'checkpoint.sqlite')
+    with CheckpointStore(path, commit_every=2) as store:
+        store.save('b', {'id': 'b', 'score': 0.1})
+        store.save('a', {'id': 'a', 'score': 0.2}, processed=False)
+        store.save('c', {'id': 'c', 'score': 0.3})
+        # An update keeps the product's position
+        store.save('b', {'id': 'b', 'score': 0.9})
+
+    with CheckpointStore(path) as store:
+        assert len(store) == 3
+        assert [record['id'] for record in store.iter_records(batch_size=2)] == ['b', 'a', 'c']
+        assert store.get('b') == {'id': 'b', 'score': 0.9}
+        assert store.is_processed('b') and not store.is_processed('a') and not store.is_processed('missing')
+        assert store.processed_keys() == {'b', 'c'}
+        assert 'a' in store and 'z' not in store
+
+
+def test_keys_are_compared_as_strings(tmp_path):
+    with CheckpointStore(str(tmp_path / 'checkpoint.sqlite')) as store:
+        store.save(12345, {'Product ID': 12345})
+        assert store.is_processed('12345') and 12345 in store
+        assert store.get('12345') == {'Product ID': 12345}
+
+
+def test_legacy_export_is_imported_once(tmp_path):
+    legacy = tmp_path / 'reviews.csv'
+    pd.DataFrame([{'Product ID': 1, 'Reviews': "['good']"}, {'Product ID': 2, 'Reviews': None}]).to_csv(legacy,
+                                                                                                      index=False)
+    path = str(tmp_path / 'checkpoint.sqlite')
+
+    def is_processed(record):
+        return isinstance(record.get('Reviews'), str)
+
+    with open_checkpoint(path, legacy_path=str(legacy), key_field='Product ID', is_processed=is_processed) as store:
+        assert len(store) == 2
+        assert store.is_processed(1) and not store.is_processed(2)
+        store.save(2, {'Product ID': 2, 'Reviews': ['new']})
+
+    # The store exists now, so the legacy file is not imported over it again
+    with open_checkpoint(path, legacy_path=str(legacy), key_field='Product ID', is_processed=is_processed) as store:
+        assert store.get(2) == {'Product ID': 2, 'Reviews': ['new']}
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from concurrency import crawl_listing_pages, gather_bounded
+
+
+# Function to build a fetch_page callback returning `pages[page_number]` after `delays[page_number]` seconds
+def fake_listing(pages, delays):
+    async def fetch_page(page_number, url):
+        await asyncio.sleep(delays.get(page_number, 0))
+        result = pages[page_number]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fetch_page
+
+
+def crawl(pages, delays, max_concurrency=8):
+    urls = [f'https://example.com/s?page={number}' for number in sorted(pages)]
+    return asyncio.run(crawl_listing_pages(urls, fake_listing(pages, delays), key_of=lambda product: product['id'],
+                                           max_concurrency=max_concurrency))
+
+
+def ids(products):
+    return [product['id'] for product in products]
+
+
+def test_duplicate_on_page_past_the_end_does_not_hide_earlier_product():
+    # Page 3 arrives first, but it is past the empty page 2 and must not claim X
+    pages = {1: [{'id': 'X'}, {'id': 'A'}], 2: [], 3: [{'id': 'X'}]}
+    assert ids(crawl(pages, {1: 0.05, 2: 0.02, 3: 0})) == ['X', 'A']
+
+
+def test_duplicates_are_credited_to_the_first_page_whatever_the_arrival_order():
+    pages = {1: [{'id': 'A'}, {'id': 'B', 'page': 1}], 2: [{'id': 'B', 'page': 2}, {'id': 'C'}]}
+    for delays in ({1: 0.03, 2: 0}, {1: 0, 2: 0.03}):
+        products = crawl(pages, delays)
+        assert ids(products) == ['A', 'B', 'C']
+        assert products[1]['page'] == 1
+
+
+def test_products_without_key_are_all_kept():
+    pages = {1: [{'id': None}, {'id': 'A'}], 2: [{'id': None}]}
+    assert ids(crawl(pages, {})) == [None, 'A', None]
+
+
+def test_failing_and_skipped_pages_do_not_end_the_listing():
+    pages = {1: [{'id': 'A'}], 2: RuntimeError('boom'), 3: None, 4: [{'id': 'B'}]}
+    assert ids(crawl(pages, {}, max_concurrency=1)) == ['A', 'B']
+
+
+def test_pages_after_the_first_empty_page_are_dropped():
+    pages = {1: [{'id': 'A'}], 2: [], 3: [{'id': 'B'}], 4: [{'id': 'C'}]}
+    assert ids(crawl(pages, {}, max_concurrency=1)) == ['A']
+
+
+def test_gather_bounded_keeps_item_order_and_limits():
+    in_flight = {'all': 0, 'max': 0}
+
+    async def worker(item):
+        in_flight['all'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['all'])
+        await asyncio.sleep(0.01 * (5 - item))
+        in_flight['all'] -= 1
+        return item * 10
+
+    results = asyncio.run(gather_bounded(list(range(5)), worker, max_concurrency=2))
+    assert results == [0, 10, 20, 30, 40]
+    assert in_flight['max'] == 2
+
+
+def test_gather_bounded_limits_each_host():
+    in_flight = {}
+    peaks = {}
+
+    async def worker(url):
+        host = url.split('/')[2]
+        in_flight[host] = in_flight.get(host, 0) + 1
+        peaks[host] = max(peaks.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+
+    urls = [f'https://{host}/item/{number}' for host in ('a.com', 'b.com') for number in range(4)]
+    asyncio.run(gather_bounded(urls, worker, max_concurrency=8, per_host_limit=1, url_of=lambda url: url))
+    assert peaks == {'a.com': 1, 'b.com': 1}
+
+
+def test_gather_bounded_raises_and_cancels_the_other_items():
+    finished = []
+
+    async def worker(item):
+        if item == 1:
+            raise ValueError('boom')
+        await asyncio.sleep(0.05)
+        finished.append(item)
+        return item
+
+    with pytest.raises(ValueError):
+        asyncio.run(gather_bounded([0, 1, 2], worker, max_concurrency=3))
+    assert finished == []
@@ -0,0 +1,99 @@
+import json
+from datetime import date
+
+import pytest
+
+from checkpoint import open_checkpoint
+from export import RowWriter, open_export_file, with_format_extension, check_file_format, AMAZON_COLUMNS
+from export import ParquetExportFile, arrow_schema, read_parquet_export, iter_parquet_records, IHERB_COLUMNS
+from export import parse_price, parse_rating
+
+
+def test_csv_rows_match_dataframe_to_csv_cells():
+    writer = RowWriter(['Name', 'Reviews', 'Score'])
+    assert writer.header() == 'Name,Reviews,Score\n'
+    assert writer.row({'Name': 'Tea, green', 'Reviews': ['a', 'b'], 'Score': float('nan')}) == \
+        '"Tea, green","[\'a\', \'b\']",\n'
+
+
+def test_ndjson_rows_keep_lists_and_map_missing_values_to_null():
+    writer = RowWriter(['Name', 'Reviews', 'Score'], 'ndjson')
+    assert writer.header() == ''
+    assert json.loads(writer.row({'Name': 'Tea', 'Reviews': ['a'], 'Score': float('nan')})) == \
+        {'Name': 'Tea', 'Reviews': ['a'], 'Score': None}
+
+
+def test_text_export_file_writes_header_and_rows(tmp_path):
+    path = str(tmp_path / 'result.csv')
+    with open_export_file(path, ['Name', 'Score']) as export_file:
+        export_file.write({'Name': 'Tea', 'Score': 0.5})
+        export_file.write({'Name': 'Coffee'})
+    with open(path, encoding='utf-8') as result:
+        assert result.read() == 'Name,Score\nTea,0.5\nCoffee,\n'
+
+
+def test_unknown_formats_are_rejected():
+    with pytest.raises(ValueError):
+        RowWriter(AMAZON_COLUMNS, 'xlsx')
+    with pytest.raises(ValueError):
+        check_file_format('xlsx')
+    assert with_format_extension('amazon_products.csv', 'ndjson') == 'amazon_products.ndjson'
+
+
+def test_prices_and_ratings_are_read_as_numbers():
+    assert parse_price('$1,234.99') == 1234.99
+    assert parse_price('No Price') is None
+    assert parse_rating('4.5 out of 5 stars') == 4.5
+    assert parse_rating(float('nan')) is None
+
+
+IHERB_PRODUCTS = [
+    {'Product Name': 'Tea', 'Product Price': '$5.99', 'Product Rating': '4.6/5', 'Label': 1, 'Product ID': 12345,
+     'Product Link': 'https://www.iherb.com/pr/tea/12345', 'Summary Sentiment': 'Positive', 'Sentiment Score': 0.61,
+     'Reviews': ['good', 'fine'], 'Review Dates': ['2024-05-03', '2024-05-01'], 'Review Stars': [5, 4]},
+    # A product imported from an older CSV checkpoint: list columns hold the repr of the list
+    {'Product Name': 'Coffee', 'Product Price': 'No Price', 'Product Rating': 'No Rating', 'Label': float('nan'),
+     'Product ID': 678, 'Summary Sentiment': 'No Reviews', 'Sentiment Score': 0,
+     'Reviews': "['No Reviews']", 'Review Dates': None, 'Review Stars': None},
+]
+
+
+@pytest.mark.parametrize('batch_size', [1, 1000])
+def test_parquet_export_round_trips_typed_and_list_columns(tmp_path, batch_size):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'reviews.parquet')
+    with ParquetExportFile(path, IHERB_COLUMNS, batch_size=batch_size) as export_file:
+        for product in IHERB_PRODUCTS:
+            export_file.write(product)
+
+    table = read_parquet_export(path)
+    assert table.schema == arrow_schema(IHERB_COLUMNS)
+    records = list(iter_parquet_records(path))
+    assert records[0]['Product Price'] == 5.99 and records[0]['Product Rating'] == 4.6
+    assert records[0]['Product ID'] == '12345' and records[0]['Label'] == 1
+    assert records[0]['Review Dates'] == [date(2024, 5, 3), date(2024, 5, 1)]
+    assert records[0]['Review Stars'] == [5, 4]
+    assert records[1]['Reviews'] == ['No Reviews']
+    assert records[1]['Product Price'] is None and records[1]['Label'] is None and records[1]['Review Dates'] is None
+
+
+def test_parquet_columns_can_be_read_on_their_own(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'reviews.parquet')
+    with open_export_file(path, IHERB_COLUMNS, 'parquet') as export_file:
+        export_file.write(IHERB_PRODUCTS[0])
+    table = read_parquet_export(path, columns=['Product ID', 'Reviews'])
+    assert table.column_names == ['Product ID', 'Reviews']
+    assert table.to_pylist() == [{'Product ID': '12345', 'Reviews': ['good', 'fine']}]
+
+
+def test_parquet_export_is_imported_into_a_new_checkpoint(tmp_path):
+    pytest.importorskip('pyarrow')
+    legacy = str(tmp_path / 'reviews.parquet')
+    with open_export_file(legacy, IHERB_COLUMNS, 'parquet') as export_file:
+        for product in IHERB_PRODUCTS:
+            export_file.write(product)
+    with open_checkpoint(str(tmp_path / 'checkpoint.sqlite'), legacy_path=legacy, key_field='Product ID',
+                         is_processed=lambda record: record.get('Review Dates') is not None) as store:
+        assert store.is_processed('12345') and not store.is_processed('678')
+        assert store.get('12345')['Review Dates'] == ['2024-05-03', '2024-05-01']
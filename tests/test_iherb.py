@@ -0,0 +1,32 @@
+import asyncio
+
+import iherb
+from page_cache import PageCache
+
+SEARCH_URL = 'https://www.iherb.com/search?kw=tea'
+CATEGORY_URL = 'https://www.iherb.com/c/herbal-tea?sr=1'
+
+
+# An earlier run's product list must not stand in for a different search or page count
+def test_product_list_is_crawled_for_every_url_and_page_count(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    iherb.save_data_to_file([{'Product ID': 'old'}], iherb.IHERB_PRODUCTS_CSV)
+    listings = []
+
+    async def scrape_iherb_product_details(url, xpath_query, num_pages, **options):
+        listings.append((url, num_pages))
+        return [{'Product ID': f'{url}#{num_pages}'}]
+
+    async def scrape_iherb_product_reviews(product_list, num_review_pages, **options):
+        return product_list
+
+    monkeypatch.setattr(iherb, 'scrape_iherb_product_details', scrape_iherb_product_details)
+    monkeypatch.setattr(iherb, 'scrape_iherb_product_reviews', scrape_iherb_product_reviews)
+    cache = PageCache(str(tmp_path / 'page_cache.sqlite'))
+    try:
+        for url, num_pages in ((SEARCH_URL, 1), (CATEGORY_URL, 1), (CATEGORY_URL, 2)):
+            result = asyncio.run(iherb.scrape_iherb_product_reviews_main(url, '//div', num_pages, 1, page_cache=cache))
+            assert result['Product ID'].tolist() == [f'{url}#{num_pages}']
+    finally:
+        cache.close()
+    assert listings == [(SEARCH_URL, 1), (CATEGORY_URL, 1), (CATEGORY_URL, 2)]
@@ -0,0 +1,73 @@
+import pytest
+
+from incremental import ReviewWatermark, merge_new_reviews, stored_aggregate, sentiment_fields
+from incremental import NEWEST_REVIEW_DATE, NEWEST_REVIEW_KEYS, REVIEW_COUNT, SENTIMENT_AGGREGATE
+from utils import SentimentAggregate
+
+
+def test_watermark_of_reviews_keeps_newest_date_and_its_keys():
+    watermark = ReviewWatermark.of_reviews([('a', '2024-05-02'), ('b', '2024-05-02'), ('c', '2024-04-30')])
+    assert watermark.newest_date == '2024-05-02'
+    assert watermark.newest_keys == {'a', 'b'}
+    assert watermark.count == 3
+
+
+def test_watermark_keeps_every_key_of_the_newest_date():
+    reviews = [(f'review-{number}', '2024-05-02') for number in range(120)]
+    watermark = ReviewWatermark.of_reviews(reviews)
+    assert len(watermark.newest_keys) == 120
+    assert all(watermark.is_seen(key, date) for key, date in reviews)
+
+
+def test_is_seen_by_key_or_older_date():
+    watermark = ReviewWatermark('2024-05-02', ['a'], 5)
+    assert watermark.is_seen('a', '2024-05-02')
+    assert watermark.is_seen('x', '2024-05-01')
+    assert not watermark.is_seen('x', '2024-05-02')
+    assert not watermark.is_seen('x', '2024-05-03')
+    assert not watermark.is_seen('x', None)
+
+
+def test_advance_on_same_date_adds_keys_and_newer_date_replaces_them():
+    watermark = ReviewWatermark('2024-05-02', ['a'], 5)
+    same_day = watermark.advance([('b', '2024-05-02')])
+    assert same_day.newest_keys == {'a', 'b'} and same_day.count == 6
+    next_day = same_day.advance([('c', '2024-05-03'), ('d', '2024-05-02')])
+    assert next_day.newest_date == '2024-05-03'
+    assert next_day.newest_keys == {'c'} and next_day.count == 8
+
+
+def test_watermark_record_round_trip():
+    watermark = ReviewWatermark('2024-05-02', ['b', 'a'], 7)
+    restored = ReviewWatermark.from_record(watermark.fields())
+    assert (restored.newest_date, restored.newest_keys, restored.count) == ('2024-05-02', {'a', 'b'}, 7)
+    assert ReviewWatermark.from_record({'Reviews': ['x']}) is None
+
+
+def test_merge_new_reviews_prepends_and_updates_the_aggregate():
+    old = SentimentAggregate().add_many([0.8, 0.2])
+    stored = {'Product ID': 1, 'Reviews': ['old 1', 'old 2'], **sentiment_fields(old),
+              **ReviewWatermark('2024-05-01', ['o1'], 2).fields()}
+    watermark = ReviewWatermark.from_record(stored)
+    new = SentimentAggregate().add_many([-0.4])
+    result = merge_new_reviews(stored, {'Product ID': 1, 'Price': '$5'}, watermark, {'Reviews': ['new 1']},
+                               ['n1'], ['2024-05-03'], new)
+    assert result['Reviews'] == ['new 1', 'old 1', 'old 2']
+    assert result['Price'] == '$5'
+    assert result[REVIEW_COUNT] == 3
+    assert result[NEWEST_REVIEW_DATE] == '2024-05-03' and result[NEWEST_REVIEW_KEYS] == ['n1']
+    assert result['Sentiment Score'] == pytest.approx((0.8 + 0.2 - 0.4) / 3)
+    assert result[SENTIMENT_AGGREGATE]['count'] == 3
+
+
+def test_merge_without_new_reviews_keeps_the_stored_product():
+    stored = {'Reviews': ['old'], 'Sentiment Score': 0.5, **ReviewWatermark('2024-05-01', ['o1'], 1).fields()}
+    watermark = ReviewWatermark.from_record(stored)
+    result = merge_new_reviews(stored, {}, watermark, {'Reviews': []}, [], [], SentimentAggregate())
+    assert result['Reviews'] == ['old'] and result['Sentiment Score'] == 0.5
+    assert result[REVIEW_COUNT] == 1 and result[NEWEST_REVIEW_KEYS] == ['o1']
+
+
+def test_stored_aggregate_falls_back_to_average_and_count():
+    aggregate = stored_aggregate({'Sentiment Score': 0.25}, ReviewWatermark(count=4))
+    assert aggregate.count == 4 and aggregate.mean == pytest.approx(0.25)
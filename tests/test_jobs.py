@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import jobs
+from concurrency import OrderedEmitter
+from jobs import JobManager, JobQueueFull, DONE, QUEUED, RUNNING
+
+AMAZON_URL = 'https://www.amazon.com/s?k=herbal+tea'
+IHERB_URL = 'https://www.iherb.com/c/herbal-tea'
+
+
+def test_ordered_emitter_releases_in_index_order_and_skips_none():
+    released = []
+
+    async def main():
+        emitter = OrderedEmitter(released.append)
+        await emitter.emit(2, 'c')
+        await emitter.emit(1, None)
+        assert released == []
+        await emitter.emit(0, 'a')
+        await emitter.emit(3, 'd')
+
+    asyncio.run(main())
+    assert released == ['a', 'c', 'd']
+
+
+# Scrape stand-in: products finish in reverse listing order, in completion order unless asked for listing order
+async def fake_scrape(url, pages, on_product, progress=None, ordered=False):
+    finished = list(reversed(range(pages)))
+    emitter = OrderedEmitter(on_product) if ordered else None
+    for index in finished:
+        await asyncio.sleep(0.01)
+        product = {'Product Name': f'product {index}', 'ASIN': f'A{index}'}
+        if emitter is not None:
+            await emitter.emit(index, product)
+        else:
+            await on_product(product)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'run_scrape', fake_scrape)
+    job_manager = JobManager(result_dir=str(tmp_path))
+    yield job_manager
+    job_manager.shutdown()
+
+
+def result_names(job):
+    with open(job.result_path) as result_file:
+        return [line.split(',')[0] for line in result_file.read().splitlines()[1:]]
+
+
+def test_job_result_file_keeps_listing_order(manager):
+    job, coalesced = manager.submit(AMAZON_URL, 3)
+    manager.wait(job, timeout=10)
+    assert not coalesced and job.status == DONE
+    assert result_names(job) == ['product 0', 'product 1', 'product 2']
+
+
+def test_streamed_job_sends_products_as_they_finish(manager):
+    job, subscriber = manager.submit(AMAZON_URL, 3, stream=True)
+    names = []
+    while True:
+        product = subscriber.get(timeout=10)
+        if product is jobs.END_OF_STREAM:
+            break
+        names.append(product['Product Name'])
+    assert names == ['product 2', 'product 1', 'product 0']
+
+
+def test_identical_requests_are_coalesced(manager):
+    first, _ = manager.submit(AMAZON_URL, 2)
+    second, coalesced = manager.submit(AMAZON_URL, 2)
+    assert coalesced and second is first
+    other, coalesced = manager.submit(AMAZON_URL, 2, export_format='ndjson')
+    assert not coalesced and other is not first
+    manager.wait(first, timeout=10)
+    manager.wait(other, timeout=10)
+
+
+def test_full_queue_is_refused(tmp_path, monkeypatch):
+    release = threading.Event()
+
+    async def blocked_scrape(url, pages, on_product, progress=None, ordered=False):
+        await asyncio.get_event_loop().run_in_executor(None, release.wait, 10)
+
+    monkeypatch.setattr(jobs, 'run_scrape', blocked_scrape)
+    manager = JobManager(max_workers=1, max_queued=1, result_dir=str(tmp_path))
+    try:
+        running, _ = manager.submit(AMAZON_URL, 1)
+        deadline = time.monotonic() + 10
+        while running.status != RUNNING and time.monotonic() < deadline:
+            time.sleep(0.01)
+        queued, _ = manager.submit(AMAZON_URL, 2)
+        with pytest.raises(JobQueueFull):
+            manager.submit(AMAZON_URL, 3)
+    finally:
+        release.set()
+    for job in (running, queued):
+        manager.wait(job, timeout=10)
+        assert job.status == DONE
+    manager.shutdown()
+
+
+def wait_for_status(job, status, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job.status != status and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job.status
+
+
+def test_job_waiting_for_its_site_does_not_hold_a_worker(tmp_path, monkeypatch):
+    release = threading.Event()
+
+    async def blocked_scrape(url, pages, on_product, progress=None, ordered=False):
+        await asyncio.get_event_loop().run_in_executor(None, release.wait, 10)
+
+    monkeypatch.setattr(jobs, 'run_scrape', blocked_scrape)
+    manager = JobManager(max_workers=2, result_dir=str(tmp_path))
+    try:
+        first_iherb, _ = manager.submit(IHERB_URL, 1)
+        assert wait_for_status(first_iherb, RUNNING) == RUNNING
+        second_iherb, _ = manager.submit(IHERB_URL, 2)
+        amazon_job, _ = manager.submit(AMAZON_URL, 1)
+        assert wait_for_status(amazon_job, RUNNING) == RUNNING
+        assert second_iherb.status == QUEUED
+    finally:
+        release.set()
+    for job in (first_iherb, second_iherb, amazon_job):
+        manager.wait(job, timeout=10)
+        assert job.status == DONE
+    manager.shutdown()
+
+
+def test_invalid_url_and_format_are_rejected(manager):
+    with pytest.raises(ValueError):
+        manager.submit('https://example.com/', 1)
+    with pytest.raises(ValueError):
+        manager.submit(AMAZON_URL, 1, export_format='xlsx')
@@ -0,0 +1,115 @@
+import random
+import sqlite3
+import string
+import types
+import zlib
+
+import pytest
+
+import page_cache
+from page_cache import PageCache, normalize_url
+
+AMAZON_PAGE = 'https://www.amazon.com/dp/B0TEST'
+IHERB_PAGE = 'https://www.iherb.com/pr/tea/123'
+
+
+# Clock stand-in for page_cache.time: every call is one second later unless set explicitly
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(page_cache, 'time', types.SimpleNamespace(time=fake.time))
+    return fake
+
+
+def random_html(seed, length=4000):
+    rng = random.Random(seed)
+    return ''.join(rng.choice(string.ascii_letters) for _ in range(length))
+
+
+def compressed_size(html):
+    return len(zlib.compress(html.encode('utf-8'), 6))
+
+
+def test_normalize_url_drops_tracking_and_sorts_the_query():
+    assert normalize_url('HTTPS://WWW.Amazon.com/dp/B0TEST/ref=sr_1_1?th=1&qid=123&utm_source=x&psc=1#reviews') == \
+        'https://www.amazon.com/dp/B0TEST?psc=1&th=1'
+    assert normalize_url('https://www.iherb.com') == 'https://www.iherb.com/'
+
+
+def test_equivalent_urls_share_an_entry():
+    cache = PageCache(':memory:')
+    cache.put(AMAZON_PAGE + '/ref=sr_1_1?qid=1', '<html>product</html>')
+    assert cache.get(AMAZON_PAGE + '?pd_rd_w=abc') == '<html>product</html>'
+    assert cache.stats()['hits'] == 1
+    cache.close()
+
+
+def test_pages_expire_after_their_sites_ttl(clock):
+    cache = PageCache(':memory:', ttls={'amazon': 60, 'iherb': 600})
+    cache.put(AMAZON_PAGE, 'amazon')
+    cache.put(IHERB_PAGE, 'iherb')
+    clock.now += 100
+    assert cache.get(AMAZON_PAGE) is None
+    assert cache.get(IHERB_PAGE) == 'iherb'
+    assert cache.stats()['expired'] == 1
+    cache.close()
+
+
+def test_replay_mode_serves_stale_pages_and_stores_nothing(tmp_path, clock):
+    path = str(tmp_path / 'page_cache.sqlite')
+    cache = PageCache(path, ttls={'amazon': 60})
+    cache.put(AMAZON_PAGE, 'recorded')
+    cache.close()
+
+    clock.now += 3600
+    replay = PageCache(path, ttls={'amazon': 60}, replay=True)
+    assert replay.get(AMAZON_PAGE) == 'recorded'
+    replay.put(IHERB_PAGE, 'new')
+    assert replay.get(IHERB_PAGE) is None
+    assert replay.stats()['stores'] == 0
+    replay.close()
+
+
+def test_least_recently_used_pages_are_evicted_by_compressed_size(clock):
+    pages = {url: random_html(url) for url in (AMAZON_PAGE, IHERB_PAGE, AMAZON_PAGE + '?th=1')}
+    cache = PageCache(':memory:', max_bytes=int(2.5 * max(compressed_size(html) for html in pages.values())))
+    first, second, third = pages
+    cache.put(first, pages[first])
+    cache.put(second, pages[second])
+    # Reading the first page makes the second one the least recently used
+    assert cache.get(first) == pages[first]
+    cache.put(third, pages[third])
+
+    assert cache.get(second) is None
+    assert cache.get(first) == pages[first] and cache.get(third) == pages[third]
+    assert cache.stats()['evictions'] == 1
+    assert cache.total_bytes == compressed_size(pages[first]) + compressed_size(pages[third]) <= cache.max_bytes
+    cache.close()
+
+
+def test_hits_write_their_access_times_in_batches(tmp_path, clock):
+    path = str(tmp_path / 'page_cache.sqlite')
+    cache = PageCache(path)
+    cache.put(AMAZON_PAGE, 'product')
+    reader = sqlite3.connect(path)
+
+    def accessed_at():
+        return reader.execute("SELECT accessed_at FROM pages WHERE url = ?", (normalize_url(AMAZON_PAGE),)).fetchone()[0]
+
+    stored = accessed_at()
+    for _ in range(3):
+        assert cache.get(AMAZON_PAGE) == 'product'
+    assert accessed_at() == stored
+    cache.put(IHERB_PAGE, 'other')
+    assert accessed_at() > stored
+    reader.close()
+    cache.close()
@@ -0,0 +1,134 @@
+import asyncio
+import types
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, Throttled, TransientFetchError, retry_with_backoff
+
+AMAZON_URL = 'https://www.amazon.com/dp/B0TEST'
+
+
+# Stand-in for the clock and sleep of rate_limiter: sleeping only records the delay and moves the clock on
+class FakeTime:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(rate_limiter, 'time', types.SimpleNamespace(monotonic=fake.monotonic))
+    monkeypatch.setattr(rate_limiter, 'asyncio', types.SimpleNamespace(sleep=fake.sleep))
+    # Full jitter always picks the longest delay
+    monkeypatch.setattr(rate_limiter, 'random', types.SimpleNamespace(uniform=lambda low, high: high))
+    return fake
+
+
+def limiter(rate=1.0, min_rate=0.1, max_rate=4.0):
+    return RateLimiter(site_rates={'amazon': {'rate': rate, 'min_rate': min_rate, 'max_rate': max_rate}}, burst=2,
+                       enabled=True)
+
+
+def test_requests_beyond_the_burst_wait_for_their_token(fake_time):
+    rates = limiter()
+
+    async def main():
+        for _ in range(4):
+            await rates.acquire(AMAZON_URL)
+
+    asyncio.run(main())
+    # Two tokens saved up, then one request per second; each sleep moves the clock past the previous request
+    assert fake_time.sleeps == [1.0, 1.0]
+    assert rates.stats()['www.amazon.com']['requests'] == 4
+
+
+def test_clean_responses_raise_the_rate_up_to_its_maximum(fake_time):
+    rates = limiter(rate=3.9, max_rate=4.0)
+    assert rates.record(AMAZON_URL, status=200) is False
+    assert rates.bucket(AMAZON_URL).rate == pytest.approx(3.95)
+    rates.record(AMAZON_URL, status=200)
+    rates.record(AMAZON_URL, status=302)
+    assert rates.bucket(AMAZON_URL).rate == 4.0
+    rates.record(AMAZON_URL, status=404)
+    assert rates.bucket(AMAZON_URL).rate == 4.0
+
+
+def test_throttling_halves_the_rate_once_per_interval(fake_time):
+    rates = limiter(rate=1.0, min_rate=0.3)
+    bucket = rates.bucket(AMAZON_URL)
+    assert rates.record(AMAZON_URL, status=429) is True
+    assert bucket.rate == 0.5 and bucket.tokens <= 0
+    # Responses to requests that were already in flight report the same throttling
+    assert rates.record(AMAZON_URL, status=503) is True
+    assert bucket.rate == 0.5
+    # The interval is one request at the current rate (2 s at 0.5 requests/s)
+    fake_time.now += 1.5
+    rates.record(AMAZON_URL, status=429)
+    assert bucket.rate == 0.5
+    fake_time.now += 0.5
+    rates.record(AMAZON_URL, status=429)
+    assert bucket.rate == 0.3
+    assert bucket.throttled == 4
+
+
+def test_captcha_counts_as_throttling(fake_time):
+    rates = limiter(rate=2.0)
+    assert rates.record(AMAZON_URL, status=200, captcha=True) is True
+    assert rates.bucket(AMAZON_URL).rate == 1.0
+
+
+def test_other_hosts_and_a_disabled_limiter_are_not_paced(fake_time):
+    rates = limiter()
+    assert rates.bucket('https://example.com/') is None
+    assert rates.record('https://example.com/', status=429) is True
+    assert rates.record('https://example.com/', captcha=True) is True
+    assert RateLimiter(enabled=False).bucket(AMAZON_URL) is None
+
+
+def test_retry_with_backoff_retries_with_growing_delays(fake_time):
+    failures = [Throttled('429'), TransientFetchError('502')]
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        if failures:
+            raise failures.pop(0)
+        return 'page'
+
+    assert asyncio.run(retry_with_backoff(operation)) == 'page'
+    assert len(calls) == 3
+    assert fake_time.sleeps == [1.0, 2.0]
+
+
+def test_retry_with_backoff_gives_up_after_the_last_retry(fake_time):
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        raise Throttled('CAPTCHA')
+
+    with pytest.raises(Throttled):
+        asyncio.run(retry_with_backoff(operation, retries=3))
+    assert len(calls) == 4
+    assert fake_time.sleeps == [1.0, 2.0, 4.0]
+
+
+def test_retry_with_backoff_does_not_retry_other_errors(fake_time):
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        raise ValueError('unparsable page')
+
+    with pytest.raises(ValueError):
+        asyncio.run(retry_with_backoff(operation))
+    assert len(calls) == 1 and fake_time.sleeps == []
@@ -0,0 +1,93 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import utils
+
+
+# Executor stand-in that records how many tasks it ran
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.tasks = 0
+
+    def submit(self, *args, **kwargs):
+        self.tasks += 1
+        return super().submit(*args, **kwargs)
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    monkeypatch.setattr(utils, '_sentiment_cache', utils.SentimentCache(None))
+
+
+def test_small_async_batches_are_scored_in_the_pool(memory_cache, monkeypatch):
+    executor = CountingExecutor()
+    monkeypatch.setattr(utils, 'get_sentiment_executor', lambda workers=None: executor)
+    scores = asyncio.run(utils.score_reviews_async(['Great tea, love it!', 'Awful taste.'], workers=2))
+    executor.shutdown()
+    assert executor.tasks == 1
+    assert scores[0] > 0 > scores[1]
+
+
+def test_large_async_batches_are_split_across_workers(memory_cache, monkeypatch):
+    executor = CountingExecutor()
+    monkeypatch.setattr(utils, 'get_sentiment_executor', lambda workers=None: executor)
+    reviews = [f'review number {number} is good' for number in range(4 * utils.SENTIMENT_CHUNK_SIZE)]
+    scores = asyncio.run(utils.score_reviews_async(reviews, workers=4))
+    executor.shutdown()
+    assert executor.tasks == 4
+    assert len(scores) == len(reviews)
+
+
+def test_set_sentiment_workers_never_goes_below_one(monkeypatch):
+    monkeypatch.setattr(utils, 'SENTIMENT_WORKERS', 8)
+    utils.set_sentiment_workers(8 // 3)
+    assert utils.SENTIMENT_WORKERS == 2
+    utils.set_sentiment_workers(8 // 16)
+    assert utils.SENTIMENT_WORKERS == 1
+
+
+def test_merged_aggregates_equal_one_aggregate_of_all_reviews():
+    scores = [0.9, 0.1, -0.6, 0.75, 0.0]
+    stars = [5, 3, 1, None, 2]
+    whole = utils.SentimentAggregate().add_many(scores, stars)
+    merged = utils.SentimentAggregate().add_many(scores[:2], stars[:2]).merge(
+        utils.SentimentAggregate().add_many(scores[2:], stars[2:]))
+    assert merged.count == whole.count == 5
+    assert merged.total == pytest.approx(whole.total)
+    assert merged.labels == whole.labels
+    assert merged.star_weighted_score == pytest.approx(whole.star_weighted_score)
+    assert merged.summary() == (whole.summary()[0], pytest.approx(whole.summary()[1]))
+
+
+def test_aggregate_round_trips_through_its_dict():
+    aggregate = utils.SentimentAggregate().add_many([0.8, -0.2], [4, 2])
+    restored = utils.SentimentAggregate.from_dict(aggregate.to_dict())
+    assert restored.to_dict() == aggregate.to_dict()
+
+
+def test_empty_aggregate_summary_matches_analyze_sentiment():
+    assert utils.SentimentAggregate().summary() == ("No Reviews", 0)
+    assert utils.SentimentAggregate().star_weighted_score == 0
+
+
+def test_aggregate_summary_matches_analyze_sentiment(memory_cache):
+    reviews = ['Great tea, love it!', 'Terrible, never again.', 'It is fine.']
+    aggregate = utils.SentimentAggregate().add_many(utils.score_review_texts(reviews))
+    sentiment, score = utils.analyze_sentiment(reviews)
+    assert aggregate.summary() == (sentiment, pytest.approx(score))
+
+
+def test_on_disk_cache_is_shared_in_wal_mode(tmp_path):
+    path = str(tmp_path / 'sentiment_cache.sqlite')
+    first, second = utils.SentimentCache(path), utils.SentimentCache(path)
+    try:
+        assert first._db.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        first.put_many({'a': 0.5})
+        second.put_many({'b': -0.25})
+        assert second.get_many(['a', 'b']) == {'a': 0.5, 'b': -0.25}
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+import sharding
+from sharding import run_sharded, shard_of
+
+SHARDS = 2
+
+
+# Review stage run by the shard workers instead of the scrapers. A product marked 'crash': 'once' kills its
+# worker the first time it is reached (the marker file remembers it across restarts), 'always' every time.
+async def stub_review_stage(products, on_product=None, crash_marker=None, **options):
+    for product in products:
+        crash = product.get('crash')
+        if crash == 'always' or (crash == 'once' and not os.path.exists(crash_marker)):
+            open(crash_marker, 'w').close()
+            sys.exit(3)
+        on_product(dict(product, Reviews=f"reviews of {product['ASIN']}"))
+
+
+def listing(count, crash_at, crash):
+    return [dict({'ASIN': f'B{index:03d}'}, **({'crash': crash} if index == crash_at else {}))
+            for index in range(count)]
+
+
+def run(products, tmp_path, on_product=None):
+    progress = []
+    result = asyncio.run(run_sharded('amazon', products, SHARDS, {'crash_marker': str(tmp_path / 'crashed')},
+                                     on_product=on_product, progress=lambda done, total: progress.append(done),
+                                     review_stage=stub_review_stage))
+    return result, progress
+
+
+@pytest.fixture(autouse=True)
+def fast_crash_detection(monkeypatch):
+    monkeypatch.setattr(sharding, 'WORKER_POLL_INTERVAL', 0.1)
+
+
+def test_crashed_shard_is_restarted_once_and_output_keeps_listing_order(tmp_path):
+    products = listing(8, crash_at=1, crash='once')
+    released = []
+    result, progress = run(products, tmp_path, on_product=released.append)
+    assert result is None
+    assert os.path.exists(tmp_path / 'crashed')
+    assert [record['ASIN'] for record in released] == [product['ASIN'] for product in products]
+    assert progress == list(range(1, len(products) + 1))
+
+
+def test_shard_that_keeps_crashing_is_given_up_on(tmp_path):
+    crash_at = 1
+    products = listing(8, crash_at=crash_at, crash='always')
+    doomed_shard = shard_of(products[crash_at]['ASIN'], SHARDS)
+    # The doomed shard finishes the products before the crashing one; the rest of it is left out
+    expected = [product['ASIN'] for index, product in enumerate(products)
+                if index < crash_at or shard_of(product['ASIN'], SHARDS) != doomed_shard]
+    result, _ = run(products, tmp_path)
+    assert [record['ASIN'] for record in result] == expected
+    assert len(expected) < len(products) - 1
@@ -1,10 +1,19 @@
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+import threading
+import hashlib
+import logging
+import asyncio
+import sqlite3
+import atexit
 import random
 import re
+import os
 import string
 import html
 
-
+logger = logging.getLogger(__name__)
 
 # User agents list for rotation to avoid detection
 USER_AGENTS = [
@@ -17,63 +26,400 @@ USER_AGENTS = [
     # Add more user agents if needed
 ]
 
-# Initialize VADER sentiment analyzer
-analyzer = SentimentIntensityAnalyzer()
+# VADER sentiment analyzer, built on first use (get_analyzer) and handed to the scoring processes
+analyzer = None
+
+# Function to get the VADER analyzer, reading its lexicon the first time
+def get_analyzer():
+    global analyzer
+    if analyzer is None:
+        analyzer = SentimentIntensityAnalyzer()
+    return analyzer
+
+
+# Runs in every scoring process: use the parent's analyzer instead of reading and parsing the lexicon again
+def _init_sentiment_worker(shared_analyzer):
+    global analyzer
+    analyzer = shared_analyzer
+
 
 # Function to get random user agent
 def get_random_user_agent():
     return random.choice(USER_AGENTS)
 
+# Precompiled patterns used by clean_text; the steps run in the same order as the original per-call re.sub chain
+HTML_TAG_PATTERN = re.compile(r'<.*?>')
+WIKI_MARKUP_PATTERN = re.compile(r'\[\[.*?\]\]')
+URL_PATTERN = re.compile(r'http\S+|www\S+')
+REPEATED_PUNCTUATION_PATTERN = re.compile(rf'([{re.escape(string.punctuation)}])\1+')
+# Literal (still escaped) unicode sequences left in scraped text and their replacements
+ESCAPED_UNICODE_PATTERN = re.compile(r'\\u(?:2019|201c|201d|2013|200d)')
+ESCAPED_UNICODE_REPLACEMENTS = {
+    '\\u2019': "'",
+    '\\u201c': '"',
+    '\\u201d': '"',
+    '\\u2013': '-',
+    '\\u200d': '',
+}
+
+
+def _replace_escaped_unicode(match):
+    return ESCAPED_UNICODE_REPLACEMENTS[match.group()]
+
+
 # Function to clean the reviews text
 def clean_text(text):
-    text = re.sub(r'\s+', ' ', text)
-    # Trim leading and trailing whitespaces
-    text = text.strip()
+    # Collapse whitespace runs into single spaces and trim (str.split uses the same whitespace set as \s)
+    text = ' '.join(text.split())
     # Remove HTML tags
-    text = re.sub(r'<.*?>', '', text)
-
-    text = re.sub(r'\[\[.*?\]\]', '', text)
-    text = text.replace('\/', '/')
+    if '<' in text:
+        text = HTML_TAG_PATTERN.sub('', text)
+    if '[[' in text:
+        text = WIKI_MARKUP_PATTERN.sub('', text)
+    if '\\/' in text:
+        text = text.replace('\\/', '/')
 
     # Remove URLs
-    text = re.sub(r'http\S+|www\S+', '', text)
-    text = re.sub(r'\\u2019', "'", text)
-    text = re.sub(r'\\u201c', '"', text)
-    text = re.sub(r'\\u201d', '"', text)
-    text = re.sub(r"\\u2013", "-", text)
-    text = re.sub(r'\\u200d', '', text)
-    pattern = rf'([{re.escape(string.punctuation)}])\1+'
-    text = re.sub(pattern, r'\1', text)
+    if 'http' in text or 'www' in text:
+        text = URL_PATTERN.sub('', text)
+    if '\\u' in text:
+        text = ESCAPED_UNICODE_PATTERN.sub(_replace_escaped_unicode, text)
+    text = REPEATED_PUNCTUATION_PATTERN.sub(r'\1', text)
 
-    text = html.unescape(text)
+    if '&' in text:
+        text = html.unescape(text)
 
     return text
 
-# Updated function to perform sentiment analysis using VADER
-def analyze_sentiment(reviews):
-    if not reviews:
-        return "No Reviews", 0
 
-    total_sentiment = 0
-    cleaned_reviews = [clean_text(review) for review in reviews]  # Clean reviews before analyzing
+# Function to clean many reviews at once; accepts a list/iterable of strings or a pandas Series
+def clean_texts(reviews):
+    if hasattr(reviews, 'map') and hasattr(reviews, 'index'):
+        return reviews.map(clean_text, na_action='ignore')
+    return [clean_text(review) for review in reviews]
+
+# Smallest number of reviews per process-pool task when a batch is split across the workers
+SENTIMENT_CHUNK_SIZE = 64
+# Number of worker processes used for sentiment scoring
+SENTIMENT_WORKERS = int(os.environ.get('REVIEWPAL_SENTIMENT_WORKERS', os.cpu_count() or 1))
+# On-disk score cache; set REVIEWPAL_SENTIMENT_CACHE to an empty string to keep the cache in memory only
+SENTIMENT_CACHE_PATH = os.environ.get('REVIEWPAL_SENTIMENT_CACHE', 'sentiment_cache.sqlite')
+SENTIMENT_CACHE_SIZE = 100000
+# Seconds to wait for another process's write to the on-disk cache (shard workers share one file)
+SENTIMENT_CACHE_BUSY_TIMEOUT = 30
+
+
+# Function to build the cache key of a review from its raw text
+def review_hash(review):
+    return hashlib.blake2b(review.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+# Compound VADER scores keyed by review hash: an in-memory LRU in front of an optional SQLite table
+class SentimentCache:
+    def __init__(self, path=None, max_entries=SENTIMENT_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        if path:
+            # WAL lets shard workers read while another one writes; writers wait for each other up to the timeout
+            self._db = sqlite3.connect(path, timeout=SENTIMENT_CACHE_BUSY_TIMEOUT, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS scores (hash TEXT PRIMARY KEY, compound REAL NOT NULL)")
+            self._db.commit()
+
+    def _remember(self, key, score):
+        self._memory[key] = score
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # Look up many keys at once; returns {key: score} for the keys that are cached
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+
+            if self._db is not None and missing:
+                for start in range(0, len(missing), 500):
+                    batch = missing[start:start + 500]
+                    placeholders = ','.join('?' * len(batch))
+                    rows = self._db.execute(f"SELECT hash, compound FROM scores WHERE hash IN ({placeholders})", batch)
+                    for key, score in rows:
+                        found[key] = score
+                        self._remember(key, score)
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, scores):
+        if not scores:
+            return
+        with self._lock:
+            for key, score in scores.items():
+                self._remember(key, score)
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO scores (hash, compound) VALUES (?, ?)", scores.items())
+                self._db.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'memory_entries': len(self._memory)}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_sentiment_cache = None
+_sentiment_executor = None
+_sentiment_executor_workers = None
+
+
+# Function to get the shared sentiment score cache
+def get_sentiment_cache():
+    global _sentiment_cache
+    if _sentiment_cache is None:
+        _sentiment_cache = SentimentCache(SENTIMENT_CACHE_PATH or None)
+        atexit.register(_sentiment_cache.close)
+    return _sentiment_cache
+
+
+# Function to change the default number of scoring processes (e.g. to a shard worker's share of the CPUs)
+def set_sentiment_workers(workers):
+    global SENTIMENT_WORKERS
+    SENTIMENT_WORKERS = max(1, workers)
+
+
+# Function to get the shared process pool used for scoring (None when scoring in-process)
+def get_sentiment_executor(workers=None):
+    global _sentiment_executor, _sentiment_executor_workers
+    workers = workers or SENTIMENT_WORKERS
+    if workers <= 1:
+        return None
+    if _sentiment_executor is None or _sentiment_executor_workers != workers:
+        if _sentiment_executor is not None:
+            _sentiment_executor.shutdown(wait=False)
+        # Forked workers inherit the analyzer as is; spawned ones unpickle it once
+        _sentiment_executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_sentiment_worker,
+                                                  initargs=(get_analyzer(),))
+        _sentiment_executor_workers = workers
+    return _sentiment_executor
+
+
+def _shutdown_sentiment_executor():
+    if _sentiment_executor is not None:
+        _sentiment_executor.shutdown(wait=False)
+
+
+atexit.register(_shutdown_sentiment_executor)
+
+
+# Function to load the lexicon and start every scoring process up front, so the first scrape does not wait for them
+def warm_up_sentiment(workers=None):
+    get_analyzer()
+    executor = get_sentiment_executor(workers)
+    if executor is not None:
+        list(executor.map(score_review_texts, [["warm up"]] * _sentiment_executor_workers))
+
 
-    print(f"Cleaned Reviews for analysis: {cleaned_reviews}")  # Print cleaned reviews for debugging
+# Function to clean and score a list of reviews (runs inside the worker processes)
+def score_review_texts(reviews):
+    polarity_scores = get_analyzer().polarity_scores
+    return [polarity_scores(clean_text(review))['compound'] for review in reviews]
 
-    for review in cleaned_reviews:
-        sentiment_score = analyzer.polarity_scores(review)['compound']  # Use VADER compound score for each review
-        total_sentiment += sentiment_score
 
-    avg_sentiment = total_sentiment / len(cleaned_reviews)  # Average sentiment score across all reviews
-    print(f"Average Sentiment Score: {avg_sentiment}")  # Debugging output to see the score
+# Split the reviews of many products into the cached scores and the unique texts that still need scoring
+def _plan_scoring(reviews_by_product, cache):
+    keys_by_product = [[review_hash(review) for review in reviews] for reviews in reviews_by_product]
+    texts = {}
+    for reviews, keys in zip(reviews_by_product, keys_by_product):
+        for review, key in zip(reviews, keys):
+            texts.setdefault(key, review)
+    scores = cache.get_many(list(texts))
+    pending = [(key, text) for key, text in texts.items() if key not in scores]
+    return keys_by_product, scores, pending
 
+
+def _chunks(items, workers):
+    size = max(SENTIMENT_CHUNK_SIZE, -(-len(items) // workers))
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+# Function to map an average compound score to the summary sentiment label
+def sentiment_label(avg_sentiment):
     # Determine sentiment based on the average compound score
     if avg_sentiment >= 0.7:
-        return "Highly Positive", avg_sentiment
+        return "Highly Positive"
     elif 0.3 <= avg_sentiment < 0.7:
-        return "Positive", avg_sentiment
+        return "Positive"
     elif -0.3 <= avg_sentiment < 0.3:
-        return "Mixed", avg_sentiment
+        return "Mixed"
     elif -0.7 <= avg_sentiment < -0.3:
-        return "Negative", avg_sentiment
+        return "Negative"
     else:
-        return "Highly Negative", avg_sentiment
+        return "Highly Negative"
+
+
+# Labels a single review can get, in threshold order
+SENTIMENT_LABELS = ("Highly Positive", "Positive", "Mixed", "Negative", "Highly Negative")
+
+
+# Running sentiment of a stream of reviews in O(1) memory: review count, sum of compound scores (for the mean),
+# star-weighted sum (each review weighs as many stars as it got) and the number of reviews per label.
+# Aggregates of different pages, runs or shards merge by adding their fields, and summary() applies the same
+# thresholds as sentiment_label to the mean.
+class SentimentAggregate:
+    __slots__ = ('count', 'total', 'star_total', 'stars', 'labels')
+
+    def __init__(self, count=0, total=0.0, star_total=0.0, stars=0, labels=None):
+        self.count = count
+        self.total = total
+        self.star_total = star_total
+        self.stars = stars
+        self.labels = dict.fromkeys(SENTIMENT_LABELS, 0)
+        self.labels.update(labels or {})
+
+    def add(self, score, stars=None):
+        self.count += 1
+        self.total += score
+        if stars:
+            self.star_total += score * stars
+            self.stars += stars
+        self.labels[sentiment_label(score)] += 1
+        return self
+
+    # Add the scores of many reviews (and their star ratings, when known)
+    def add_many(self, scores, stars=None):
+        for score, review_stars in zip(scores, stars if stars is not None else [None] * len(scores)):
+            self.add(score, review_stars)
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.star_total += other.star_total
+        self.stars += other.stars
+        for label, count in other.labels.items():
+            self.labels[label] = self.labels.get(label, 0) + count
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    # Mean score with every review weighted by its star rating (the plain mean when no review has stars)
+    @property
+    def star_weighted_score(self):
+        return self.star_total / self.stars if self.stars else self.mean
+
+    # (summary sentiment, average score), as analyze_sentiment returns them
+    def summary(self):
+        if not self.count:
+            return "No Reviews", 0
+        return sentiment_label(self.mean), self.mean
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'star_total': self.star_total, 'stars': self.stars,
+                'labels': dict(self.labels)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def _summarize(keys, scores):
+    # Average sentiment score across all reviews
+    return SentimentAggregate().add_many([scores[key] for key in keys]).summary()
+
+
+# Batch API: score the reviews of many products at once, spreading uncached reviews across the process pool.
+# Returns one (label, average score) tuple per product, in the same order.
+def analyze_sentiment_batch(reviews_by_product, workers=None):
+    reviews_by_product = [reviews or [] for reviews in reviews_by_product]
+    cache = get_sentiment_cache()
+    keys_by_product, scores, pending = _plan_scoring(reviews_by_product, cache)
+
+    if pending:
+        pending_keys = [key for key, _ in pending]
+        pending_texts = [text for _, text in pending]
+        workers = workers or SENTIMENT_WORKERS
+        executor = get_sentiment_executor(workers)
+        if executor is None or len(pending_texts) <= SENTIMENT_CHUNK_SIZE:
+            new_scores = score_review_texts(pending_texts)
+        else:
+            new_scores = [score for chunk_scores in executor.map(score_review_texts, _chunks(pending_texts, workers))
+                          for score in chunk_scores]
+        fresh = dict(zip(pending_keys, new_scores))
+        cache.put_many(fresh)
+        scores.update(fresh)
+
+    return [_summarize(keys, scores) for keys in keys_by_product]
+
+
+# Awaitable scoring of one batch of reviews (e.g. a page as soon as it was extracted); returns their compound
+# scores in order, to be added to a SentimentAggregate
+async def score_reviews_async(reviews, workers=None):
+    reviews = list(reviews)
+    cache = get_sentiment_cache()
+    (keys,), scores, pending = _plan_scoring([reviews], cache)
+    if pending:
+        await _score_pending_async(pending, scores, cache, workers)
+    return [scores[key] for key in keys]
+
+
+async def _score_pending_async(pending, scores, cache, workers=None):
+    loop = asyncio.get_event_loop()
+    pending_keys = [key for key, _ in pending]
+    pending_texts = [text for _, text in pending]
+    workers = workers or SENTIMENT_WORKERS
+    executor = get_sentiment_executor(workers)
+    # Even a small batch goes to the pool: in a thread, VADER would hold the GIL the event loop needs
+    if executor is None:
+        new_scores = await loop.run_in_executor(None, score_review_texts, pending_texts)
+    else:
+        chunk_results = await asyncio.gather(*(loop.run_in_executor(executor, score_review_texts, chunk)
+                                               for chunk in _chunks(pending_texts, workers)))
+        new_scores = [score for chunk_scores in chunk_results for score in chunk_scores]
+    fresh = dict(zip(pending_keys, new_scores))
+    cache.put_many(fresh)
+    scores.update(fresh)
+
+
+# Awaitable batch API: scoring runs in the process pool (or a thread when scoring in-process), never on the event loop
+async def analyze_sentiment_batch_async(reviews_by_product, workers=None):
+    reviews_by_product = [reviews or [] for reviews in reviews_by_product]
+    cache = get_sentiment_cache()
+    keys_by_product, scores, pending = _plan_scoring(reviews_by_product, cache)
+
+    if pending:
+        await _score_pending_async(pending, scores, cache, workers)
+
+    return [_summarize(keys, scores) for keys in keys_by_product]
+
+
+# Awaitable version of analyze_sentiment for a single product
+async def analyze_sentiment_async(reviews, workers=None):
+    results = await analyze_sentiment_batch_async([reviews], workers=workers)
+    return results[0]
+
+
+# Updated function to perform sentiment analysis using VADER (cached, scored in-process)
+def analyze_sentiment(reviews):
+    if not reviews:
+        return "No Reviews", 0
+
+    sentiment, avg_sentiment = analyze_sentiment_batch([reviews], workers=1)[0]
+    logger.debug("Average Sentiment Score: %s", avg_sentiment)
+    return sentiment, avg_sentiment